@@ -27,12 +27,6 @@ async def check_admins():
         
         if not settings:
             print("⚠️  Таблица settings пуста!")
-            print()
-            print("Создаем запись для admin_telegram_ids...")
-            await conn.execute(
-                "INSERT INTO settings (key, value) VALUES ('admin_telegram_ids', '[]')"
-            )
-            print("✅ Запись создана с пустым массивом админов")
         else:
             print(f"✅ Найдено {len(settings)} записей в settings:")
             for setting in settings:
@@ -42,30 +36,21 @@ async def check_admins():
         
         # Получаем список админов
         print("👥 Список админов:")
-        admin_ids_json = await conn.fetchval(
-            "SELECT value FROM settings WHERE key = 'admin_telegram_ids'"
+        admin_ids = await conn.fetch(
+            "SELECT telegram_id FROM admins ORDER BY position"
         )
         
-        if admin_ids_json:
-            import json
-            try:
-                admin_ids = json.loads(admin_ids_json)
-                if admin_ids:
-                    print(f"✅ Найдено {len(admin_ids)} админов:")
-                    for i, admin_id in enumerate(admin_ids, 1):
-                        print(f"   {i}. Telegram ID: {admin_id}")
-                else:
-                    print("⚠️  Список админов пуст!")
-                    print()
-                    print("❗ Чтобы добавить себя как админа:")
-                    print("   1. Узнайте свой Telegram ID (напишите @userinfobot)")
-                    print("   2. Запустите: python init_admin.py")
-                    print("   3. Или добавьте вручную в базу данных")
-            except json.JSONDecodeError as e:
-                print(f"❌ Ошибка парсинга JSON: {e}")
-                print(f"   Значение: {admin_ids_json}")
+        if admin_ids:
+            print(f"✅ Найдено {len(admin_ids)} админов:")
+            for i, admin in enumerate(admin_ids, 1):
+                print(f"   {i}. Telegram ID: {admin['telegram_id']}")
         else:
-            print("⚠️  Запись admin_telegram_ids не найдена!")
+            print("⚠️  Список админов пуст!")
+            print()
+            print("❗ Чтобы добавить себя как админа:")
+            print("   1. Узнайте свой Telegram ID (напишите @userinfobot)")
+            print("   2. Запустите: python init_admin.py")
+            print("   3. Или добавьте вручную в базу данных")
         
         print()
         
@@ -1,6 +1,9 @@
+import hashlib
 import os
 from dotenv import load_dotenv
-from imgbb_uploader import ImgBBUploader, imgbb_uploader
+from typing import Optional
+from imgbb_uploader import ImgBBUploader
+from storage import ImageStorage, LocalStorage, S3Storage
 
 # Загружаем переменные окружения
 load_dotenv()
@@ -9,15 +12,159 @@ BOT_TOKEN = os.getenv("BOT_TOKEN")
 DATABASE_URL = os.getenv("DB")
 IMGBB_API_KEY = os.getenv("IMGBB_API_KEY")
 
+# Хранилище изображений: imgbb, local или s3
+IMAGE_STORAGE = os.getenv("IMAGE_STORAGE", "imgbb").lower()
+LOCAL_STORAGE_DIR = os.getenv("LOCAL_STORAGE_DIR", "images")
+LOCAL_STORAGE_BASE_URL = os.getenv("LOCAL_STORAGE_BASE_URL")
+S3_ENDPOINT = os.getenv("S3_ENDPOINT")
+S3_BUCKET = os.getenv("S3_BUCKET")
+S3_ACCESS_KEY = os.getenv("S3_ACCESS_KEY")
+S3_SECRET_KEY = os.getenv("S3_SECRET_KEY")
+S3_REGION = os.getenv("S3_REGION", "us-east-1")
+S3_PUBLIC_BASE_URL = os.getenv("S3_PUBLIC_BASE_URL")
+
+# HTTP-сервер бота (webhook, файлы локального хранилища, метрики)
+HTTP_HOST = os.getenv("HTTP_HOST", "0.0.0.0")
+HTTP_PORT = int(os.getenv("PORT", "8080"))
+# Режим webhook: если задан публичный адрес бота, обновления принимаются HTTP-сервером,
+# иначе бот работает через long polling
+WEBHOOK_URL = os.getenv("WEBHOOK_URL")
+WEBHOOK_PATH = os.getenv("WEBHOOK_PATH", "/webhook")
+# Секрет для заголовка X-Telegram-Bot-Api-Secret-Token (по умолчанию выводится из токена бота)
+WEBHOOK_SECRET = os.getenv("WEBHOOK_SECRET") or (
+    hashlib.sha256(BOT_TOKEN.encode()).hexdigest() if BOT_TOKEN else None
+)
+WEBHOOK_MAX_CONNECTIONS = int(os.getenv("WEBHOOK_MAX_CONNECTIONS", "40"))
+# Отдавать счетчики бота на /metrics (HTTP-сервер запускается и без локального хранилища)
+METRICS_ENABLED = os.getenv("METRICS_ENABLED", "false").lower() in ("1", "true", "yes")
+
+# Кэш прав администраторов (секунды жизни и размер кэша не-админов)
+ADMIN_CACHE_TTL = int(os.getenv("ADMIN_CACHE_TTL", "300"))
+NON_ADMIN_CACHE_SIZE = int(os.getenv("NON_ADMIN_CACHE_SIZE", "10000"))
+
+# Время жизни снимка настроек (сек): страховка, если уведомления об изменениях не дошли
+SETTINGS_CACHE_TTL = float(os.getenv("SETTINGS_CACHE_TTL", "300"))
+
+# Ограничение частоты запросов не-админов: на пользователя и суммарно (запросов/сек и запас)
+THROTTLE_RATE = float(os.getenv("THROTTLE_RATE", "1"))
+THROTTLE_BURST = float(os.getenv("THROTTLE_BURST", "5"))
+THROTTLE_GLOBAL_RATE = float(os.getenv("THROTTLE_GLOBAL_RATE", "20"))
+THROTTLE_GLOBAL_BURST = float(os.getenv("THROTTLE_GLOBAL_BURST", "50"))
+THROTTLE_MAX_USERS = int(os.getenv("THROTTLE_MAX_USERS", "10000"))
+
+# Исходящие запросы к Telegram: общий лимит и лимит на чат (запросов/сек и запас), повторы после RetryAfter
+TELEGRAM_GLOBAL_RATE = float(os.getenv("TELEGRAM_GLOBAL_RATE", "25"))
+TELEGRAM_GLOBAL_BURST = float(os.getenv("TELEGRAM_GLOBAL_BURST", "30"))
+TELEGRAM_CHAT_RATE = float(os.getenv("TELEGRAM_CHAT_RATE", "1"))
+TELEGRAM_CHAT_BURST = float(os.getenv("TELEGRAM_CHAT_BURST", "3"))
+TELEGRAM_MAX_RETRIES = int(os.getenv("TELEGRAM_MAX_RETRIES", "3"))
+TELEGRAM_MAX_CHATS = int(os.getenv("TELEGRAM_MAX_CHATS", "10000"))
+
+# Параметры HTTP-клиента загрузки изображений (для любого хранилища)
+IMGBB_MAX_CONCURRENT_UPLOADS = int(os.getenv("IMGBB_MAX_CONCURRENT_UPLOADS", "4"))
+IMGBB_CONNECT_TIMEOUT = float(os.getenv("IMGBB_CONNECT_TIMEOUT", "10"))
+IMGBB_TOTAL_TIMEOUT = float(os.getenv("IMGBB_TOTAL_TIMEOUT", "60"))
+IMGBB_CHUNK_SIZE = int(os.getenv("IMGBB_CHUNK_SIZE", str(64 * 1024)))
+
+# Обработка изображений перед загрузкой (IMAGE_MAX_SIDE=0 отключает обработку)
+IMAGE_MAX_SIDE = int(os.getenv("IMAGE_MAX_SIDE", "1280"))
+IMAGE_QUALITY = int(os.getenv("IMAGE_QUALITY", "82"))
+IMAGE_FORMAT = os.getenv("IMAGE_FORMAT", "JPEG")
+THUMBNAIL_SIDE = int(os.getenv("THUMBNAIL_SIDE", "320"))
+IMAGE_PREPROCESS_WORKERS = int(os.getenv("IMAGE_PREPROCESS_WORKERS", "2"))
+
+# Фоновая очередь задач (загрузка изображений)
+JOB_WORKERS = int(os.getenv("JOB_WORKERS", "2"))
+JOB_MAX_ATTEMPTS = int(os.getenv("JOB_MAX_ATTEMPTS", "5"))
+JOB_RETRY_DELAY = float(os.getenv("JOB_RETRY_DELAY", "5"))
+JOB_LEASE_SECONDS = float(os.getenv("JOB_LEASE_SECONDS", "300"))
+
+# Очередь входящих обновлений: число воркеров в процессе (по умолчанию 0 - обработка сразу
+# при получении, без очереди), попытки, задержка повтора, аренда обновления и период опроса (сек),
+# сколько хранить не обработанные из-за ошибки обновления и период их очистки (сек)
+UPDATE_WORKERS = int(os.getenv("UPDATE_WORKERS", "0"))
+UPDATE_MAX_ATTEMPTS = int(os.getenv("UPDATE_MAX_ATTEMPTS", "3"))
+UPDATE_RETRY_DELAY = float(os.getenv("UPDATE_RETRY_DELAY", "2"))
+UPDATE_LEASE_SECONDS = float(os.getenv("UPDATE_LEASE_SECONDS", "120"))
+UPDATE_POLL_INTERVAL = float(os.getenv("UPDATE_POLL_INTERVAL", "1"))
+UPDATE_FAILED_RETENTION = float(os.getenv("UPDATE_FAILED_RETENTION", str(7 * 24 * 60 * 60)))
+UPDATE_CLEANUP_INTERVAL = float(os.getenv("UPDATE_CLEANUP_INTERVAL", "3600"))
+
+# Роль процесса: all - все в одном процессе, ingest - прием обновлений (HTTP-сервер/polling),
+# worker - обработка обновлений своей части чатов (WORKER_INDEX из WORKER_COUNT).
+# Роли ingest и worker назначает supervisor.py
+BOT_ROLE = os.getenv("BOT_ROLE", "all").lower()
+WORKER_INDEX = int(os.getenv("WORKER_INDEX", "0"))
+WORKER_COUNT = int(os.getenv("WORKER_COUNT", "1"))
+# Супервизор: число процессов-обработчиков, период отчета о состоянии и таймаут зависания (сек)
+SUPERVISOR_WORKERS = int(os.getenv("SUPERVISOR_WORKERS", str(os.cpu_count() or 1)))
+HEALTH_INTERVAL = float(os.getenv("HEALTH_INTERVAL", "10"))
+HEALTH_TIMEOUT = float(os.getenv("HEALTH_TIMEOUT", "60"))
+
+# Состояния диалогов (FSM) в PostgreSQL: время жизни брошенной сессии в БД, размер кэша,
+# сколько доверять записи кэша процесса (на случай пропущенного NOTIFY), период очистки (сек)
+FSM_TTL = float(os.getenv("FSM_TTL", str(24 * 60 * 60)))
+FSM_CACHE_SIZE = int(os.getenv("FSM_CACHE_SIZE", "1000"))
+FSM_CACHE_TTL = float(os.getenv("FSM_CACHE_TTL", "60"))
+FSM_CLEANUP_INTERVAL = float(os.getenv("FSM_CLEANUP_INTERVAL", "3600"))
+
+# Предзагрузка фото проектов: служебный чат (например, закрытый канал, где бот - админ),
+# в который фото отправляются ради file_id, и сколько не повторять неудачную попытку (сек)
+PREFETCH_CHAT_ID = int(os.getenv("PREFETCH_CHAT_ID")) if os.getenv("PREFETCH_CHAT_ID") else None
+PREFETCH_TTL = float(os.getenv("PREFETCH_TTL", "600"))
+
+# Inline-режим: сколько Telegram может кэшировать ответ на запрос (сек)
+INLINE_CACHE_TIME = int(os.getenv("INLINE_CACHE_TIME", "30"))
+
+# Размер LRU-кэша загруженных изображений в памяти
+IMAGE_CACHE_SIZE = int(os.getenv("IMAGE_CACHE_SIZE", "1024"))
+
 if not BOT_TOKEN:
     raise ValueError("BOT_TOKEN не найден в .env файле")
 
 if not DATABASE_URL:
     raise ValueError("DB не найден в .env файле")
 
-# Инициализируем imgbb uploader если есть API ключ
-if IMGBB_API_KEY:
-    imgbb_uploader = ImgBBUploader(IMGBB_API_KEY)
-else:
-    print("⚠️ IMGBB_API_KEY не найден в .env файле. Загрузка изображений будет недоступна.")
+if BOT_ROLE not in ("all", "ingest", "worker"):
+    raise ValueError(f"Неизвестная роль процесса BOT_ROLE={BOT_ROLE}")
+
+if BOT_ROLE != "all" and not UPDATE_WORKERS:
+    raise ValueError("Роли ingest и worker работают только с очередью обновлений (UPDATE_WORKERS > 0)")
+
+_storage_options = dict(
+    max_concurrent_uploads=IMGBB_MAX_CONCURRENT_UPLOADS,
+    connect_timeout=IMGBB_CONNECT_TIMEOUT,
+    total_timeout=IMGBB_TOTAL_TIMEOUT,
+    chunk_size=IMGBB_CHUNK_SIZE,
+    max_side=IMAGE_MAX_SIDE,
+    quality=IMAGE_QUALITY,
+    image_format=IMAGE_FORMAT,
+    thumbnail_side=THUMBNAIL_SIDE,
+    preprocess_workers=IMAGE_PREPROCESS_WORKERS
+)
+
+# Хранилище изображений (None - загрузка изображений недоступна)
+image_storage: Optional[ImageStorage] = None
 
+if IMAGE_STORAGE == "imgbb":
+    if IMGBB_API_KEY:
+        image_storage = ImgBBUploader(IMGBB_API_KEY, **_storage_options)
+    else:
+        print("⚠️ IMGBB_API_KEY не найден в .env файле. Загрузка изображений будет недоступна.")
+elif IMAGE_STORAGE == "local":
+    if not LOCAL_STORAGE_BASE_URL:
+        raise ValueError("LOCAL_STORAGE_BASE_URL не найден в .env файле (нужен для IMAGE_STORAGE=local)")
+    image_storage = LocalStorage(LOCAL_STORAGE_DIR, LOCAL_STORAGE_BASE_URL, **_storage_options)
+elif IMAGE_STORAGE == "s3":
+    missing = [name for name, value in (
+        ("S3_ENDPOINT", S3_ENDPOINT), ("S3_BUCKET", S3_BUCKET),
+        ("S3_ACCESS_KEY", S3_ACCESS_KEY), ("S3_SECRET_KEY", S3_SECRET_KEY)
+    ) if not value]
+    if missing:
+        raise ValueError(f"{', '.join(missing)} не найдены в .env файле (нужны для IMAGE_STORAGE=s3)")
+    image_storage = S3Storage(
+        S3_ENDPOINT, S3_BUCKET, S3_ACCESS_KEY, S3_SECRET_KEY,
+        region=S3_REGION, public_base_url=S3_PUBLIC_BASE_URL, **_storage_options
+    )
+elif IMAGE_STORAGE != "none":
+    raise ValueError(f"Неизвестное хранилище изображений IMAGE_STORAGE={IMAGE_STORAGE} (imgbb, local, s3 или none)")
@@ -1,177 +1,850 @@
+import asyncio
+import json
+import time
 import asyncpg
 import logging
-from typing import Optional, List, Dict, Any
-from config import DATABASE_URL
+from collections import OrderedDict
+from contextlib import asynccontextmanager
+from contextvars import ContextVar
+from typing import Optional, List, Dict, Any, FrozenSet, Tuple
+from config import DATABASE_URL, ADMIN_CACHE_TTL, NON_ADMIN_CACHE_SIZE, SETTINGS_CACHE_TTL
 
 logger = logging.getLogger(__name__)
 
+# Каналы LISTEN/NOTIFY для синхронизации кэшей между экземплярами бота
+ADMIN_IDS_CHANNEL = "admin_ids_changed"
+PHOTO_FILE_IDS_CHANNEL = "photo_file_ids_changed"
+IMAGE_CACHE_CHANNEL = "image_cache_changed"
+FSM_CHANNEL = "fsm_changed"
+UPDATES_CHANNEL = "updates_queued"
+SETTINGS_CHANNEL = "settings_changed"
+PROJECTS_CHANNEL = "projects_changed"
+PANELS_CHANNEL = "panels_changed"
+
+PROJECT_COLUMNS = ("id, title, description, image_url, thumbnail_url, image_pending, "
+                   "project_url, created_at, updated_at")
+
+class Settings:
+    """Снимок таблицы settings: неизменяемый, при изменениях заменяется целиком"""
+    __slots__ = ("_values", "menu_photo")
+    
+    def __init__(self, values: Dict[str, Optional[str]]):
+        self._values = dict(values)
+        # Известные настройки - типизированные поля
+        self.menu_photo: Optional[str] = self._values.get('menu_photo') or None
+    
+    def get(self, key: str, default: Optional[str] = None) -> Optional[str]:
+        value = self._values.get(key)
+        return default if value is None else value
+    
+    def get_int(self, key: str, default: int = 0) -> int:
+        try:
+            return int(self._values[key])
+        except (KeyError, TypeError, ValueError):
+            return default
+    
+    def get_bool(self, key: str, default: bool = False) -> bool:
+        value = self._values.get(key)
+        if value is None:
+            return default
+        return value.strip().lower() in ("1", "true", "yes", "on")
+    
+    def get_json(self, key: str, default: Any = None) -> Any:
+        try:
+            return json.loads(self._values[key])
+        except (KeyError, TypeError, ValueError):
+            return default
+
+# Соединение текущей единицы работы (см. Database.acquire / Database.transaction)
+_current_conn: ContextVar[Optional[asyncpg.Connection]] = ContextVar("db_connection", default=None)
+
 class Database:
     def __init__(self):
         self.pool: Optional[asyncpg.Pool] = None
+        # Отдельное соединение для LISTEN (соединения пула сбрасывают подписки)
+        self._listen_conn: Optional[asyncpg.Connection] = None
+        self._closing = False
+        self._notify_handlers = {
+            ADMIN_IDS_CHANNEL: self._on_admin_ids_changed,
+            SETTINGS_CHANNEL: self._on_settings_changed,
+        }
+        # Кэш администраторов (поколение растет при каждом сбросе кэша)
+        self._admin_ids: Optional[FrozenSet[str]] = None
+        self._admin_ids_expires_at = 0.0
+        self._admin_ids_generation = 0
+        self._admin_ids_lock = asyncio.Lock()
+        # Ограниченный кэш пользователей, которые точно не админы
+        self._non_admin_cache: "OrderedDict[str, float]" = OrderedDict()
+        # Снимок настроек (поколение растет при каждом уведомлении об изменении)
+        self._settings = Settings({})
+        self._settings_expires_at = 0.0
+        self._settings_generation = 0
+        self._settings_lock = asyncio.Lock()
     
     async def connect(self):
         """Подключение к базе данных"""
+        self._closing = False
         try:
             self.pool = await asyncpg.create_pool(DATABASE_URL)
             logger.info("Подключение к базе данных установлено")
         except Exception as e:
             logger.error(f"Ошибка подключения к базе данных: {e}")
             raise
+        await self._start_listening()
+        await self.get_settings()
     
     async def disconnect(self):
         """Отключение от базы данных"""
+        self._closing = True
+        if self._listen_conn and not self._listen_conn.is_closed():
+            await self._listen_conn.close()
+            self._listen_conn = None
         if self.pool:
             await self.pool.close()
             logger.info("Подключение к базе данных закрыто")
     
+    @asynccontextmanager
+    async def acquire(self):
+        """Соединение текущей единицы работы или новое соединение из пула.
+        
+        Пока блок открыт, все вложенные вызовы методов Database в этой задаче
+        используют то же соединение, а не берут второе из пула.
+        """
+        conn = _current_conn.get()
+        if conn is not None:
+            yield conn
+            return
+        async with self.pool.acquire() as conn:
+            token = _current_conn.set(conn)
+            try:
+                yield conn
+            finally:
+                _current_conn.reset(token)
+    
+    @asynccontextmanager
+    async def transaction(self):
+        """Единица работы: одно соединение и одна транзакция для всех методов Database внутри блока.
+        
+        Не запускайте внутри блока фоновые задачи, работающие с БД: они унаследуют
+        соединение, а asyncpg не допускает параллельных запросов на одном соединении.
+        """
+        async with self.acquire() as conn:
+            async with conn.transaction():
+                yield conn
+    
+    def add_notify_handler(self, channel: str, handler):
+        """Подписать обработчик handler(conn, pid, channel, payload) на канал NOTIFY.
+        
+        При потере соединения LISTEN обработчик вызывается с payload=None:
+        это значит, что уведомления могли быть пропущены и кэш нужно сбросить целиком.
+        """
+        self._notify_handlers[channel] = handler
+        if self._listen_conn is not None and not self._listen_conn.is_closed():
+            asyncio.get_running_loop().create_task(self._listen_conn.add_listener(channel, handler))
+    
+    async def _start_listening(self):
+        """Подписка на уведомления об изменениях от других экземпляров бота"""
+        try:
+            self._listen_conn = await asyncpg.connect(DATABASE_URL)
+            for channel, handler in self._notify_handlers.items():
+                await self._listen_conn.add_listener(channel, handler)
+            self._listen_conn.add_termination_listener(self._on_listen_conn_lost)
+        except Exception as e:
+            # Без LISTEN кэши остаются корректными за счет TTL
+            logger.warning(f"Не удалось подписаться на уведомления БД: {e}")
+            self._listen_conn = None
+    
+    def _on_listen_conn_lost(self, conn):
+        """Соединение LISTEN потеряно: сбрасываем кэши и переподключаемся"""
+        logger.warning("Соединение для уведомлений БД потеряно, переподключение...")
+        for channel, handler in self._notify_handlers.items():
+            handler(None, None, channel, None)
+        self._listen_conn = None
+        if not self._closing:
+            asyncio.get_running_loop().create_task(self._start_listening())
+    
+    # ================================
+    # НАСТРОЙКИ
+    # ================================
+    
+    def _on_settings_changed(self, conn, pid, channel, payload):
+        """Обработчик NOTIFY об изменении настроек: перечитываем снимок в фоне"""
+        self._settings_generation += 1
+        self._settings_expires_at = 0.0
+        if not self._closing:
+            asyncio.get_running_loop().create_task(self.get_settings())
+    
+    async def get_settings(self) -> Settings:
+        """Снимок настроек из памяти, при необходимости перечитанный из БД"""
+        if time.monotonic() < self._settings_expires_at:
+            return self._settings
+        
+        async with self._settings_lock:
+            if time.monotonic() < self._settings_expires_at:
+                return self._settings
+            generation = self._settings_generation
+            try:
+                async with self.acquire() as conn:
+                    rows = await conn.fetch("SELECT key, value FROM settings")
+            except Exception as e:
+                # Ошибку не кэшируем, отдаем прежний снимок
+                logger.error(f"Ошибка получения настроек: {e}")
+                return self._settings
+            
+            self._settings = Settings({row['key']: row['value'] for row in rows})
+            # Если во время запроса пришло уведомление, снимок мог устареть - не продлеваем его
+            if generation == self._settings_generation:
+                self._settings_expires_at = time.monotonic() + SETTINGS_CACHE_TTL
+            return self._settings
+    
+    async def set_setting(self, key: str, value: Optional[str]):
+        """Записать настройку (триггер уведомит все экземпляры бота)"""
+        async with self.acquire() as conn:
+            await conn.execute("""
+                INSERT INTO settings (key, value) VALUES ($1, $2)
+                ON CONFLICT (key) DO UPDATE SET value = EXCLUDED.value
+            """, key, value)
+        self._settings_generation += 1
+        self._settings_expires_at = 0.0
+    
+    # ================================
+    # КЭШ АДМИНИСТРАТОРОВ
+    # ================================
+    
+    def _on_admin_ids_changed(self, conn, pid, channel, payload):
+        """Обработчик NOTIFY об изменении списка админов"""
+        self._invalidate_admin_cache()
+    
+    def _invalidate_admin_cache(self):
+        """Сбросить кэш администраторов"""
+        self._admin_ids_generation += 1
+        self._admin_ids = None
+        self._admin_ids_expires_at = 0.0
+        self._non_admin_cache.clear()
+    
+    def _remember_non_admin(self, telegram_id: str):
+        """Запомнить пользователя как не-админа (LRU с ограничением размера)"""
+        self._non_admin_cache[telegram_id] = time.monotonic() + ADMIN_CACHE_TTL
+        self._non_admin_cache.move_to_end(telegram_id)
+        while len(self._non_admin_cache) > NON_ADMIN_CACHE_SIZE:
+            self._non_admin_cache.popitem(last=False)
+    
+    async def _get_admin_ids_cached(self) -> Optional[FrozenSet[str]]:
+        """Получить множество ID админов из кэша, при необходимости обновив его"""
+        if self._admin_ids is not None and time.monotonic() < self._admin_ids_expires_at:
+            return self._admin_ids
+        
+        async with self._admin_ids_lock:
+            # Другой обработчик мог уже обновить кэш, пока мы ждали блокировку
+            if self._admin_ids is not None and time.monotonic() < self._admin_ids_expires_at:
+                return self._admin_ids
+            generation = self._admin_ids_generation
+            try:
+                async with self.acquire() as conn:
+                    rows = await conn.fetch("SELECT telegram_id FROM admins")
+            except Exception as e:
+                # Не кэшируем ошибку, иначе все админы потеряют доступ до истечения TTL
+                logger.error(f"Ошибка получения списка админов: {e}")
+                return None
+            
+            admin_ids = frozenset(row['telegram_id'] for row in rows)
+            # Если во время запроса кэш сбросили, результат мог устареть - не сохраняем его
+            if generation == self._admin_ids_generation:
+                self._admin_ids = admin_ids
+                self._admin_ids_expires_at = time.monotonic() + ADMIN_CACHE_TTL
+                self._non_admin_cache.clear()
+            return admin_ids
+    
+    # ================================
+    # АДМИНИСТРАТОРЫ
+    # ================================
+    # Изменения таблицы admins рассылаются триггером через NOTIFY admin_ids_changed
+    # (см. migration_admins_table.sql), локальный кэш сбрасываем сразу после записи.
+    
     async def get_admin_telegram_ids(self) -> List[str]:
         """Получить список Telegram ID администраторов из БД"""
-        import json
         try:
-            async with self.pool.acquire() as conn:
-                result = await conn.fetchval(
-                    "SELECT value FROM settings WHERE key = 'admin_telegram_ids'"
+            async with self.acquire() as conn:
+                rows = await conn.fetch(
+                    "SELECT telegram_id FROM admins ORDER BY position"
                 )
-                if result:
-                    try:
-                        parsed = json.loads(result)
-                        # Убеждаемся что это список
-                        if isinstance(parsed, list):
-                            return [str(id) for id in parsed]  # Конвертируем все в строки
-                        else:
-                            logger.warning(f"admin_telegram_ids не является списком: {type(parsed)}")
-                            return []
-                    except (json.JSONDecodeError, TypeError) as e:
-                        logger.error(f"Ошибка парсинга admin_telegram_ids: {e}")
-                        return []
-                return []
+                return [row['telegram_id'] for row in rows]
         except Exception as e:
-            logger.error(f"Ошибка получения admin_telegram_ids: {e}")
+            logger.error(f"Ошибка получения списка админов: {e}")
             return []
     
     async def update_admin_telegram_ids(self, admin_ids: List[str]) -> bool:
-        """Обновить список Telegram ID администраторов в БД"""
-        import json
-        try:
-            async with self.pool.acquire() as conn:
-                await conn.execute(
-                    """
-                    INSERT INTO settings (key, value) 
-                    VALUES ('admin_telegram_ids', $1)
-                    ON CONFLICT (key) 
-                    DO UPDATE SET value = $1
-                    """,
-                    json.dumps(admin_ids)
-                )
-                return True
+        """Заменить весь список Telegram ID администраторов в БД"""
+        try:
+            async with self.transaction() as conn:
+                await conn.execute("DELETE FROM admins")
+                await conn.execute("""
+                    INSERT INTO admins (telegram_id)
+                    SELECT telegram_id FROM unnest($1::text[]) WITH ORDINALITY AS t(telegram_id, ord)
+                    ORDER BY ord
+                    ON CONFLICT (telegram_id) DO NOTHING
+                """, [str(id) for id in admin_ids])
+            self._invalidate_admin_cache()
+            return True
         except Exception as e:
             logger.error(f"Ошибка обновления админов: {e}")
             return False
     
     async def add_admin_telegram_id(self, telegram_id: str) -> bool:
         """Добавить новый Telegram ID администратора"""
-        current_ids = await self.get_admin_telegram_ids()
-        if telegram_id not in current_ids:
-            current_ids.append(telegram_id)
-            return await self.update_admin_telegram_ids(current_ids)
-        return True
+        try:
+            async with self.acquire() as conn:
+                await conn.execute("""
+                    INSERT INTO admins (telegram_id) VALUES ($1)
+                    ON CONFLICT (telegram_id) DO NOTHING
+                """, str(telegram_id))
+            self._invalidate_admin_cache()
+            return True
+        except Exception as e:
+            logger.error(f"Ошибка добавления админа: {e}")
+            return False
     
     async def remove_admin_telegram_id(self, telegram_id: str) -> bool:
         """Удалить Telegram ID администратора"""
-        current_ids = await self.get_admin_telegram_ids()
-        if telegram_id in current_ids:
-            current_ids.remove(telegram_id)
-            return await self.update_admin_telegram_ids(current_ids)
-        return True
+        try:
+            async with self.acquire() as conn:
+                await conn.execute("DELETE FROM admins WHERE telegram_id = $1", str(telegram_id))
+            self._invalidate_admin_cache()
+            return True
+        except Exception as e:
+            logger.error(f"Ошибка удаления админа: {e}")
+            return False
     
     async def update_admin_telegram_id(self, index: int, new_telegram_id: str) -> bool:
         """Обновить конкретный Telegram ID администратора по индексу"""
-        current_ids = await self.get_admin_telegram_ids()
-        if 0 <= index < len(current_ids):
-            current_ids[index] = new_telegram_id
-            return await self.update_admin_telegram_ids(current_ids)
-        return False
+        if index < 0:
+            return False
+        try:
+            async with self.acquire() as conn:
+                # Позиция в списке сохраняется, меняется только сам ID
+                result = await conn.execute("""
+                    UPDATE admins SET telegram_id = $2
+                    WHERE position = (
+                        SELECT position FROM admins ORDER BY position OFFSET $1 LIMIT 1
+                    )
+                """, index, str(new_telegram_id))
+            self._invalidate_admin_cache()
+            return result.split()[-1] == '1'
+        except asyncpg.UniqueViolationError:
+            logger.warning(f"Админ {new_telegram_id} уже существует")
+            return False
+        except Exception as e:
+            logger.error(f"Ошибка обновления админа: {e}")
+            return False
     
     async def is_admin(self, telegram_id: int) -> bool:
-        """Проверить, является ли пользователь админом"""
-        admin_ids = await self.get_admin_telegram_ids()
-        return str(telegram_id) in admin_ids
+        """Проверить, является ли пользователь админом (из кэша)"""
+        user_id = str(telegram_id)
+        
+        # Известные не-админы не вызывают обновления кэша
+        expires_at = self._non_admin_cache.get(user_id)
+        if expires_at is not None:
+            if time.monotonic() < expires_at:
+                return False
+            del self._non_admin_cache[user_id]
+        
+        generation = self._admin_ids_generation
+        admin_ids = await self._get_admin_ids_cached()
+        if admin_ids is None:
+            return False
+        if user_id in admin_ids:
+            return True
+        if generation == self._admin_ids_generation:
+            self._remember_non_admin(user_id)
+        return False
     
     async def get_menu_photo(self) -> Optional[str]:
-        """Получить ссылку на фото меню из настроек"""
-        async with self.pool.acquire() as conn:
-            result = await conn.fetch(
-                "SELECT value FROM settings WHERE key = 'menu_photo'"
-            )
-            if result and result[0]['value']:
-                return result[0]['value']
-            return None
+        """Получить ссылку на фото меню из настроек (из памяти)"""
+        return (await self.get_settings()).menu_photo
     
     async def get_projects(self) -> List[Dict[str, Any]]:
         """Получить все проекты"""
-        async with self.pool.acquire() as conn:
-            result = await conn.fetch("""
-                SELECT id, title, description, image_url, project_url, created_at, updated_at 
+        async with self.acquire() as conn:
+            result = await conn.fetch(f"""
+                SELECT {PROJECT_COLUMNS}
                 FROM projects 
-                ORDER BY created_at DESC
+                ORDER BY created_at DESC, id DESC
             """)
             return [dict(row) for row in result]
     
+    async def get_projects_by_ids(self, project_ids: List[int]) -> List[Dict[str, Any]]:
+        """Получить проекты по списку ID одним запросом (отсутствующие пропускаются)"""
+        async with self.acquire() as conn:
+            result = await conn.fetch(f"""
+                SELECT {PROJECT_COLUMNS}
+                FROM projects 
+                WHERE id = ANY($1::int[])
+            """, list(project_ids))
+            return [dict(row) for row in result]
+    
+    async def search_projects(self, query: str, limit: int, cursor: Optional[Tuple[float, int]] = None,
+                              backward: bool = False) -> Tuple[List[Dict[str, Any]], Optional[int]]:
+        """Полнотекстовый поиск проектов по названию и описанию (русский и английский).
+        
+        Возвращает страницу найденных проектов по убыванию релевантности и общее число
+        найденных. cursor - (rank, id) граничного проекта: при backward=False возвращаются
+        проекты после него, при backward=True - перед ним. Общее число считается только
+        для первой страницы (без cursor), для остальных возвращается None: подсчет читает
+        все совпадения, а следующие страницы берут по курсору только limit строк.
+        """
+        # Индекс GIN по search_vector (см. migration_projects_search.sql)
+        total_column = ", count(*) OVER () AS total" if cursor is None else ""
+        found = f"""
+            SELECT id, title, created_at, rank{total_column}
+            FROM (
+                SELECT p.id, p.title, p.created_at, ts_rank_cd(p.search_vector, q.query) AS rank
+                FROM projects AS p,
+                     (SELECT websearch_to_tsquery('russian', $1)
+                             || websearch_to_tsquery('english', $1) AS query) AS q
+                WHERE p.search_vector @@ q.query
+            ) AS matches
+        """
+        async with self.acquire() as conn:
+            if cursor is None:
+                rows = await conn.fetch(f"""
+                    SELECT * FROM ({found}) AS found
+                    ORDER BY rank DESC, id DESC
+                    LIMIT $2
+                """, query, limit)
+            elif not backward:
+                rows = await conn.fetch(f"""
+                    SELECT * FROM ({found}) AS found
+                    WHERE (rank, id) < ($2::real, $3)
+                    ORDER BY rank DESC, id DESC
+                    LIMIT $4
+                """, query, cursor[0], cursor[1], limit)
+            else:
+                rows = await conn.fetch(f"""
+                    SELECT * FROM ({found}) AS found
+                    WHERE (rank, id) > ($2::real, $3)
+                    ORDER BY rank ASC, id ASC
+                    LIMIT $4
+                """, query, cursor[0], cursor[1], limit)
+                rows = list(reversed(rows))
+            
+            if cursor is not None:
+                return [dict(row) for row in rows], None
+            total = rows[0]['total'] if rows else 0
+            return [dict(row) for row in rows], int(total)
+    
     async def get_project(self, project_id: int) -> Optional[Dict[str, Any]]:
         """Получить проект по ID"""
-        async with self.pool.acquire() as conn:
-            result = await conn.fetchrow("""
-                SELECT id, title, description, image_url, project_url, created_at, updated_at 
+        async with self.acquire() as conn:
+            result = await conn.fetchrow(f"""
+                SELECT {PROJECT_COLUMNS}
                 FROM projects 
                 WHERE id = $1
             """, project_id)
             return dict(result) if result else None
     
-    async def add_project(self, title: str, description: str = None, image_url: str = None, project_url: str = None) -> int:
-        """Добавить новый проект"""
-        async with self.pool.acquire() as conn:
+    async def add_project(self, title: str, description: str = None, image_url: str = None, project_url: str = None,
+                          image_pending: bool = False, thumbnail_url: str = None) -> int:
+        """Добавить новый проект (image_pending - изображение еще загружается в фоне)"""
+        async with self.acquire() as conn:
             result = await conn.fetchrow("""
-                INSERT INTO projects (title, description, image_url, project_url) 
-                VALUES ($1, $2, $3, $4)
+                INSERT INTO projects (title, description, image_url, project_url, image_pending, thumbnail_url) 
+                VALUES ($1, $2, $3, $4, $5, $6)
                 RETURNING id
-            """, title, description, image_url, project_url)
+            """, title, description, image_url, project_url, image_pending, thumbnail_url)
             return result['id']
     
     async def update_project(self, project_id: int, title: str = None, 
-                           description: str = None, image_url: str = None, project_url: str = None) -> bool:
-        """Обновить проект"""
-        try:
-            async with self.pool.acquire() as conn:
-                # Получаем текущие данные
-                current = await self.get_project(project_id)
-                if not current:
-                    return False
-                
-                # Обновляем только переданные поля
-                new_title = title if title is not None else current['title']
-                new_description = description if description is not None else current['description']
-                new_image_url = image_url if image_url is not None else current['image_url']
-                new_project_url = project_url if project_url is not None else current.get('project_url')
-                
-                await conn.execute("""
+                           description: str = None, image_url: str = None,
+                           project_url: str = None, image_pending: bool = None,
+                           thumbnail_url: str = None) -> Optional[Dict[str, Any]]:
+        """Обновить переданные поля проекта одним запросом, вернуть обновленный проект"""
+        # Обновляем только переданные поля
+        fields = {
+            'title': title,
+            'description': description,
+            'image_url': image_url,
+            'project_url': project_url,
+            'image_pending': image_pending,
+            'thumbnail_url': thumbnail_url,
+        }
+        fields = {column: value for column, value in fields.items() if value is not None}
+        
+        try:
+            if not fields:
+                return await self.get_project(project_id)
+            
+            # Имена колонок берутся из фиксированного списка выше, значения передаются параметрами
+            set_clause = ", ".join(f"{column} = ${i}" for i, column in enumerate(fields, start=2))
+            async with self.acquire() as conn:
+                result = await conn.fetchrow(f"""
                     UPDATE projects 
-                    SET title = $1, description = $2, image_url = $3, project_url = $4
-                    WHERE id = $5
-                """, new_title, new_description, new_image_url, new_project_url, project_id)
-                return True
+                    SET {set_clause}
+                    WHERE id = $1
+                    RETURNING {PROJECT_COLUMNS}
+                """, project_id, *fields.values())
+                return dict(result) if result else None
         except Exception as e:
             logger.error(f"Ошибка обновления проекта: {e}")
-            return False
+            return None
     
-    async def delete_project(self, project_id: int) -> bool:
-        """Удалить проект"""
+    async def replace_project_image(self, project_id: int, image_url: str,
+                                    thumbnail_url: Optional[str]) -> Optional[Dict[str, Any]]:
+        """Заменить изображение проекта, вернуть прежние ссылки (old_image_url, old_thumbnail_url)"""
         try:
-            async with self.pool.acquire() as conn:
-                result = await conn.execute("DELETE FROM projects WHERE id = $1", project_id)
-                return result.split()[-1] == '1'  # Проверяем, что удалили одну запись
+            async with self.acquire() as conn:
+                result = await conn.fetchrow("""
+                    UPDATE projects AS p
+                    SET image_url = $2, thumbnail_url = $3, image_pending = FALSE
+                    FROM (SELECT id, image_url, thumbnail_url FROM projects WHERE id = $1 FOR UPDATE) AS old
+                    WHERE p.id = old.id
+                    RETURNING old.image_url AS old_image_url, old.thumbnail_url AS old_thumbnail_url
+                """, project_id, image_url, thumbnail_url)
+                return dict(result) if result else None
+        except Exception as e:
+            logger.error(f"Ошибка замены изображения проекта: {e}")
+            return None
+    
+    async def delete_project(self, project_id: int) -> Optional[Dict[str, Any]]:
+        """Удалить проект, вернуть удаленную запись (None - проект не найден или ошибка)"""
+        try:
+            async with self.acquire() as conn:
+                result = await conn.fetchrow(
+                    f"DELETE FROM projects WHERE id = $1 RETURNING {PROJECT_COLUMNS}", project_id
+                )
+                return dict(result) if result else None
         except Exception as e:
             logger.error(f"Ошибка удаления проекта: {e}")
-            return False
+            return None
+
+    async def get_cached_image(self, file_unique_id: str) -> Optional[Dict[str, Optional[str]]]:
+        """Получить ранее загруженное изображение (url, thumbnail_url) по file_unique_id из Telegram"""
+        try:
+            async with self.acquire() as conn:
+                row = await conn.fetchrow(
+                    "SELECT url, thumbnail_url FROM image_cache WHERE file_unique_id = $1", file_unique_id
+                )
+                return dict(row) if row else None
+        except Exception as e:
+            logger.error(f"Ошибка чтения кэша изображений: {e}")
+            return None
+    
+    async def get_cached_image_by_sha256(self, sha256: str) -> Optional[Dict[str, Optional[str]]]:
+        """Получить ранее загруженное изображение (url, thumbnail_url) по SHA-256 содержимого"""
+        try:
+            async with self.acquire() as conn:
+                row = await conn.fetchrow(
+                    "SELECT url, thumbnail_url FROM image_cache WHERE sha256 = $1 LIMIT 1", sha256
+                )
+                return dict(row) if row else None
+        except Exception as e:
+            logger.error(f"Ошибка чтения кэша изображений: {e}")
+            return None
+    
+    async def save_cached_image(self, file_unique_id: str, sha256: str, url: str,
+                                thumbnail_url: Optional[str] = None) -> Dict[str, Optional[str]]:
+        """Сохранить загруженное изображение в кэш, вернуть URL (прежние, если такое содержимое уже есть)"""
+        try:
+            async with self.acquire() as conn:
+                row = await conn.fetchrow("""
+                    WITH existing AS (
+                        SELECT url, thumbnail_url FROM image_cache WHERE sha256 = $2 LIMIT 1
+                    )
+                    INSERT INTO image_cache (file_unique_id, sha256, url, thumbnail_url)
+                    SELECT $1, $2,
+                           COALESCE(existing.url, $3),
+                           CASE WHEN existing.url IS NULL THEN $4 ELSE existing.thumbnail_url END
+                    FROM (SELECT 1) AS one LEFT JOIN existing ON TRUE
+                    ON CONFLICT (file_unique_id)
+                    DO UPDATE SET sha256 = EXCLUDED.sha256, url = EXCLUDED.url,
+                                  thumbnail_url = EXCLUDED.thumbnail_url
+                    RETURNING url, thumbnail_url
+                """, file_unique_id, sha256, url, thumbnail_url)
+                return dict(row)
+        except Exception as e:
+            logger.error(f"Ошибка записи в кэш изображений: {e}")
+            return {'url': url, 'thumbnail_url': thumbnail_url}
+    
+    async def delete_unreferenced_images(self, urls: List[str]) -> List[str]:
+        """Удалить из кэша загрузок изображения, на которые не ссылается ни один проект
+        и ни одна настройка, и уведомить другие экземпляры бота. Возвращает удаленные URL -
+        только их можно удалять из хранилища.
+        
+        Строки image_cache блокируются до проверки ссылок: пока идет удаление, URL
+        не может быть заново выдан из кэша загрузок.
+        """
+        async with self.transaction() as conn:
+            await conn.execute("""
+                SELECT 1 FROM image_cache
+                WHERE url = ANY($1::text[]) OR thumbnail_url = ANY($1::text[])
+                FOR UPDATE
+            """, urls)
+            rows = await conn.fetch("""
+                SELECT DISTINCT u.url
+                FROM unnest($1::text[]) AS u(url)
+                WHERE NOT EXISTS (SELECT 1 FROM projects WHERE image_url = u.url)
+                  AND NOT EXISTS (SELECT 1 FROM projects WHERE thumbnail_url = u.url)
+                  AND NOT EXISTS (SELECT 1 FROM settings WHERE value = u.url)
+            """, urls)
+            orphaned = [row['url'] for row in rows]
+            if not orphaned:
+                return []
+            await conn.execute("""
+                DELETE FROM image_cache WHERE url = ANY($1::text[]) OR thumbnail_url = ANY($1::text[])
+            """, orphaned)
+            await conn.execute(
+                "SELECT pg_notify($1, url) FROM unnest($2::text[]) AS url", IMAGE_CACHE_CHANNEL, orphaned
+            )
+            return orphaned
+    
+    async def get_photo_file_ids(self) -> Dict[str, str]:
+        """Получить все сохраненные file_id Telegram для URL изображений"""
+        try:
+            async with self.acquire() as conn:
+                rows = await conn.fetch("SELECT url, file_id FROM photo_file_ids")
+                return {row['url']: row['file_id'] for row in rows}
+        except Exception as e:
+            logger.error(f"Ошибка чтения file_id изображений: {e}")
+            return {}
+    
+    async def save_photo_file_id(self, url: str, file_id: str):
+        """Сохранить file_id, который Telegram выдал после отправки изображения по URL"""
+        try:
+            async with self.acquire() as conn:
+                await conn.execute("""
+                    INSERT INTO photo_file_ids (url, file_id) VALUES ($1, $2)
+                    ON CONFLICT (url) DO UPDATE SET file_id = EXCLUDED.file_id
+                """, url, file_id)
+        except Exception as e:
+            logger.error(f"Ошибка сохранения file_id изображения: {e}")
+    
+    async def delete_photo_file_id(self, url: str):
+        """Удалить сохраненный file_id изображения"""
+        try:
+            async with self.acquire() as conn:
+                await conn.execute("DELETE FROM photo_file_ids WHERE url = $1", url)
+        except Exception as e:
+            logger.error(f"Ошибка удаления file_id изображения: {e}")
+
+    # ================================
+    # ФОНОВЫЕ ЗАДАЧИ
+    # ================================
+    
+    @staticmethod
+    def _job_from_row(row) -> Dict[str, Any]:
+        job = dict(row)
+        job['payload'] = json.loads(job['payload'])
+        return job
+    
+    async def create_job(self, kind: str, payload: Dict[str, Any]) -> int:
+        """Создать фоновую задачу, вернуть ее ID"""
+        async with self.acquire() as conn:
+            return await conn.fetchval("""
+                INSERT INTO jobs (kind, payload) VALUES ($1, $2::jsonb)
+                RETURNING id
+            """, kind, json.dumps(payload))
+    
+    async def update_job_payload(self, job_id: int, updates: Dict[str, Any]):
+        """Дополнить данные задачи"""
+        async with self.acquire() as conn:
+            await conn.execute("""
+                UPDATE jobs SET payload = payload || $2::jsonb WHERE id = $1
+            """, job_id, json.dumps(updates))
+    
+    async def claim_job(self, job_id: int, lease_seconds: float) -> Optional[Dict[str, Any]]:
+        """Захватить задачу для выполнения (None, если ее уже выполняет другой обработчик)"""
+        async with self.acquire() as conn:
+            row = await conn.fetchrow("""
+                UPDATE jobs
+                SET status = 'running', attempts = attempts + 1,
+                    locked_until = NOW() + make_interval(secs => $2)
+                WHERE id = $1
+                  AND (status = 'pending' OR (status = 'running' AND locked_until < NOW()))
+                RETURNING id, kind, payload::text AS payload, attempts
+            """, job_id, lease_seconds)
+            return self._job_from_row(row) if row else None
+    
+    async def complete_job(self, job_id: int):
+        """Удалить успешно выполненную задачу"""
+        async with self.acquire() as conn:
+            await conn.execute("DELETE FROM jobs WHERE id = $1", job_id)
+    
+    async def retry_job(self, job_id: int, delay_seconds: float, error: str):
+        """Вернуть задачу в очередь с задержкой"""
+        async with self.acquire() as conn:
+            await conn.execute("""
+                UPDATE jobs
+                SET status = 'pending', run_at = NOW() + make_interval(secs => $2),
+                    locked_until = NULL, last_error = $3
+                WHERE id = $1
+            """, job_id, delay_seconds, error)
+    
+    async def fail_job(self, job_id: int, error: str):
+        """Пометить задачу как окончательно неудачную"""
+        async with self.acquire() as conn:
+            await conn.execute("""
+                UPDATE jobs SET status = 'failed', locked_until = NULL, last_error = $2
+                WHERE id = $1
+            """, job_id, error)
+    
+    async def get_recoverable_jobs(self) -> List[Dict[str, Any]]:
+        """Незавершенные задачи (в том числе брошенные упавшим процессом): ID и задержка до запуска"""
+        async with self.acquire() as conn:
+            rows = await conn.fetch("""
+                SELECT id, GREATEST(EXTRACT(EPOCH FROM run_at - NOW()), 0)::float AS delay
+                FROM jobs
+                WHERE status = 'pending' OR (status = 'running' AND locked_until < NOW())
+                ORDER BY run_at
+            """)
+            return [dict(row) for row in rows]
+    
+    async def get_fsm_record(self, key: Tuple, ttl: float) -> Optional[Dict[str, Any]]:
+        """Состояние FSM по ключу (bot_id, chat_id, user_id, thread_id, destiny): state, data, age (сек)"""
+        async with self.acquire() as conn:
+            row = await conn.fetchrow("""
+                SELECT state, data, EXTRACT(EPOCH FROM NOW() - updated_at)::float AS age
+                FROM fsm_storage
+                WHERE bot_id = $1 AND chat_id = $2 AND user_id = $3 AND thread_id = $4 AND destiny = $5
+                  AND updated_at > NOW() - make_interval(secs => $6)
+            """, *key, ttl)
+            if not row:
+                return None
+            record = dict(row)
+            record['data'] = json.loads(record['data'])
+            return record
+    
+    async def save_fsm_record(self, key: Tuple, state: Optional[str], data: Dict[str, Any], notify_payload: str):
+        """Записать состояние FSM (пустое - удалить) и уведомить другие экземпляры бота"""
+        async with self.acquire() as conn:
+            if state is None and not data:
+                await conn.execute("""
+                    WITH deleted AS (
+                        DELETE FROM fsm_storage
+                        WHERE bot_id = $1 AND chat_id = $2 AND user_id = $3 AND thread_id = $4 AND destiny = $5
+                        RETURNING 1
+                    )
+                    SELECT pg_notify($6, $7) FROM deleted
+                """, *key, FSM_CHANNEL, notify_payload)
+            else:
+                await conn.execute("""
+                    WITH saved AS (
+                        INSERT INTO fsm_storage (bot_id, chat_id, user_id, thread_id, destiny, state, data)
+                        VALUES ($1, $2, $3, $4, $5, $6, $7::jsonb)
+                        ON CONFLICT (bot_id, chat_id, user_id, thread_id, destiny)
+                        DO UPDATE SET state = EXCLUDED.state, data = EXCLUDED.data, updated_at = NOW()
+                        RETURNING 1
+                    )
+                    SELECT pg_notify($8, $9) FROM saved
+                """, *key, state, json.dumps(data), FSM_CHANNEL, notify_payload)
+    
+    async def delete_expired_fsm_records(self, ttl: float) -> int:
+        """Удалить брошенные сессии FSM старше ttl секунд"""
+        async with self.acquire() as conn:
+            result = await conn.execute(
+                "DELETE FROM fsm_storage WHERE updated_at < NOW() - make_interval(secs => $1)", ttl
+            )
+            return int(result.split()[-1])
+
+    async def notify_panel_changed(self, payload: str):
+        """Сообщить другим экземплярам бота, что панель чата изменена"""
+        async with self.acquire() as conn:
+            await conn.execute("SELECT pg_notify($1, $2)", PANELS_CHANNEL, payload)
+    
+    async def enqueue_updates(self, updates: List[Dict[str, Any]]) -> int:
+        """Записать обновления Telegram в очередь ({'update_id', 'chat_id', 'payload'}), повторы
+        по update_id пропускаются. Возвращает число новых обновлений"""
+        async with self.transaction() as conn:
+            inserted = await conn.fetchval("""
+                WITH inserted AS (
+                    INSERT INTO updates (update_id, chat_id, payload)
+                    SELECT (u->>'update_id')::bigint, (u->>'chat_id')::bigint, u->'payload'
+                    FROM jsonb_array_elements($1::jsonb) AS u
+                    ON CONFLICT (update_id) DO NOTHING
+                    RETURNING 1
+                )
+                SELECT count(*) FROM inserted
+            """, json.dumps(updates))
+            if inserted:
+                await conn.execute("SELECT pg_notify($1, $2)", UPDATES_CHANNEL, str(inserted))
+            return inserted
+    
+    async def claim_update(self, lease_seconds: float, shard_count: int = 1,
+                           shard_index: int = 0) -> Optional[Dict[str, Any]]:
+        """Захватить самое раннее обновление среди чатов, у которых нет более раннего
+        необработанного обновления (порядок внутри чата сохраняется).
+        При shard_count > 1 - только из чатов своей части (chat_id по модулю shard_count)"""
+        async with self.acquire() as conn:
+            row = await conn.fetchrow("""
+                WITH next AS (
+                    SELECT u.update_id
+                    FROM updates u
+                    WHERE ((u.status = 'pending' AND u.run_at <= NOW())
+                           OR (u.status = 'running' AND u.locked_until < NOW()))
+                      AND NOT EXISTS (
+                          SELECT 1 FROM updates e
+                          WHERE e.chat_id = u.chat_id AND e.update_id < u.update_id
+                            AND e.status IN ('pending', 'running')
+                      )
+                      AND ($2 = 1 OR mod(abs(COALESCE(u.chat_id, 0)), $2) = $3)
+                    ORDER BY u.update_id
+                    LIMIT 1
+                    FOR UPDATE SKIP LOCKED
+                )
+                UPDATE updates AS u
+                SET status = 'running', attempts = u.attempts + 1,
+                    locked_until = NOW() + make_interval(secs => $1)
+                FROM next
+                WHERE u.update_id = next.update_id
+                RETURNING u.update_id, u.payload::text AS payload, u.attempts
+            """, lease_seconds, shard_count, shard_index)
+            if not row:
+                return None
+            update = dict(row)
+            update['payload'] = json.loads(update['payload'])
+            return update
+    
+    async def complete_update(self, update_id: int):
+        """Удалить обработанное обновление"""
+        async with self.acquire() as conn:
+            await conn.execute("DELETE FROM updates WHERE update_id = $1", update_id)
+    
+    async def retry_update(self, update_id: int, delay_seconds: float, error: str):
+        """Вернуть обновление в очередь с задержкой (следующие обновления чата ждут его)"""
+        async with self.acquire() as conn:
+            await conn.execute("""
+                UPDATE updates
+                SET status = 'pending', run_at = NOW() + make_interval(secs => $2),
+                    locked_until = NULL, last_error = $3
+                WHERE update_id = $1
+            """, update_id, delay_seconds, error)
+    
+    async def fail_update(self, update_id: int, error: str):
+        """Пометить обновление как окончательно необработанное"""
+        async with self.acquire() as conn:
+            await conn.execute("""
+                UPDATE updates SET status = 'failed', locked_until = NULL, last_error = $2
+                WHERE update_id = $1
+            """, update_id, error)
+    
+    async def delete_failed_updates(self, retention: float) -> int:
+        """Удалить окончательно не обработанные обновления старше retention секунд"""
+        async with self.acquire() as conn:
+            result = await conn.execute("""
+                DELETE FROM updates
+                WHERE status = 'failed' AND created_at < NOW() - make_interval(secs => $1)
+            """, retention)
+            return int(result.split()[-1])
+    
+    async def get_update_queue_stats(self) -> Dict[str, Any]:
+        """Длина очереди обновлений и возраст самого старого необработанного (сек)"""
+        async with self.acquire() as conn:
+            row = await conn.fetchrow("""
+                SELECT count(*) FILTER (WHERE status IN ('pending', 'running')) AS depth,
+                       count(*) FILTER (WHERE status = 'failed') AS failed,
+                       COALESCE(EXTRACT(EPOCH FROM NOW() - MIN(created_at)
+                           FILTER (WHERE status IN ('pending', 'running'))), 0)::float AS lag_seconds
+                FROM updates
+            """)
+            return dict(row)
 
 # Глобальный экземпляр базы данных
 db = Database()
@@ -0,0 +1,153 @@
+"""
+Хранилище состояний FSM в PostgreSQL: общие состояния диалогов для нескольких экземпляров бота
+"""
+import asyncio
+import copy
+import logging
+import time
+import uuid
+from collections import OrderedDict
+from typing import Any, Dict, Optional, Tuple
+
+from aiogram.fsm.state import State
+from aiogram.fsm.storage.base import BaseStorage, StorageKey, StateType
+
+from config import FSM_TTL, FSM_CACHE_SIZE, FSM_CACHE_TTL, FSM_CLEANUP_INTERVAL
+from database import db, FSM_CHANNEL
+
+logger = logging.getLogger(__name__)
+
+class _Record:
+    __slots__ = ("state", "data", "written_at", "cached_at")
+
+    def __init__(self, state: Optional[str], data: Dict[str, Any], written_at: float, cached_at: float):
+        self.state = state
+        self.data = data
+        self.written_at = written_at
+        self.cached_at = cached_at
+
+class PostgresStorage(BaseStorage):
+    """
+    FSM-хранилище aiogram поверх пула asyncpg (UNLOGGED таблица fsm_storage).
+    Запись сквозная: сначала upsert в базу, затем кэш процесса. Другие экземпляры
+    сбрасывают свой кэш по NOTIFY, а на случай пропущенного уведомления запись
+    кэша живет не дольше cache_ttl. Сессии, не менявшиеся дольше ttl, считаются
+    брошенными и периодически удаляются.
+    """
+
+    def __init__(self, ttl: float = 86400, cache_size: int = 1000, cache_ttl: float = 60,
+                 cleanup_interval: float = 3600):
+        self.ttl = ttl
+        self.cache_size = cache_size
+        self.cache_ttl = cache_ttl
+        self.cleanup_interval = cleanup_interval
+        self._cache: "OrderedDict[Tuple, _Record]" = OrderedDict()
+        # Свои уведомления не сбрасывают кэш
+        self._instance = uuid.uuid4().hex[:12]
+        self._cleanup_task: Optional[asyncio.Task] = None
+        db.add_notify_handler(FSM_CHANNEL, self._on_changed)
+
+    @staticmethod
+    def _key(key: StorageKey) -> Tuple:
+        return (key.bot_id, key.chat_id, key.user_id, key.thread_id or 0, key.destiny)
+
+    def _on_changed(self, conn, pid, channel, payload):
+        """Обработчик NOTIFY: состояние изменено другим экземпляром бота"""
+        if payload is None:
+            self._cache.clear()
+            return
+        instance, bot_id, chat_id, user_id, thread_id, destiny = payload.split("|", 5)
+        if instance != self._instance:
+            self._cache.pop((int(bot_id), int(chat_id), int(user_id), int(thread_id), destiny), None)
+
+    def _remember(self, key: Tuple, record: _Record):
+        self._cache[key] = record
+        self._cache.move_to_end(key)
+        while len(self._cache) > self.cache_size:
+            self._cache.popitem(last=False)
+
+    def _cached(self, key: Tuple, now: float) -> Optional[_Record]:
+        """Запись из кэша, если она не устарела (и сессия не истекла)"""
+        record = self._cache.get(key)
+        if record and now - record.cached_at < self.cache_ttl and now - record.written_at < self.ttl:
+            return record
+        return None
+
+    async def _load(self, key: Tuple) -> _Record:
+        """Запись из кэша или из базы (просроченная сессия - пустая)"""
+        now = time.monotonic()
+        record = self._cached(key, now)
+        if record:
+            self._cache.move_to_end(key)
+            return record
+
+        row = await db.get_fsm_record(key, self.ttl)
+        if row:
+            record = _Record(row['state'], row['data'], now - row['age'], now)
+        else:
+            record = _Record(None, {}, now, now)
+        self._remember(key, record)
+        return record
+
+    async def _save(self, key: Tuple, state: Optional[str], data: Dict[str, Any]):
+        payload = "|".join(map(str, (self._instance, *key)))
+        await db.save_fsm_record(key, state, data, payload)
+        now = time.monotonic()
+        self._remember(key, _Record(state, data, now, now))
+
+    async def set_state(self, key: StorageKey, state: StateType = None) -> None:
+        state = state.state if isinstance(state, State) else state
+        k = self._key(key)
+        record = await self._load(k)
+        await self._save(k, state, record.data)
+
+    def cached_state(self, key: StorageKey) -> Optional[str]:
+        """Состояние из кэша процесса без обращения к базе (нет в кэше - None)"""
+        record = self._cached(self._key(key), time.monotonic())
+        return record.state if record else None
+
+    async def get_state(self, key: StorageKey) -> Optional[str]:
+        return (await self._load(self._key(key))).state
+
+    async def set_data(self, key: StorageKey, data: Dict[str, Any]) -> None:
+        k = self._key(key)
+        record = await self._load(k)
+        await self._save(k, record.state, copy.deepcopy(data))
+
+    async def get_data(self, key: StorageKey) -> Dict[str, Any]:
+        return copy.deepcopy((await self._load(self._key(key))).data)
+
+    async def update_data(self, key: StorageKey, data: Dict[str, Any]) -> Dict[str, Any]:
+        k = self._key(key)
+        record = await self._load(k)
+        updated = {**record.data, **copy.deepcopy(data)}
+        await self._save(k, record.state, updated)
+        return copy.deepcopy(updated)
+
+    def start(self):
+        """Запустить периодическое удаление брошенных сессий"""
+        if self._cleanup_task is None:
+            self._cleanup_task = asyncio.create_task(self._cleanup_loop())
+
+    async def _cleanup_loop(self):
+        while True:
+            try:
+                deleted = await db.delete_expired_fsm_records(self.ttl)
+                if deleted:
+                    logger.info(f"Удалено брошенных сессий FSM: {deleted}")
+            except Exception as e:
+                logger.error(f"Ошибка очистки сессий FSM: {e}")
+            await asyncio.sleep(self.cleanup_interval)
+
+    async def close(self) -> None:
+        if self._cleanup_task:
+            self._cleanup_task.cancel()
+            try:
+                await self._cleanup_task
+            except asyncio.CancelledError:
+                pass
+            self._cleanup_task = None
+        self._cache.clear()
+
+# Глобальное хранилище состояний FSM
+fsm_storage = PostgresStorage(FSM_TTL, FSM_CACHE_SIZE, FSM_CACHE_TTL, FSM_CLEANUP_INTERVAL)
@@ -1,17 +1,30 @@
+import asyncio
 import logging
 from aiogram import Router, F
-from aiogram.types import Message, CallbackQuery, InputMediaPhoto
-from aiogram.filters import Command, StateFilter
+from aiogram.types import (
+    Message, CallbackQuery, InlineQuery, InlineQueryResultArticle, InlineQueryResultCachedPhoto,
+    InlineQueryResultPhoto, InputTextMessageContent
+)
+from aiogram.filters import Command, CommandObject, StateFilter
 from aiogram.fsm.context import FSMContext
 from aiogram.fsm.state import State, StatesGroup
+from aiogram.exceptions import TelegramBadRequest
 
 from database import db
-from config import imgbb_uploader
+from config import image_storage, IMAGE_MAX_SIDE, INLINE_CACHE_TIME
+from storage import select_photo_size
+from image_cache import image_cache, photo_file_ids, schedule_orphan_cleanup
+from panels import panels
+from portfolio import portfolio, escape_markdown
+from prefetch import prefetcher
+from jobs import job_queue
+from middlewares import throttling, admin_gate
 from keyboards import (
-    get_admin_menu, get_projects_menu, get_project_menu, 
+    get_admin_menu,
     get_edit_project_menu, get_confirm_delete_menu, 
     get_cancel_menu, get_back_to_main_menu, get_admin_management_menu,
-    get_admin_list_menu, get_admin_delete_menu, get_confirm_delete_admin_menu
+    get_admin_list_menu, get_admin_delete_menu, get_confirm_delete_admin_menu,
+    get_projects_menu, decode_project_cursor, encode_search_cursor, decode_search_cursor
 )
 
 logger = logging.getLogger(__name__)
@@ -26,6 +39,7 @@ class ProjectStates(StatesGroup):
     editing_description = State()
     editing_project_url = State()
     editing_image = State()
+    waiting_for_search_query = State()
 
 class AdminStates(StatesGroup):
     adding_admin = State()
@@ -33,94 +47,40 @@ class AdminStates(StatesGroup):
 
 router = Router()
 
-# Проверка на админа
-async def is_admin_user(user_id: int) -> bool:
-    """Проверяет, является ли пользователь админом"""
-    return await db.is_admin(user_id)
+# Сначала ограничение частоты, затем проверка доступа: роль пользователя определяется
+# один раз на обновление, не-админы отсекаются до обработчиков
+for observer in (router.message, router.callback_query, router.inline_query):
+    observer.outer_middleware(throttling)
+    observer.outer_middleware(admin_gate)
 
-# Вспомогательные функции для отправки сообщений с фото
-async def send_message_with_menu_photo(message: Message, text: str, reply_markup=None, parse_mode=None):
-    """Отправляет сообщение с фото из настроек menu_photo, если оно есть"""
+# Вспомогательные функции для отправки сообщений с фото (через панель чата)
+async def send_message_with_menu_photo(message: Message, text: str, reply_markup=None, parse_mode=None) -> int:
+    """Отправляет новое сообщение с фото из настроек menu_photo, если оно есть; возвращает его ID"""
     menu_photo = await db.get_menu_photo()
-    
-    if menu_photo:
-        try:
-            return await message.answer_photo(
-                photo=menu_photo,
-                caption=text,
-                reply_markup=reply_markup,
-                parse_mode=parse_mode
-            )
-        except Exception as e:
-            logger.error(f"Ошибка отправки фото: {e}")
-            # Если не удалось отправить с фото, отправляем обычное сообщение
-            return await message.answer(text, reply_markup=reply_markup, parse_mode=parse_mode)
-    else:
-        return await message.answer(text, reply_markup=reply_markup, parse_mode=parse_mode)
+    return await panels.render(message.bot, message.chat.id, text, menu_photo, reply_markup, parse_mode, new=True)
+
+async def render_menu_panel(message: Message, text: str, reply_markup=None, parse_mode=None) -> int:
+    """Обновляет панель чата на месте (шаги мастеров), если ее нет - отправляет новую; возвращает ID"""
+    menu_photo = await db.get_menu_photo()
+    return await panels.render(message.bot, message.chat.id, text, menu_photo, reply_markup, parse_mode)
 
 async def edit_message_with_menu_photo(callback: CallbackQuery, text: str, reply_markup=None, parse_mode=None, save_message_id: bool = False, state: FSMContext = None):
     """Редактирует сообщение с фото из настроек menu_photo, если оно есть"""
     menu_photo = await db.get_menu_photo()
-    
-    if menu_photo:
-        try:
-            # Если в сообщении уже есть фото, редактируем медиа
-            if callback.message.photo:
-                await callback.message.edit_media(
-                    media=InputMediaPhoto(media=menu_photo, caption=text, parse_mode=parse_mode),
-                    reply_markup=reply_markup
-                )
-                if save_message_id and state:
-                    await save_bot_message_id(state, callback.message.message_id)
-            else:
-                # Если фото нет, удаляем старое сообщение и отправляем новое с фото
-                await callback.message.delete()
-                new_message = await callback.message.answer_photo(
-                    photo=menu_photo,
-                    caption=text,
-                    reply_markup=reply_markup,
-                    parse_mode=parse_mode
-                )
-                if save_message_id and state:
-                    await save_bot_message_id(state, new_message.message_id)
-        except Exception as e:
-            logger.error(f"Ошибка редактирования с фото: {e}")
-            # Если не удалось отредактировать с фото, редактируем обычный текст
-            await callback.message.edit_text(text, reply_markup=reply_markup, parse_mode=parse_mode)
-            if save_message_id and state:
-                await save_bot_message_id(state, callback.message.message_id)
-    else:
-        await callback.message.edit_text(text, reply_markup=reply_markup, parse_mode=parse_mode)
-        if save_message_id and state:
-            await save_bot_message_id(state, callback.message.message_id)
+    message_id = await panels.render(
+        callback.bot, callback.message.chat.id, text, menu_photo,
+        reply_markup, parse_mode, message=callback.message
+    )
+    if save_message_id and state:
+        await save_bot_message_id(state, message_id)
 
 async def edit_message_with_project_photo(callback: CallbackQuery, text: str, project_image_url: str = None, reply_markup=None, parse_mode=None):
     """Редактирует сообщение с фото проекта, если оно есть, иначе с фото меню"""
     photo_url = project_image_url or await db.get_menu_photo()
-    
-    if photo_url:
-        try:
-            # Если в сообщении уже есть фото, редактируем медиа
-            if callback.message.photo:
-                await callback.message.edit_media(
-                    media=InputMediaPhoto(media=photo_url, caption=text, parse_mode=parse_mode),
-                    reply_markup=reply_markup
-                )
-            else:
-                # Если фото нет, удаляем старое сообщение и отправляем новое с фото
-                await callback.message.delete()
-                await callback.message.answer_photo(
-                    photo=photo_url,
-                    caption=text,
-                    reply_markup=reply_markup,
-                    parse_mode=parse_mode
-                )
-        except Exception as e:
-            logger.error(f"Ошибка редактирования с фото: {e}")
-            # Если не удалось отредактировать с фото, редактируем обычный текст
-            await callback.message.edit_text(text, reply_markup=reply_markup, parse_mode=parse_mode)
-    else:
-        await callback.message.edit_text(text, reply_markup=reply_markup, parse_mode=parse_mode)
+    await panels.render(
+        callback.bot, callback.message.chat.id, text, photo_url,
+        reply_markup, parse_mode, message=callback.message
+    )
 
 async def send_progress_message(message: Message, title: str = "", description: str = "", project_url: str = "", image_status: str = "", reply_markup=None):
     """Отправляет сообщение с прогрессом добавления проекта"""
@@ -146,32 +106,65 @@ async def send_progress_message(message: Message, title: str = "", description:
     elif project_url:  # Показываем только если уже есть ссылка
         progress_text += "⏳ Изображение: _ожидание загрузки_\n"
     
-    await send_message_with_menu_photo(
+    await render_menu_panel(
         message,
         progress_text,
         reply_markup=reply_markup,
         parse_mode="Markdown"
     )
 
+# Telegram удаляет не больше 100 сообщений за один вызов deleteMessages
+DELETE_MESSAGES_CHUNK = 100
+# Одновременных deleteMessage, если пакетное удаление недоступно
+DELETE_MESSAGES_CONCURRENCY = 5
+
+# Фоновые задачи очистки (ссылки хранятся, чтобы задачи не собрал GC)
+_cleanup_tasks = set()
+
+async def delete_messages(bot, chat_id: int, message_ids: list):
+    """Удаляет сообщения пачками через deleteMessages, при ошибке - по одному (параллельно)"""
+    for i in range(0, len(message_ids), DELETE_MESSAGES_CHUNK):
+        chunk = message_ids[i:i + DELETE_MESSAGES_CHUNK]
+        try:
+            await bot.delete_messages(chat_id, chunk)
+            continue
+        except Exception as e:
+            logger.debug(f"Пакетное удаление недоступно, удаляем по одному: {e}")
+        
+        semaphore = asyncio.Semaphore(DELETE_MESSAGES_CONCURRENCY)
+        
+        async def delete_one(message_id: int):
+            async with semaphore:
+                try:
+                    await bot.delete_message(chat_id, message_id)
+                except Exception as e:
+                    logger.debug(f"Не удалось удалить сообщение {message_id}: {e}")
+        
+        await asyncio.gather(*(delete_one(message_id) for message_id in chunk))
+
+def delete_messages_in_background(bot, chat_id: int, message_ids: list):
+    """Запускает удаление сообщений в фоне, не задерживая ответ пользователю"""
+    if not message_ids:
+        return
+    task = asyncio.create_task(delete_messages(bot, chat_id, message_ids))
+    _cleanup_tasks.add(task)
+    task.add_done_callback(_cleanup_tasks.discard)
+
 async def delete_previous_messages(message: Message, state: FSMContext):
-    """Удаляет предыдущие сообщения пользователя и бота"""
+    """Удаляет предыдущие сообщения пользователя и бота (в фоне)"""
     try:
-        # Удаляем сообщение пользователя
-        await message.delete()
-        
-        # Получаем данные из состояния
+        # Список сообщений бота забираем сразу: шаг мастера запишет в него новое сообщение
         data = await state.get_data()
         bot_message_ids = data.get('bot_message_ids', [])
-        
-        # Удаляем все предыдущие сообщения бота
-        for bot_message_id in bot_message_ids:
-            try:
-                await message.bot.delete_message(message.chat.id, bot_message_id)
-            except Exception as e:
-                logger.debug(f"Не удалось удалить сообщение бота {bot_message_id}: {e}")
-        
-        # Очищаем список ID сообщений бота
         await state.update_data(bot_message_ids=[])
+        
+        # Панель чата обновляется на месте, остальные сообщения бота и сообщение пользователя
+        # удаляются одним запросом
+        panel_id = panels.message_id(message.chat.id)
+        delete_messages_in_background(
+            message.bot, message.chat.id,
+            [message.message_id, *(i for i in bot_message_ids if i != panel_id)]
+        )
     
     except Exception as e:
         logger.debug(f"Не удалось удалить сообщения: {e}")
@@ -180,25 +173,68 @@ async def save_bot_message_id(state: FSMContext, message_id: int):
     """Сохраняет ID сообщения бота для последующего удаления"""
     await state.update_data(bot_message_ids=[message_id])
 
-def escape_markdown(text: str) -> str:
-    """Экранирует специальные символы Markdown"""
-    if not text:
-        return text
-    
-    # Символы, которые нужно экранировать в MarkdownV2 (убрали точку)
-    escape_chars = ['_', '*', '[', ']', '(', ')', '~', '`', '>', '#', '+', '-', '=', '|', '{', '}', '!']
-    
-    for char in escape_chars:
-        text = text.replace(char, f'\\{char}')
+# Фоновая загрузка изображений проектов
+PROJECT_IMAGE_JOB = "project_image"
+
+async def edit_job_message(bot, payload: dict, text: str):
+    """Обновляет сообщение, отправленное админу при постановке задачи"""
+    if not payload.get('message_id'):
+        return
+    # Сообщение меняется в обход панели - ее текст больше не известен
+    await panels.invalidate(payload['chat_id'], payload['message_id'])
+    try:
+        await bot.edit_message_caption(
+            chat_id=payload['chat_id'],
+            message_id=payload['message_id'],
+            caption=text,
+            reply_markup=get_back_to_main_menu(),
+            parse_mode="Markdown"
+        )
+    except TelegramBadRequest:
+        # Сообщение без фото - редактируем текст
+        try:
+            await bot.edit_message_text(
+                text,
+                chat_id=payload['chat_id'],
+                message_id=payload['message_id'],
+                reply_markup=get_back_to_main_menu(),
+                parse_mode="Markdown"
+            )
+        except TelegramBadRequest as e:
+            logger.debug(f"Не удалось обновить сообщение о загрузке: {e}")
+
+async def process_project_image(bot, payload: dict):
+    """Задача: загрузить фото проекта и записать ссылку в проект"""
+    image = await image_cache.upload_telegram_photo(
+        bot, payload['file_id'], payload['file_unique_id'], payload['name']
+    )
+    if not image:
+        raise RuntimeError("Не удалось загрузить изображение")
     
-    return text
+    # Без отдельной миниатюры используем само изображение, чтобы не осталась старая
+    old = await db.replace_project_image(
+        payload['project_id'], image['url'], image['thumbnail_url'] or image['url']
+    )
+    if old:
+        await portfolio.refresh(payload['project_id'])
+        await schedule_orphan_cleanup(old['old_image_url'], old['old_thumbnail_url'])
+    else:
+        # Проект удален, пока шла загрузка - новое изображение никому не нужно
+        await schedule_orphan_cleanup(image['url'], image['thumbnail_url'])
+    await edit_job_message(bot, payload, payload.get('success_text', "✅ Изображение загружено"))
+
+async def project_image_failed(bot, payload: dict, error: Exception):
+    """Все попытки загрузки исчерпаны: снимаем отметку ожидания и сообщаем админу"""
+    await db.update_project(payload['project_id'], image_pending=False)
+    await portfolio.refresh(payload['project_id'])
+    await edit_job_message(bot, payload, payload.get('failure_text', "❌ Не удалось загрузить изображение"))
+
+job_queue.register(PROJECT_IMAGE_JOB, process_project_image, on_failure=project_image_failed)
 
 # Команда /start
 @router.message(Command("start"))
-async def cmd_start(message: Message):
-    user_id = message.from_user.id
-    
-    if await is_admin_user(user_id):
+async def cmd_start(message: Message, is_admin: bool):
+    if is_admin:
         await send_message_with_menu_photo(
             message,
             f"🎉 Добро пожаловать в админ-панель Codev!\n\n"
@@ -216,10 +252,6 @@ async def cmd_start(message: Message):
 # Главное меню
 @router.callback_query(F.data == "back_to_main")
 async def back_to_main(callback: CallbackQuery):
-    if not await is_admin_user(callback.from_user.id):
-        await callback.answer("❌ Нет доступа!", show_alert=True)
-        return
-    
     await edit_message_with_menu_photo(
         callback,
         "🏠 Главное меню администратора:",
@@ -230,32 +262,34 @@ async def back_to_main(callback: CallbackQuery):
 # Просмотр проектов
 @router.callback_query(F.data == "view_projects")
 async def view_projects(callback: CallbackQuery):
-    if not await is_admin_user(callback.from_user.id):
-        await callback.answer("❌ Нет доступа!", show_alert=True)
-        return
-    
     await show_projects_page(callback, page=0)
 
 # Просмотр проектов с пагинацией
 @router.callback_query(F.data.startswith("projects_page_"))
 async def view_projects_page(callback: CallbackQuery):
-    if not await is_admin_user(callback.from_user.id):
-        await callback.answer("❌ Нет доступа!", show_alert=True)
-        return
+    # projects_page_{страница}_{b|a}_{микросекунды}_{id}
+    parts = callback.data.split("_", 4)
+    try:
+        page = int(parts[2])
+        backward = parts[3] == "b"
+        cursor = decode_project_cursor(parts[4])
+    except (IndexError, ValueError):
+        page, backward, cursor = 0, False, None
     
-    page = int(callback.data.split("_")[-1])
-    await show_projects_page(callback, page)
+    if cursor is None:
+        page = 0
+    await show_projects_page(callback, page, cursor=cursor, backward=backward)
 
 # Обработчик для кнопки индикатора страницы (ничего не делает)
 @router.callback_query(F.data == "current_page")
 async def current_page_handler(callback: CallbackQuery):
     await callback.answer()
 
-async def show_projects_page(callback: CallbackQuery, page: int):
-    """Показать страницу проектов с пагинацией"""
-    projects = await db.get_projects()
+async def show_projects_page(callback: CallbackQuery, page: int, cursor=None, backward: bool = False):
+    """Показать страницу проектов с пагинацией (из памяти)"""
+    page, total, total_pages, reply_markup = await portfolio.get_page(page, cursor, backward)
     
-    if not projects:
+    if not total:
         await edit_message_with_menu_photo(
             callback,
             "📂 Список проектов пуст.\n"
@@ -265,26 +299,14 @@ async def show_projects_page(callback: CallbackQuery, page: int):
         await callback.answer()
         return
     
-    # Пагинация: 10 проектов на страницу
-    projects_per_page = 10
-    total_pages = (len(projects) + projects_per_page - 1) // projects_per_page
-    
-    # Проверяем корректность номера страницы
-    if page < 0:
-        page = 0
-    elif page >= total_pages:
-        page = total_pages - 1
-    
-    # Получаем проекты для текущей страницы
-    start_idx = page * projects_per_page
-    end_idx = start_idx + projects_per_page
-    page_projects = projects[start_idx:end_idx]
+    # Следующим нажатием почти всегда открывают проект этой страницы (или листают дальше)
+    prefetcher.schedule(callback.bot, portfolio.page_projects(page) + portfolio.page_projects(page + 1))
     
     await edit_message_with_menu_photo(
         callback,
-        f"📂 Список проектов ({len(projects)} шт.)\n"
+        f"📂 Список проектов ({total} шт.)\n"
         f"Страница {page + 1} из {total_pages}:",
-        reply_markup=get_projects_menu(page_projects, page, total_pages)
+        reply_markup=reply_markup
     )
     
     await callback.answer()
@@ -292,46 +314,180 @@ async def show_projects_page(callback: CallbackQuery, page: int):
 # Просмотр конкретного проекта
 @router.callback_query(F.data.startswith("project_"))
 async def view_project(callback: CallbackQuery):
-    if not await is_admin_user(callback.from_user.id):
-        await callback.answer("❌ Нет доступа!", show_alert=True)
-        return
-    
     project_id = int(callback.data.split("_")[1])
-    project = await db.get_project(project_id)
+    project = await portfolio.get(project_id)
     
     if not project:
         await callback.answer("❌ Проект не найден!", show_alert=True)
         return
     
-    title_escaped = escape_markdown(project['title'])
-    text = f"📄 **{title_escaped}**\n\n"
+    # Текст и клавиатура карточки подготовлены заранее
+    text, reply_markup = project.card
+    await edit_message_with_project_photo(
+        callback,
+        text,
+        project_image_url=project.image_url,
+        reply_markup=reply_markup,
+        parse_mode="Markdown"
+    )
+    await callback.answer()
+
+# Поиск проектов
+SEARCH_RESULTS_PER_PAGE = 10
+SEARCH_QUERY_MAX_LENGTH = 200
+
+async def build_search_results(query: str, page: int = 0, cursor=None, backward: bool = False,
+                               total: int = None):
+    """Текст, клавиатура страницы результатов поиска (по релевантности) и число найденных.
+    
+    Число найденных считается только для первой страницы, при листании передается total.
+    """
+    if cursor is None or total is None:
+        cursor, page = None, 0
+    found, page_total = await db.search_projects(query, SEARCH_RESULTS_PER_PAGE, cursor, backward)
+    
+    # Назад от начала результатов или страница опустела - показываем первую страницу
+    if cursor is not None and (not found or (backward and len(found) < SEARCH_RESULTS_PER_PAGE)):
+        page = 0
+        found, page_total = await db.search_projects(query, SEARCH_RESULTS_PER_PAGE)
+    if page_total is not None:
+        total = page_total
     
-    if project['description']:
-        desc_escaped = escape_markdown(project['description'])
-        text += f"📝 Описание:\n{desc_escaped}\n\n"
+    if not found:
+        return f"🔍 По запросу «{query}» ничего не найдено.", get_back_to_main_menu(), 0
     
-    if project.get('project_url'):
-        url_escaped = escape_markdown(project['project_url'])
-        text += f"🔗 Ссылка на проект: {url_escaped}\n\n"
+    total_pages = (total + SEARCH_RESULTS_PER_PAGE - 1) // SEARCH_RESULTS_PER_PAGE
+    page = max(0, min(page, total_pages - 1))
+    return (
+        f"🔍 Результаты поиска «{query}» ({total} шт.)\n"
+        f"Страница {page + 1} из {total_pages}:",
+        get_projects_menu(found, page, total_pages, "search_page", encode_search_cursor),
+        total
+    )
+
+async def show_search_results(message: Message, state: FSMContext, query: str):
+    """Выполнить поиск и показать первую страницу результатов в панели чата"""
+    query = query[:SEARCH_QUERY_MAX_LENGTH]
+    text, reply_markup, total = await build_search_results(query)
+    # Запрос и число найденных нужны для листания результатов - кнопки несут только курсор
+    await state.set_state(None)
+    await state.update_data(search_query=query, search_total=total)
+    await render_menu_panel(message, text, reply_markup=reply_markup)
+
+# Команда /search [запрос]
+@router.message(Command("search"))
+async def search_command(message: Message, state: FSMContext, command: CommandObject):
+    await delete_previous_messages(message, state)
+    query = (command.args or "").strip()
+    if query:
+        await show_search_results(message, state, query)
+        return
     
-    text += f"📅 Создан: {project['created_at'].strftime('%d.%m.%Y %H:%M')}"
+    await state.set_state(ProjectStates.waiting_for_search_query)
+    await render_menu_panel(
+        message,
+        "🔍 Введите слова из названия или описания проекта:",
+        reply_markup=get_cancel_menu()
+    )
+
+@router.callback_query(F.data == "search_projects")
+async def search_start(callback: CallbackQuery, state: FSMContext):
+    await state.set_state(ProjectStates.waiting_for_search_query)
     
-    await edit_message_with_project_photo(
+    await edit_message_with_menu_photo(
         callback,
-        text,
-        project_image_url=project['image_url'],
-        reply_markup=get_project_menu(project_id),
-        parse_mode="Markdown"
+        "🔍 Введите слова из названия или описания проекта:",
+        reply_markup=get_cancel_menu(),
+        save_message_id=True,
+        state=state
     )
     await callback.answer()
 
+@router.message(StateFilter(ProjectStates.waiting_for_search_query))
+async def search_query_received(message: Message, state: FSMContext):
+    await delete_previous_messages(message, state)
+    
+    query = (message.text or "").strip()
+    if not query:
+        await render_menu_panel(
+            message,
+            "❌ Отправьте текст для поиска.",
+            reply_markup=get_cancel_menu()
+        )
+        return
+    await show_search_results(message, state, query)
+
+# Листание результатов поиска
+@router.callback_query(F.data.startswith("search_page_"))
+async def search_results_page(callback: CallbackQuery, state: FSMContext):
+    data = await state.get_data()
+    query = data.get('search_query')
+    if not query:
+        await callback.answer("⌛ Результаты поиска устарели, повторите поиск", show_alert=True)
+        return
+    
+    # search_page_{страница}_{b|a}_{rank}_{id}
+    parts = callback.data.split("_", 4)
+    try:
+        page = int(parts[2])
+        backward = parts[3] == "b"
+        cursor = decode_search_cursor(parts[4])
+    except (IndexError, ValueError):
+        page, backward, cursor = 0, False, None
+    
+    total = data.get('search_total')
+    text, reply_markup, new_total = await build_search_results(query, page, cursor, backward, total)
+    if new_total != total:
+        # Показана первая страница - число найденных пересчитано
+        await state.update_data(search_total=new_total)
+    await edit_message_with_menu_photo(callback, text, reply_markup=reply_markup)
+    await callback.answer()
+
+# Inline-режим: @бот запрос в любом чате - отправить проект из портфолио
+INLINE_RESULTS_PER_PAGE = 20
+
+def project_inline_result(project):
+    """Результат inline-запроса: фото по file_id, если Telegram его уже видел, иначе по URL"""
+    description = (project.description or "")[:100]
+    if project.image_url:
+        photo = photo_file_ids.resolve(project.image_url)
+        if photo != project.image_url:
+            return InlineQueryResultCachedPhoto(
+                id=str(project.id), photo_file_id=photo, title=project.title,
+                description=description, caption=project.share_caption, parse_mode="Markdown"
+            )
+        return InlineQueryResultPhoto(
+            id=str(project.id), photo_url=project.image_url,
+            thumbnail_url=project.thumbnail_url or project.image_url, title=project.title,
+            description=description, caption=project.share_caption, parse_mode="Markdown"
+        )
+    return InlineQueryResultArticle(
+        id=str(project.id), title=project.title, description=description,
+        input_message_content=InputTextMessageContent(
+            message_text=project.share_caption, parse_mode="Markdown"
+        )
+    )
+
+@router.inline_query()
+async def inline_portfolio(inline_query: InlineQuery):
+    try:
+        offset = int(inline_query.offset or 0)
+    except ValueError:
+        offset = 0
+    
+    # Поиск по индексу названий в памяти, без запросов к базе
+    projects, has_more = await portfolio.search(inline_query.query, offset, INLINE_RESULTS_PER_PAGE)
+    await inline_query.answer(
+        [project_inline_result(project) for project in projects],
+        cache_time=INLINE_CACHE_TIME,
+        # Результаты только для админов - Telegram не должен отдавать их из кэша другим
+        is_personal=True,
+        next_offset=str(offset + len(projects)) if has_more else ""
+    )
+
 # Добавление проекта
 @router.callback_query(F.data == "add_project")
 async def add_project_start(callback: CallbackQuery, state: FSMContext):
-    if not await is_admin_user(callback.from_user.id):
-        await callback.answer("❌ Нет доступа!", show_alert=True)
-        return
-    
     await state.set_state(ProjectStates.waiting_for_title)
     
     # Редактируем текущее сообщение
@@ -348,10 +504,6 @@ async def add_project_start(callback: CallbackQuery, state: FSMContext):
 
 @router.message(StateFilter(ProjectStates.waiting_for_title))
 async def add_project_title(message: Message, state: FSMContext):
-    if not await is_admin_user(message.from_user.id):
-        await send_message_with_menu_photo(message, "❌ Нет доступа!")
-        return
-    
     # Удаляем предыдущие сообщения
     await delete_previous_messages(message, state)
     
@@ -366,7 +518,7 @@ async def add_project_title(message: Message, state: FSMContext):
                     "⏳ Описание: _ожидание ввода_\n\n"
                     "📝 Введите описание проекта (или отправьте /skip чтобы пропустить):")
     
-    bot_message = await send_message_with_menu_photo(
+    bot_message_id = await render_menu_panel(
         message,
         progress_text,
         reply_markup=get_cancel_menu(),
@@ -374,15 +526,10 @@ async def add_project_title(message: Message, state: FSMContext):
     )
     
     # Сохраняем ID сообщения бота для последующего удаления
-    if hasattr(bot_message, 'message_id'):
-        await save_bot_message_id(state, bot_message.message_id)
+    await save_bot_message_id(state, bot_message_id)
 
 @router.message(StateFilter(ProjectStates.waiting_for_description))
 async def add_project_description(message: Message, state: FSMContext):
-    if not await is_admin_user(message.from_user.id):
-        await send_message_with_menu_photo(message, "❌ Нет доступа!")
-        return
-    
     # Удаляем предыдущие сообщения
     await delete_previous_messages(message, state)
     
@@ -408,7 +555,7 @@ async def add_project_description(message: Message, state: FSMContext):
     progress_text += ("⏳ Ссылка на проект: _ожидание ввода_\n\n"
                      "🔗 Введите ссылку на проект (или отправьте /skip чтобы пропустить):")
     
-    bot_message = await send_message_with_menu_photo(
+    bot_message_id = await render_menu_panel(
         message,
         progress_text,
         reply_markup=get_cancel_menu(),
@@ -416,15 +563,10 @@ async def add_project_description(message: Message, state: FSMContext):
     )
     
     # Сохраняем ID сообщения бота
-    if hasattr(bot_message, 'message_id'):
-        await save_bot_message_id(state, bot_message.message_id)
+    await save_bot_message_id(state, bot_message_id)
 
 @router.message(StateFilter(ProjectStates.waiting_for_project_url))
 async def add_project_url(message: Message, state: FSMContext):
-    if not await is_admin_user(message.from_user.id):
-        await send_message_with_menu_photo(message, "❌ Нет доступа!")
-        return
-    
     # Удаляем предыдущие сообщения
     await delete_previous_messages(message, state)
     
@@ -457,7 +599,7 @@ async def add_project_url(message: Message, state: FSMContext):
     progress_text += ("⏳ Изображение: _ожидание загрузки_\n\n"
                      "📎 Отправьте изображение проекта (фото) или /skip чтобы пропустить:")
     
-    bot_message = await send_message_with_menu_photo(
+    bot_message_id = await render_menu_panel(
         message,
         progress_text,
         reply_markup=get_cancel_menu(),
@@ -465,61 +607,26 @@ async def add_project_url(message: Message, state: FSMContext):
     )
     
     # Сохраняем ID сообщения бота
-    if hasattr(bot_message, 'message_id'):
-        await save_bot_message_id(state, bot_message.message_id)
+    await save_bot_message_id(state, bot_message_id)
 
 @router.message(StateFilter(ProjectStates.waiting_for_image))
 async def add_project_image(message: Message, state: FSMContext):
-    if not await is_admin_user(message.from_user.id):
-        await send_message_with_menu_photo(message, "❌ Нет доступа!")
-        return
-    
     # Удаляем предыдущие сообщения
     await delete_previous_messages(message, state)
     
-    image_url = None
+    image = None
+    photo = None
     
     # Проверяем, отправил ли пользователь фото
-    if message.photo and imgbb_uploader:
-        try:
-            # Показываем прогресс загрузки
-            progress_message = await send_message_with_menu_photo(
-                message,
-                "📤 **Загрузка изображения...**\n\nПожалуйста, подождите.",
-                parse_mode="Markdown"
-            )
-            
-            # Получаем самое большое фото
-            photo = message.photo[-1]
-            
-            # Загружаем в imgbb
-            image_url = await imgbb_uploader.upload_from_telegram_photo(
-                message.bot, 
-                photo.file_id, 
-                f"project_{message.from_user.id}_{photo.file_id}"
-            )
-            
-            # Удаляем сообщение о загрузке
-            if hasattr(progress_message, 'message_id'):
-                try:
-                    await message.bot.delete_message(message.chat.id, progress_message.message_id)
-                except:
-                    pass
-                    
-            if not image_url:
-                await send_message_with_menu_photo(
-                    message,
-                    "❌ **Ошибка загрузки изображения**\n\n"
-                    "Не удалось загрузить изображение. Проект будет создан без изображения.",
-                    parse_mode="Markdown"
-                )
-                
-        except Exception as e:
-            logger.error(f"Ошибка загрузки изображения: {e}")
+    if message.photo and image_storage:
+        # Берем наименьший размер, достаточный для показа (не оригинал)
+        photo = select_photo_size(message.photo, IMAGE_MAX_SIDE)
+        # Повторно присланное фото сразу берется из кэша, новое загружается в фоне
+        image = await image_cache.get_image(photo.file_unique_id)
             
     elif message.text and message.text != "/skip":
         # Если отправлена ссылка вместо фото
-        await send_message_with_menu_photo(
+        await render_menu_panel(
             message,
             "❌ **Неверный формат**\n\n"
             "Пожалуйста, отправьте изображение как фото, а не как ссылку.",
@@ -528,16 +635,33 @@ async def add_project_image(message: Message, state: FSMContext):
         )
         return
     
+    image_url = image['url'] if image else None
+    image_pending = photo is not None and not image
+    
     # Получаем данные и создаем проект
     data = await state.get_data()
     
     try:
-        project_id = await db.add_project(
-            title=data['title'],
-            description=data.get('description'),
-            project_url=data.get('project_url'),
-            image_url=image_url
-        )
+        # Проект и задача загрузки изображения создаются атомарно
+        job_id = None
+        async with db.transaction():
+            project_id = await db.add_project(
+                title=data['title'],
+                description=data.get('description'),
+                project_url=data.get('project_url'),
+                image_url=image_url,
+                thumbnail_url=image['thumbnail_url'] if image else None,
+                image_pending=image_pending
+            )
+            if image_pending:
+                job_id = await job_queue.create(PROJECT_IMAGE_JOB, {
+                    'project_id': project_id,
+                    'file_id': photo.file_id,
+                    'file_unique_id': photo.file_unique_id,
+                    'name': f"project_{message.from_user.id}_{photo.file_id}",
+                    'chat_id': message.chat.id,
+                })
+        await portfolio.refresh(project_id)
         
         # Показываем итоговый результат
         result_text = "✅ **Проект успешно добавлен!**\n\n"
@@ -556,17 +680,32 @@ async def add_project_image(message: Message, state: FSMContext):
             
         if image_url:
             result_text += f"🖼️ Изображение: загружено\n"
+        elif image_pending:
+            result_text += "⏳ Изображение: загружается...\n"
         
-        await send_message_with_menu_photo(
-            message,
-            result_text,
-            reply_markup=get_back_to_main_menu(),
-            parse_mode="Markdown"
-        )
+        result_message_id = None
+        try:
+            result_message_id = await render_menu_panel(
+                message,
+                result_text,
+                reply_markup=get_back_to_main_menu(),
+                parse_mode="Markdown"
+            )
+        finally:
+            if job_id:
+                # Когда загрузка завершится, воркер обновит это же сообщение
+                # (задача запускается, даже если сообщение не удалось отправить)
+                base_text = result_text.replace("⏳ Изображение: загружается...\n", "")
+                await job_queue.submit(
+                    job_id,
+                    message_id=result_message_id,
+                    success_text=base_text + "🖼️ Изображение: загружено\n",
+                    failure_text=base_text + "❌ Изображение: не удалось загрузить\n"
+                )
         
     except Exception as e:
         logger.error(f"Ошибка добавления проекта: {e}")
-        await send_message_with_menu_photo(
+        await render_menu_panel(
             message,
             "❌ Произошла ошибка при добавлении проекта.",
             reply_markup=get_back_to_main_menu()
@@ -577,12 +716,8 @@ async def add_project_image(message: Message, state: FSMContext):
 # Редактирование проекта
 @router.callback_query(F.data.startswith("edit_project_") & ~F.data.startswith("edit_project_url_"))
 async def edit_project_menu(callback: CallbackQuery, state: FSMContext):
-    if not await is_admin_user(callback.from_user.id):
-        await callback.answer("❌ Нет доступа!", show_alert=True)
-        return
-    
     project_id = int(callback.data.split("_")[2])
-    project = await db.get_project(project_id)
+    project = await portfolio.get(project_id)
     
     if not project:
         await callback.answer("❌ Проект не найден!", show_alert=True)
@@ -603,12 +738,8 @@ async def edit_project_menu(callback: CallbackQuery, state: FSMContext):
 # Удаление проекта
 @router.callback_query(F.data.startswith("delete_project_"))
 async def delete_project_confirm(callback: CallbackQuery):
-    if not await is_admin_user(callback.from_user.id):
-        await callback.answer("❌ Нет доступа!", show_alert=True)
-        return
-    
     project_id = int(callback.data.split("_")[2])
-    project = await db.get_project(project_id)
+    project = await portfolio.get(project_id)
     
     if not project:
         await callback.answer("❌ Проект не найден!", show_alert=True)
@@ -627,13 +758,12 @@ async def delete_project_confirm(callback: CallbackQuery):
 
 @router.callback_query(F.data.regexp(r"^confirm_delete_\d+$"))
 async def delete_project_final(callback: CallbackQuery):
-    if not await is_admin_user(callback.from_user.id):
-        await callback.answer("❌ Нет доступа!", show_alert=True)
-        return
-    
     project_id = int(callback.data.split("_")[2])
     
-    if await db.delete_project(project_id):
+    project = await db.delete_project(project_id)
+    await portfolio.refresh(project_id)
+    if project:
+        await schedule_orphan_cleanup(project['image_url'], project['thumbnail_url'])
         await edit_message_with_menu_photo(
             callback,
             "✅ Проект успешно удален!",
@@ -651,10 +781,6 @@ async def delete_project_final(callback: CallbackQuery):
 # Редактирование названия
 @router.callback_query(F.data.startswith("edit_title_"))
 async def edit_title_start(callback: CallbackQuery, state: FSMContext):
-    if not await is_admin_user(callback.from_user.id):
-        await callback.answer("❌ Нет доступа!", show_alert=True)
-        return
-    
     project_id = int(callback.data.split("_")[2])
     await state.update_data(project_id=project_id)
     await state.set_state(ProjectStates.editing_title)
@@ -673,10 +799,6 @@ async def edit_title_start(callback: CallbackQuery, state: FSMContext):
 
 @router.message(StateFilter(ProjectStates.editing_title))
 async def edit_title_save(message: Message, state: FSMContext):
-    if not await is_admin_user(message.from_user.id):
-        await send_message_with_menu_photo(message, "❌ Нет доступа!")
-        return
-    
     # Удаляем предыдущие сообщения
     await delete_previous_messages(message, state)
     
@@ -684,8 +806,9 @@ async def edit_title_save(message: Message, state: FSMContext):
     project_id = data['project_id']
     
     if await db.update_project(project_id, title=message.text):
+        await portfolio.refresh(project_id)
         title_escaped = escape_markdown(message.text)
-        await send_message_with_menu_photo(
+        await render_menu_panel(
             message,
             f"✅ Название проекта обновлено!\n\n"
             f"📄 Новое название: {title_escaped}",
@@ -693,7 +816,7 @@ async def edit_title_save(message: Message, state: FSMContext):
             parse_mode="Markdown"
         )
     else:
-        await send_message_with_menu_photo(
+        await render_menu_panel(
             message,
             "❌ Ошибка при обновлении названия.",
             reply_markup=get_back_to_main_menu()
@@ -704,10 +827,6 @@ async def edit_title_save(message: Message, state: FSMContext):
 # Редактирование ссылки на проект
 @router.callback_query(F.data.startswith("edit_project_url_"))
 async def edit_project_url_start(callback: CallbackQuery, state: FSMContext):
-    if not await is_admin_user(callback.from_user.id):
-        await callback.answer("❌ Нет доступа!", show_alert=True)
-        return
-    
     project_id = int(callback.data.split("_")[3])
     await state.update_data(project_id=project_id)
     await state.set_state(ProjectStates.editing_project_url)
@@ -726,10 +845,6 @@ async def edit_project_url_start(callback: CallbackQuery, state: FSMContext):
 
 @router.message(StateFilter(ProjectStates.editing_project_url))
 async def edit_project_url_save(message: Message, state: FSMContext):
-    if not await is_admin_user(message.from_user.id):
-        await send_message_with_menu_photo(message, "❌ Нет доступа!")
-        return
-    
     # Удаляем предыдущие сообщения
     await delete_previous_messages(message, state)
     
@@ -737,8 +852,9 @@ async def edit_project_url_save(message: Message, state: FSMContext):
     project_id = data['project_id']
     
     if await db.update_project(project_id, project_url=message.text):
+        await portfolio.refresh(project_id)
         url_escaped = escape_markdown(message.text)
-        await send_message_with_menu_photo(
+        await render_menu_panel(
             message,
             f"✅ Ссылка на проект обновлена!\n\n"
             f"🔗 Новая ссылка: {url_escaped}",
@@ -746,7 +862,7 @@ async def edit_project_url_save(message: Message, state: FSMContext):
             parse_mode="Markdown"
         )
     else:
-        await send_message_with_menu_photo(
+        await render_menu_panel(
             message,
             "❌ Ошибка при обновлении ссылки.",
             reply_markup=get_back_to_main_menu()
@@ -757,10 +873,6 @@ async def edit_project_url_save(message: Message, state: FSMContext):
 # Редактирование описания проекта
 @router.callback_query(F.data.startswith("edit_description_"))
 async def edit_description_start(callback: CallbackQuery, state: FSMContext):
-    if not await is_admin_user(callback.from_user.id):
-        await callback.answer("❌ Нет доступа!", show_alert=True)
-        return
-    
     project_id = int(callback.data.split("_")[2])
     await state.update_data(project_id=project_id)
     await state.set_state(ProjectStates.editing_description)
@@ -779,10 +891,6 @@ async def edit_description_start(callback: CallbackQuery, state: FSMContext):
 
 @router.message(StateFilter(ProjectStates.editing_description))
 async def edit_description_save(message: Message, state: FSMContext):
-    if not await is_admin_user(message.from_user.id):
-        await send_message_with_menu_photo(message, "❌ Нет доступа!")
-        return
-    
     # Удаляем предыдущие сообщения
     await delete_previous_messages(message, state)
     
@@ -790,8 +898,9 @@ async def edit_description_save(message: Message, state: FSMContext):
     project_id = data['project_id']
     
     if await db.update_project(project_id, description=message.text):
+        await portfolio.refresh(project_id)
         desc_escaped = escape_markdown(message.text[:100] + ('...' if len(message.text) > 100 else ''))
-        await send_message_with_menu_photo(
+        await render_menu_panel(
             message,
             f"✅ Описание проекта обновлено!\n\n"
             f"📝 Новое описание: {desc_escaped}",
@@ -799,7 +908,7 @@ async def edit_description_save(message: Message, state: FSMContext):
             parse_mode="Markdown"
         )
     else:
-        await send_message_with_menu_photo(
+        await render_menu_panel(
             message,
             "❌ Ошибка при обновлении описания.",
             reply_markup=get_back_to_main_menu()
@@ -810,10 +919,6 @@ async def edit_description_save(message: Message, state: FSMContext):
 # Редактирование изображения проекта
 @router.callback_query(F.data.startswith("edit_image_"))
 async def edit_image_start(callback: CallbackQuery, state: FSMContext):
-    if not await is_admin_user(callback.from_user.id):
-        await callback.answer("❌ Нет доступа!", show_alert=True)
-        return
-    
     project_id = int(callback.data.split("_")[2])
     await state.update_data(project_id=project_id)
     await state.set_state(ProjectStates.editing_image)
@@ -832,70 +937,16 @@ async def edit_image_start(callback: CallbackQuery, state: FSMContext):
 
 @router.message(StateFilter(ProjectStates.editing_image))
 async def edit_image_save(message: Message, state: FSMContext):
-    if not await is_admin_user(message.from_user.id):
-        await send_message_with_menu_photo(message, "❌ Нет доступа!")
-        return
-    
     # Удаляем предыдущие сообщения
     await delete_previous_messages(message, state)
     
     data = await state.get_data()
     project_id = data['project_id']
     
-    image_url = None
-    
     # Проверяем, отправил ли пользователь фото
-    if message.photo and imgbb_uploader:
-        try:
-            # Показываем прогресс загрузки
-            progress_message = await send_message_with_menu_photo(
-                message,
-                "📤 **Загрузка изображения...**\n\nПожалуйста, подождите.",
-                parse_mode="Markdown"
-            )
-            
-            # Получаем самое большое фото
-            photo = message.photo[-1]
-            
-            # Загружаем в imgbb
-            image_url = await imgbb_uploader.upload_from_telegram_photo(
-                message.bot, 
-                photo.file_id, 
-                f"project_edit_{project_id}_{photo.file_id}"
-            )
-            
-            # Удаляем сообщение о загрузке
-            if hasattr(progress_message, 'message_id'):
-                try:
-                    await message.bot.delete_message(message.chat.id, progress_message.message_id)
-                except:
-                    pass
-                    
-            if not image_url:
-                await send_message_with_menu_photo(
-                    message,
-                    "❌ **Ошибка загрузки изображения**\n\n"
-                    "Не удалось загрузить изображение. Попробуйте еще раз.",
-                    reply_markup=get_back_to_main_menu(),
-                    parse_mode="Markdown"
-                )
-                await state.clear()
-                return
-                
-        except Exception as e:
-            logger.error(f"Ошибка загрузки изображения: {e}")
-            await send_message_with_menu_photo(
-                message,
-                "❌ **Ошибка загрузки изображения**\n\n"
-                "Произошла ошибка при загрузке. Попробуйте еще раз.",
-                reply_markup=get_back_to_main_menu(),
-                parse_mode="Markdown"
-            )
-            await state.clear()
-            return
-    else:
+    if not (message.photo and image_storage):
         # Если не отправлено фото
-        await send_message_with_menu_photo(
+        await render_menu_panel(
             message,
             "❌ **Неверный формат**\n\n"
             "Пожалуйста, отправьте изображение как фото.",
@@ -904,38 +955,88 @@ async def edit_image_save(message: Message, state: FSMContext):
         )
         return
     
-    # Обновляем проект
-    if await db.update_project(project_id, image_url=image_url):
-        await send_message_with_menu_photo(
-            message,
-            "✅ **Изображение проекта обновлено!**\n\n"
-            "🖼️ Новое изображение успешно загружено.",
-            reply_markup=get_back_to_main_menu(),
-            parse_mode="Markdown"
-        )
-    else:
-        await send_message_with_menu_photo(
+    # Берем наименьший размер, достаточный для показа (не оригинал)
+    photo = select_photo_size(message.photo, IMAGE_MAX_SIDE)
+    image = await image_cache.get_image(photo.file_unique_id)
+    
+    if image:
+        # Фото уже загружалось раньше - обновляем проект сразу
+        old = await db.replace_project_image(project_id, image['url'],
+                                             image['thumbnail_url'] or image['url'])
+        if old:
+            await portfolio.refresh(project_id)
+            await schedule_orphan_cleanup(old['old_image_url'], old['old_thumbnail_url'])
+            await render_menu_panel(
+                message,
+                "✅ **Изображение проекта обновлено!**\n\n"
+                "🖼️ Новое изображение успешно загружено.",
+                reply_markup=get_back_to_main_menu(),
+                parse_mode="Markdown"
+            )
+        else:
+            await render_menu_panel(
+                message,
+                "❌ Ошибка при обновлении изображения в базе данных.",
+                reply_markup=get_back_to_main_menu()
+            )
+        await state.clear()
+        return
+    
+    # Новое фото загружается в фоне, старое изображение остается до завершения загрузки
+    job_id = None
+    try:
+        async with db.transaction():
+            if await db.update_project(project_id, image_pending=True):
+                job_id = await job_queue.create(PROJECT_IMAGE_JOB, {
+                    'project_id': project_id,
+                    'file_id': photo.file_id,
+                    'file_unique_id': photo.file_unique_id,
+                    'name': f"project_edit_{project_id}_{photo.file_id}",
+                    'chat_id': message.chat.id,
+                })
+    except Exception as e:
+        logger.error(f"Ошибка постановки загрузки изображения в очередь: {e}")
+    if job_id:
+        await portfolio.refresh(project_id)
+    
+    if not job_id:
+        await render_menu_panel(
             message,
             "❌ Ошибка при обновлении изображения в базе данных.",
             reply_markup=get_back_to_main_menu()
         )
+        await state.clear()
+        return
     
-    await state.clear()
+    progress_message_id = None
+    try:
+        progress_message_id = await render_menu_panel(
+            message,
+            "📤 **Изображение загружается...**\n\n"
+            "Это сообщение обновится, когда загрузка завершится.",
+            reply_markup=get_back_to_main_menu(),
+            parse_mode="Markdown"
+        )
+    finally:
+        # Задача запускается, даже если сообщение о загрузке не удалось отправить
+        await job_queue.submit(
+            job_id,
+            message_id=progress_message_id,
+            success_text="✅ **Изображение проекта обновлено!**\n\n"
+                         "🖼️ Новое изображение успешно загружено.",
+            failure_text="❌ **Ошибка загрузки изображения**\n\n"
+                         "Не удалось загрузить изображение. Попробуйте еще раз."
+        )
+        await state.clear()
 
 # Команда для добавления админа (супер-секретная)
 @router.message(Command("add_admin"))
-async def add_admin_command(message: Message):
+async def add_admin_command(message: Message, is_admin: bool):
     # Эта команда доступна только если в базе вообще нет админов
     # или если команду вызывает уже существующий админ
-    admin_ids = await db.get_admin_telegram_ids()
-    
-    # Убеждаемся что admin_ids это список
-    if not isinstance(admin_ids, list):
-        admin_ids = []
-    
     user_id = str(message.from_user.id)
     
-    if admin_ids and user_id not in admin_ids:
+    if not is_admin and await db.get_admin_telegram_ids():
         await send_message_with_menu_photo(message, "❌ У вас нет прав для добавления админов!")
         return
     
@@ -977,10 +1078,6 @@ async def cancel_operation(callback: CallbackQuery, state: FSMContext):
 # Управление админами - главное меню
 @router.callback_query(F.data == "manage_admins")
 async def manage_admins(callback: CallbackQuery):
-    if not await is_admin_user(callback.from_user.id):
-        await callback.answer("❌ Нет доступа!", show_alert=True)
-        return
-    
     admin_ids = await db.get_admin_telegram_ids()
     
     # Формируем текст со списком админов
@@ -1005,10 +1102,6 @@ async def manage_admins(callback: CallbackQuery):
 # Редактирование админов - показать список
 @router.callback_query(F.data == "edit_admins")
 async def edit_admins(callback: CallbackQuery):
-    if not await is_admin_user(callback.from_user.id):
-        await callback.answer("❌ Нет доступа!", show_alert=True)
-        return
-    
     admin_ids = await db.get_admin_telegram_ids()
     
     if not admin_ids:
@@ -1034,10 +1127,6 @@ async def edit_admins(callback: CallbackQuery):
 # Редактирование конкретного админа
 @router.callback_query(F.data.startswith("edit_admin_"))
 async def edit_admin_start(callback: CallbackQuery, state: FSMContext):
-    if not await is_admin_user(callback.from_user.id):
-        await callback.answer("❌ Нет доступа!", show_alert=True)
-        return
-    
     admin_index = int(callback.data.split("_")[2])
     admin_ids = await db.get_admin_telegram_ids()
     
@@ -1064,10 +1153,6 @@ async def edit_admin_start(callback: CallbackQuery, state: FSMContext):
 # Сохранение изменений админа
 @router.message(StateFilter(AdminStates.editing_admin))
 async def edit_admin_save(message: Message, state: FSMContext):
-    if not await is_admin_user(message.from_user.id):
-        await send_message_with_menu_photo(message, "❌ Нет доступа!")
-        return
-    
     # Удаляем предыдущие сообщения
     await delete_previous_messages(message, state)
     
@@ -1078,7 +1163,7 @@ async def edit_admin_save(message: Message, state: FSMContext):
     
     # Проверяем валидность ID (должен быть числом)
     if not new_admin_id.isdigit():
-        new_message = await send_message_with_menu_photo(
+        new_message_id = await render_menu_panel(
             message,
             "❌ **Ошибка!**\n\n"
             "Telegram ID должен содержать только цифры.\n\n"
@@ -1087,14 +1172,14 @@ async def edit_admin_save(message: Message, state: FSMContext):
             reply_markup=get_cancel_menu(),
             parse_mode="Markdown"
         )
-        await save_bot_message_id(state, new_message.message_id)
+        await save_bot_message_id(state, new_message_id)
         return
     
     # Обновляем админа
     success = await db.update_admin_telegram_id(admin_index, new_admin_id)
     
     if success:
-        await send_message_with_menu_photo(
+        await render_menu_panel(
             message,
             f"✅ **Администратор обновлен!**\n\n"
             f"🔄 Изменено: {current_admin_id} → {new_admin_id}",
@@ -1102,7 +1187,7 @@ async def edit_admin_save(message: Message, state: FSMContext):
             parse_mode="Markdown"
         )
     else:
-        await send_message_with_menu_photo(
+        await render_menu_panel(
             message,
             f"❌ **Ошибка обновления!**\n\n"
             f"Не удалось обновить администратора.",
@@ -1115,10 +1200,6 @@ async def edit_admin_save(message: Message, state: FSMContext):
 # Добавление нового админа
 @router.callback_query(F.data == "add_admin")
 async def add_admin_start(callback: CallbackQuery, state: FSMContext):
-    if not await is_admin_user(callback.from_user.id):
-        await callback.answer("❌ Нет доступа!", show_alert=True)
-        return
-    
     await state.set_state(AdminStates.adding_admin)
     
     await edit_message_with_menu_photo(
@@ -1135,10 +1216,6 @@ async def add_admin_start(callback: CallbackQuery, state: FSMContext):
 # Сохранение нового админа
 @router.message(StateFilter(AdminStates.adding_admin))
 async def add_admin_save(message: Message, state: FSMContext):
-    if not await is_admin_user(message.from_user.id):
-        await send_message_with_menu_photo(message, "❌ Нет доступа!")
-        return
-    
     # Удаляем предыдущие сообщения
     await delete_previous_messages(message, state)
     
@@ -1146,7 +1223,7 @@ async def add_admin_save(message: Message, state: FSMContext):
     
     # Проверяем валидность ID (должен быть числом)
     if not new_admin_id.isdigit():
-        new_message = await send_message_with_menu_photo(
+        new_message_id = await render_menu_panel(
             message,
             "❌ **Ошибка!**\n\n"
             "Telegram ID должен содержать только цифры.\n\n"
@@ -1154,13 +1231,12 @@ async def add_admin_save(message: Message, state: FSMContext):
             reply_markup=get_cancel_menu(),
             parse_mode="Markdown"
         )
-        await save_bot_message_id(state, new_message.message_id)
+        await save_bot_message_id(state, new_message_id)
         return
     
     # Проверяем, не существует ли уже такой админ
-    current_admins = await db.get_admin_telegram_ids()
-    if new_admin_id in current_admins:
-        await send_message_with_menu_photo(
+    if await db.is_admin(new_admin_id):
+        await render_menu_panel(
             message,
             f"⚠️ **Администратор уже существует!**\n\n"
             f"ID {new_admin_id} уже есть в списке администраторов.",
@@ -1174,7 +1250,7 @@ async def add_admin_save(message: Message, state: FSMContext):
     success = await db.add_admin_telegram_id(new_admin_id)
     
     if success:
-        await send_message_with_menu_photo(
+        await render_menu_panel(
             message,
             f"✅ **Администратор добавлен!**\n\n"
             f"🆕 Новый админ: {new_admin_id}",
@@ -1182,7 +1258,7 @@ async def add_admin_save(message: Message, state: FSMContext):
             parse_mode="Markdown"
         )
     else:
-        await send_message_with_menu_photo(
+        await render_menu_panel(
             message,
             f"❌ **Ошибка добавления!**\n\n"
             f"Не удалось добавить администратора.",
@@ -1195,10 +1271,6 @@ async def add_admin_save(message: Message, state: FSMContext):
 # Удаление админа - показать список
 @router.callback_query(F.data == "delete_admin")
 async def delete_admin(callback: CallbackQuery):
-    if not await is_admin_user(callback.from_user.id):
-        await callback.answer("❌ Нет доступа!", show_alert=True)
-        return
-    
     admin_ids = await db.get_admin_telegram_ids()
     
     if not admin_ids:
@@ -1237,10 +1309,6 @@ async def delete_admin(callback: CallbackQuery):
 # Подтверждение удаления конкретного админа
 @router.callback_query(F.data.regexp(r"^delete_admin_\d+$"))
 async def delete_admin_confirm(callback: CallbackQuery):
-    if not await is_admin_user(callback.from_user.id):
-        await callback.answer("❌ Нет доступа!", show_alert=True)
-        return
-    
     admin_index = int(callback.data.split("_")[2])
     admin_ids = await db.get_admin_telegram_ids()
     
@@ -1277,10 +1345,6 @@ async def delete_admin_confirm(callback: CallbackQuery):
 # Финальное удаление админа
 @router.callback_query(F.data.startswith("confirm_delete_admin_"))
 async def delete_admin_final(callback: CallbackQuery):
-    if not await is_admin_user(callback.from_user.id):
-        await callback.answer("❌ Нет доступа!", show_alert=True)
-        return
-    
     admin_index = int(callback.data.split("_")[3])
     admin_ids = await db.get_admin_telegram_ids()
     
@@ -0,0 +1,179 @@
+"""
+Кэш загруженных изображений: повторно присланное фото не скачивается и не загружается заново
+"""
+import asyncio
+import hashlib
+import logging
+from collections import OrderedDict
+from typing import Optional, Dict
+
+from aiogram.types import Message
+
+from config import image_storage, IMAGE_CACHE_SIZE
+from database import db, PHOTO_FILE_IDS_CHANNEL, IMAGE_CACHE_CHANNEL
+from jobs import job_queue
+
+logger = logging.getLogger(__name__)
+
+class ImageCache:
+    """LRU в памяти поверх таблицы image_cache (file_unique_id / SHA-256 -> URL и миниатюра)"""
+    
+    def __init__(self, max_size: int = 1024):
+        self.max_size = max_size
+        self._images: "OrderedDict[str, Dict[str, Optional[str]]]" = OrderedDict()
+        # Растет при удалении изображений: прочитанное из БД до этого в LRU не попадает
+        self._generation = 0
+        db.add_notify_handler(IMAGE_CACHE_CHANNEL, self._on_changed)
+    
+    def _on_changed(self, conn, pid, channel, payload):
+        """Обработчик NOTIFY: изображение удалено из хранилища"""
+        if payload is None:
+            self._generation += 1
+            self._images.clear()
+        else:
+            self.forget_urls([payload])
+    
+    def forget_urls(self, urls):
+        """Удалить из LRU записи, ссылающиеся на указанные URL"""
+        urls = set(urls)
+        self._generation += 1
+        for file_unique_id, image in list(self._images.items()):
+            if image['url'] in urls or image.get('thumbnail_url') in urls:
+                del self._images[file_unique_id]
+    
+    def _remember(self, file_unique_id: str, image: Dict[str, Optional[str]]):
+        """Сохранить изображение в LRU с ограничением размера"""
+        self._images[file_unique_id] = image
+        self._images.move_to_end(file_unique_id)
+        while len(self._images) > self.max_size:
+            self._images.popitem(last=False)
+    
+    async def get_image(self, file_unique_id: str) -> Optional[Dict[str, Optional[str]]]:
+        """Найти уже загруженное изображение по file_unique_id: {'url', 'thumbnail_url'}"""
+        image = self._images.get(file_unique_id)
+        if image:
+            self._images.move_to_end(file_unique_id)
+            return image
+        
+        generation = self._generation
+        image = await db.get_cached_image(file_unique_id)
+        if image and generation != self._generation:
+            # Пока шел запрос, изображения удалялись - перечитываем
+            image = await db.get_cached_image(file_unique_id)
+            generation = self._generation
+        if image and generation == self._generation:
+            self._remember(file_unique_id, image)
+        return image
+    
+    async def upload_telegram_photo(self, bot, file_id: str, file_unique_id: str,
+                                    name: str) -> Optional[Dict[str, Optional[str]]]:
+        """Получить изображение из Telegram ({'url', 'thumbnail_url'}): из кэша или загрузив его"""
+        image = await self.get_image(file_unique_id)
+        if image:
+            logger.info(f"Изображение {file_unique_id} найдено в кэше")
+            return image
+        
+        if not image_storage:
+            return None
+        
+        async def find_existing(sha256: str):
+            image = await db.get_cached_image_by_sha256(sha256)
+            return (image['url'], image['thumbnail_url']) if image else None
+        
+        hasher = hashlib.sha256()
+        if image_storage.preprocess_enabled:
+            # Уменьшаем и пережимаем изображение перед загрузкой, делаем миниатюру.
+            # Хэш считается по скачанным байтам до загрузки: дубликат не загружается
+            result = await image_storage.upload_processed_from_telegram_photo(
+                bot, file_id, name, hasher=hasher, find_existing=find_existing
+            )
+            if not result:
+                return None
+            url, thumbnail_url = result
+        else:
+            # Хэш считается по ходу потоковой загрузки, без отдельного чтения файла
+            url = await image_storage.upload_from_telegram_photo(bot, file_id, name, hasher=hasher)
+            if not url:
+                return None
+            thumbnail_url = None
+        
+        # Если такое содержимое уже загружалось, используем прежние URL
+        image = await db.save_cached_image(file_unique_id, hasher.hexdigest(), url, thumbnail_url)
+        self._remember(file_unique_id, image)
+        if image['url'] != url:
+            # Дубликат обнаружен только после загрузки (потоковый режим) - лишняя копия не нужна
+            await schedule_orphan_cleanup(url, thumbnail_url)
+        return image
+
+class PhotoFileIdCache:
+    """file_id Telegram для URL изображений: после первой отправки фото шлется по file_id.
+    
+    Telegram не скачивает изображение с хостинга повторно. Кэш хранится в таблице
+    photo_file_ids; триггеры БД удаляют запись, когда меняется image_url проекта или
+    menu_photo, и рассылают NOTIFY, по которому запись удаляется из памяти.
+    """
+    
+    def __init__(self):
+        self._file_ids: Dict[str, str] = {}
+        db.add_notify_handler(PHOTO_FILE_IDS_CHANNEL, self._on_changed)
+    
+    async def load(self):
+        """Загрузить сохраненные file_id из БД (при запуске бота)"""
+        self._file_ids = await db.get_photo_file_ids()
+        logger.info(f"Загружено {len(self._file_ids)} file_id изображений")
+    
+    def _on_changed(self, conn, pid, channel, payload):
+        """Обработчик NOTIFY: URL изменился или удален"""
+        if payload is None:
+            # Уведомления могли быть пропущены - перечитываем кэш целиком
+            self._file_ids.clear()
+            asyncio.get_running_loop().create_task(self.load())
+        else:
+            self._file_ids.pop(payload, None)
+    
+    def resolve(self, url: str) -> str:
+        """Вернуть file_id для URL, если он известен, иначе сам URL"""
+        return self._file_ids.get(url, url)
+    
+    async def remember(self, url: str, message) -> None:
+        """Запомнить file_id фото из отправленного/отредактированного сообщения"""
+        if not isinstance(message, Message) or not message.photo:
+            return
+        file_id = message.photo[-1].file_id
+        if self._file_ids.get(url) == file_id:
+            return
+        self._file_ids[url] = file_id
+        await db.save_photo_file_id(url, file_id)
+    
+    async def forget(self, url: str) -> None:
+        """Удалить file_id (например, если Telegram его больше не принимает)"""
+        if self._file_ids.pop(url, None) is not None:
+            await db.delete_photo_file_id(url)
+
+# Удаление изображений, на которые больше ничего не ссылается
+DELETE_IMAGES_JOB = "delete_images"
+
+async def schedule_orphan_cleanup(*urls: Optional[str]):
+    """Поставить в очередь удаление изображений, если они больше не используются"""
+    urls = sorted({url for url in urls if url})
+    if urls and image_storage:
+        await job_queue.enqueue(DELETE_IMAGES_JOB, {'urls': urls})
+
+async def delete_orphaned_images(bot, payload: dict):
+    """Задача: удалить из хранилища изображения, на которые не ссылаются проекты и настройки"""
+    # Проверка ссылок и удаление из кэша загрузок - одной транзакцией: удаляются из хранилища
+    # только URL, которые она вернула, и повторное фото уже не получит удаляемый URL
+    orphaned = await db.delete_unreferenced_images(payload['urls'])
+    if not orphaned:
+        return
+    image_cache.forget_urls(orphaned)
+    
+    for url in orphaned:
+        await image_storage.delete(url)
+    logger.info(f"Удалено неиспользуемых изображений: {len(orphaned)}")
+
+job_queue.register(DELETE_IMAGES_JOB, delete_orphaned_images)
+
+# Глобальные экземпляры кэшей изображений
+image_cache = ImageCache(IMAGE_CACHE_SIZE)
+photo_file_ids = PhotoFileIdCache()
@@ -0,0 +1,143 @@
+"""
+Очередь фоновых задач: asyncio-воркеры поверх таблицы jobs (восстановление после перезапуска)
+"""
+import asyncio
+import logging
+from typing import Optional, Dict, Any, Callable, Awaitable
+
+from config import JOB_WORKERS, JOB_MAX_ATTEMPTS, JOB_RETRY_DELAY, JOB_LEASE_SECONDS
+from database import db
+
+logger = logging.getLogger(__name__)
+
+JobHandler = Callable[[Any, Dict[str, Any]], Awaitable[None]]
+JobFailureHandler = Callable[[Any, Dict[str, Any], Exception], Awaitable[None]]
+
+class JobQueue:
+    """Очередь задач с пулом воркеров и повторами с экспоненциальной задержкой.
+    
+    Задача сначала записывается в таблицу jobs (create), затем передается воркерам
+    (submit). Незавершенные задачи подхватываются при следующем запуске бота.
+    """
+    
+    def __init__(self, workers: int = 2, max_attempts: int = 5,
+                 retry_delay: float = 5.0, lease_seconds: float = 300.0):
+        self.workers = workers
+        self.max_attempts = max_attempts
+        self.retry_delay = retry_delay
+        self.lease_seconds = lease_seconds
+        self._handlers: Dict[str, JobHandler] = {}
+        self._failure_handlers: Dict[str, JobFailureHandler] = {}
+        self._queue: Optional[asyncio.Queue] = None
+        self._tasks = []
+        self._timers = set()
+        self._bot = None
+    
+    def register(self, kind: str, handler: JobHandler, on_failure: JobFailureHandler = None):
+        """Зарегистрировать обработчик задач вида kind (on_failure - после последней попытки)"""
+        self._handlers[kind] = handler
+        if on_failure:
+            self._failure_handlers[kind] = on_failure
+    
+    async def start(self, bot):
+        """Запустить воркеры и поставить в очередь незавершенные задачи"""
+        self._bot = bot
+        self._queue = asyncio.Queue()
+        self._tasks = [asyncio.create_task(self._worker()) for _ in range(self.workers)]
+        
+        for job in await db.get_recoverable_jobs():
+            self._schedule(job['id'], job['delay'])
+        logger.info(f"Очередь задач запущена: {self.workers} воркеров")
+    
+    async def stop(self):
+        """Остановить воркеры (незавершенные задачи остаются в БД)"""
+        for timer in self._timers:
+            timer.cancel()
+        self._timers.clear()
+        for task in self._tasks:
+            task.cancel()
+        await asyncio.gather(*self._tasks, return_exceptions=True)
+        self._tasks = []
+    
+    async def create(self, kind: str, payload: Dict[str, Any]) -> int:
+        """Записать задачу в БД (можно внутри db.transaction()), не запуская ее"""
+        return await db.create_job(kind, payload)
+    
+    async def submit(self, job_id: int, **payload_updates):
+        """Передать созданную задачу воркерам, при необходимости дополнив ее данные.
+        Задача запускается, даже если дополнить данные не удалось"""
+        try:
+            if payload_updates:
+                await db.update_job_payload(job_id, payload_updates)
+        finally:
+            self._schedule(job_id, 0)
+    
+    async def enqueue(self, kind: str, payload: Dict[str, Any]) -> int:
+        """Создать задачу и сразу передать ее воркерам"""
+        job_id = await self.create(kind, payload)
+        self._schedule(job_id, 0)
+        return job_id
+    
+    def _schedule(self, job_id: int, delay: float):
+        """Поставить задачу в очередь воркеров через delay секунд"""
+        if self._queue is None:
+            # Очередь не запущена: задача будет подхвачена при следующем старте
+            return
+        if delay <= 0:
+            self._queue.put_nowait(job_id)
+            return
+        
+        def put():
+            self._timers.discard(timer)
+            self._queue.put_nowait(job_id)
+        
+        timer = asyncio.get_running_loop().call_later(delay, put)
+        self._timers.add(timer)
+    
+    async def _worker(self):
+        """Воркер: выполняет задачи из очереди"""
+        while True:
+            job_id = await self._queue.get()
+            try:
+                await self._run(job_id)
+            except Exception as e:
+                logger.error(f"Ошибка обработки задачи {job_id}: {e}")
+            finally:
+                self._queue.task_done()
+    
+    async def _run(self, job_id: int):
+        """Выполнить задачу с повтором при ошибке"""
+        job = await db.claim_job(job_id, self.lease_seconds)
+        if not job:
+            return
+        
+        handler = self._handlers.get(job['kind'])
+        if not handler:
+            await db.fail_job(job_id, f"Нет обработчика для задач вида {job['kind']}")
+            return
+        
+        try:
+            await handler(self._bot, job['payload'])
+        except Exception as e:
+            if job['attempts'] >= self.max_attempts:
+                logger.error(f"Задача {job_id} ({job['kind']}) не выполнена: {e}")
+                await db.fail_job(job_id, str(e))
+                on_failure = self._failure_handlers.get(job['kind'])
+                if on_failure:
+                    await on_failure(self._bot, job['payload'], e)
+            else:
+                delay = self.retry_delay * 2 ** (job['attempts'] - 1)
+                logger.warning(f"Задача {job_id} ({job['kind']}): ошибка {e}, повтор через {delay:.0f} с")
+                await db.retry_job(job_id, delay, str(e))
+                self._schedule(job_id, delay)
+            return
+        
+        await db.complete_job(job_id)
+
+# Глобальная очередь фоновых задач
+job_queue = JobQueue(
+    workers=JOB_WORKERS,
+    max_attempts=JOB_MAX_ATTEMPTS,
+    retry_delay=JOB_RETRY_DELAY,
+    lease_seconds=JOB_LEASE_SECONDS
+)
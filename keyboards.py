@@ -1,16 +1,52 @@
+from datetime import datetime, timedelta
+from typing import Optional, Tuple
+
 from aiogram.types import InlineKeyboardMarkup, InlineKeyboardButton
 
+_EPOCH = datetime(1970, 1, 1)
+
+def encode_project_cursor(project: dict) -> str:
+    """Кодирует курсор пагинации (created_at, id) проекта для callback_data"""
+    micros = (project['created_at'].replace(tzinfo=None) - _EPOCH) // timedelta(microseconds=1)
+    return f"{micros}_{project['id']}"
+
+def decode_project_cursor(value: str) -> Optional[Tuple[datetime, int]]:
+    """Декодирует курсор пагинации из callback_data"""
+    try:
+        micros, project_id = value.split("_")
+        return _EPOCH + timedelta(microseconds=int(micros)), int(project_id)
+    except ValueError:
+        return None
+
+def encode_search_cursor(project: dict) -> str:
+    """Кодирует курсор страницы результатов поиска (rank, id) для callback_data"""
+    return f"{project['rank']!r}_{project['id']}"
+
+def decode_search_cursor(value: str) -> Optional[Tuple[float, int]]:
+    """Декодирует курсор страницы результатов поиска из callback_data"""
+    try:
+        rank, project_id = value.split("_")
+        return float(rank), int(project_id)
+    except ValueError:
+        return None
+
 def get_admin_menu() -> InlineKeyboardMarkup:
     """Главное меню администратора"""
     keyboard = InlineKeyboardMarkup(inline_keyboard=[
         [InlineKeyboardButton(text="📂 Просмотреть проекты", callback_data="view_projects")],
+        [InlineKeyboardButton(text="🔍 Поиск проектов", callback_data="search_projects")],
         [InlineKeyboardButton(text="➕ Добавить проект", callback_data="add_project")],
         [InlineKeyboardButton(text="🔧 Управление админами", callback_data="manage_admins")]
     ])
     return keyboard
 
-def get_projects_menu(projects_list, page: int = 0, total_pages: int = 1) -> InlineKeyboardMarkup:
-    """Меню со списком проектов с пагинацией"""
+def get_projects_menu(projects_list, page: int = 0, total_pages: int = 1,
+                      page_prefix: str = "projects_page", encode_cursor=encode_project_cursor) -> InlineKeyboardMarkup:
+    """Меню со списком проектов с пагинацией (список проектов или результаты поиска).
+    
+    Кнопки навигации несут курсор первого/последнего проекта страницы:
+    {page_prefix}_{страница}_{b|a}_{курсор}, где b - до курсора, a - после.
+    """
     keyboard = []
     
     # Добавляем проекты
@@ -27,9 +63,10 @@ def get_projects_menu(projects_list, page: int = 0, total_pages: int = 1) -> Inl
         pagination_row = []
         
         # Кнопка "Назад"
-        if page > 0:
+        if page > 0 and projects_list:
+            cursor = encode_cursor(projects_list[0])
             pagination_row.append(
-                InlineKeyboardButton(text="⬅️ Назад", callback_data=f"projects_page_{page-1}")
+                InlineKeyboardButton(text="⬅️ Назад", callback_data=f"{page_prefix}_{page-1}_b_{cursor}")
             )
         
         # Индикатор страницы
@@ -38,9 +75,10 @@ def get_projects_menu(projects_list, page: int = 0, total_pages: int = 1) -> Inl
         )
         
         # Кнопка "Вперед"
-        if page < total_pages - 1:
+        if page < total_pages - 1 and projects_list:
+            cursor = encode_cursor(projects_list[-1])
             pagination_row.append(
-                InlineKeyboardButton(text="Вперед ➡️", callback_data=f"projects_page_{page+1}")
+                InlineKeyboardButton(text="Вперед ➡️", callback_data=f"{page_prefix}_{page+1}_a_{cursor}")
             )
         
         keyboard.append(pagination_row)
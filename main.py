@@ -1,12 +1,29 @@
 import asyncio
 import logging
+import os
+import signal
+import time
 from aiogram import Bot, Dispatcher
 from aiogram.client.default import DefaultBotProperties
 from aiogram.enums import ParseMode
+from aiogram.webhook.aiohttp_server import SimpleRequestHandler
+from aiohttp import web
 
-from config import BOT_TOKEN
+from config import (
+    BOT_TOKEN, HTTP_HOST, HTTP_PORT, METRICS_ENABLED, image_storage,
+    WEBHOOK_URL, WEBHOOK_PATH, WEBHOOK_SECRET, WEBHOOK_MAX_CONNECTIONS, UPDATE_WORKERS,
+    BOT_ROLE, WORKER_INDEX, HEALTH_INTERVAL
+)
 from database import db
+from fsm_storage import fsm_storage
 from handlers import router
+from image_cache import photo_file_ids
+from jobs import job_queue
+from middlewares import throttling
+from portfolio import portfolio
+from prefetch import prefetcher
+from telegram_scheduler import telegram_scheduler
+from update_queue import update_queue
 
 # Настройка логирования
 logging.basicConfig(
@@ -15,8 +32,62 @@ logging.basicConfig(
 )
 logger = logging.getLogger(__name__)
 
-async def main():
-    """Основная функция запуска бота"""
+async def metrics(request: web.Request) -> web.Response:
+    """Счетчики бота в текстовом формате Prometheus"""
+    lines = [
+        f"codev_bot_throttle_{name} {value}"
+        for name, value in throttling.stats().items()
+    ] + [
+        f"codev_bot_telegram_{name} {value}"
+        for name, value in telegram_scheduler.stats().items()
+    ] + [
+        f"codev_bot_prefetch_{name} {value}"
+        for name, value in prefetcher.stats().items()
+    ]
+    if UPDATE_WORKERS:
+        lines += [
+            f"codev_bot_updates_{name} {value}"
+            for name, value in (await update_queue.stats()).items()
+        ]
+    return web.Response(text="\n".join(lines) + "\n")
+
+async def serve(dp: Dispatcher, bot: Bot):
+    """Прием обновлений: webhook, long polling в очередь или обычный long polling"""
+    if WEBHOOK_URL:
+        logger.info("Запуск бота в режиме webhook...")
+        await bot.set_webhook(
+            WEBHOOK_URL.rstrip("/") + WEBHOOK_PATH,
+            secret_token=WEBHOOK_SECRET,
+            max_connections=WEBHOOK_MAX_CONNECTIONS,
+            allowed_updates=dp.resolve_used_update_types()
+        )
+        # Обновления приходят в HTTP-сервер, остается ждать остановки
+        await asyncio.Event().wait()
+    else:
+        logger.info("Запуск бота...")
+        # Webhook, оставшийся от запуска в другом режиме, мешает getUpdates
+        await bot.delete_webhook()
+        if UPDATE_WORKERS:
+            await update_queue.poll(bot, dp.resolve_used_update_types())
+        else:
+            await dp.start_polling(bot, handle_signals=False)
+
+async def report_health(heartbeat):
+    """Периодический отчет супервизору о состоянии процесса"""
+    while True:
+        heartbeat.put_nowait({
+            "role": BOT_ROLE,
+            "index": WORKER_INDEX,
+            "pid": os.getpid(),
+            "time": time.time(),
+            **update_queue.counters()
+        })
+        await asyncio.sleep(HEALTH_INTERVAL)
+
+async def main(heartbeat=None):
+    """Основная функция запуска бота (heartbeat - очередь отчетов супервизору)"""
+    ingest = BOT_ROLE in ("all", "ingest")
+    process_updates = BOT_ROLE in ("all", "worker")
     
     # Создаем бота и диспетчер
     bot = Bot(
@@ -24,7 +95,13 @@ async def main():
         default=DefaultBotProperties(parse_mode=ParseMode.HTML)
     )
     
-    dp = Dispatcher()
+    # Все исходящие запросы проходят через планировщик с учетом лимитов Telegram
+    bot.session.middleware(telegram_scheduler)
+    
+    # Состояния диалогов хранятся в PostgreSQL и общие для всех экземпляров бота
+    dp = Dispatcher(storage=fsm_storage)
+    web_runner = None
+    health_task = None
     
     # Подключаем роутер с обработчиками
     dp.include_router(router)
@@ -33,16 +110,86 @@ async def main():
         # Подключаемся к базе данных
         logger.info("Подключение к базе данных...")
         await db.connect()
+        fsm_storage.start()
         
-        # Запускаем бота
-        logger.info("Запуск бота...")
-        await dp.start_polling(bot)
+        # Загружаем file_id изображений, уже отправленных в Telegram
+        await photo_file_ids.load()
+        
+        # Открываем общую HTTP-сессию для загрузки изображений
+        if image_storage:
+            await image_storage.start()
+        
+        # HTTP-сервер бота нужен для webhook, раздачи файлов хранилища (IMAGE_STORAGE=local)
+        # или метрик; в режиме нескольких процессов его запускает процесс приема обновлений
+        app = web.Application()
+        routes = list(image_storage.web_routes()) if image_storage else []
+        if METRICS_ENABLED:
+            routes.append(web.get("/metrics", metrics))
+        app.add_routes(routes)
+        if WEBHOOK_URL and UPDATE_WORKERS:
+            # Обновление записывается в очередь, Telegram получает 200, обрабатывают воркеры
+            app.router.add_post(WEBHOOK_PATH, update_queue.webhook_handler(WEBHOOK_SECRET))
+        elif WEBHOOK_URL:
+            # Telegram сразу получает 200, обновление обрабатывается в фоновой задаче
+            SimpleRequestHandler(
+                dispatcher=dp,
+                bot=bot,
+                handle_in_background=True,
+                secret_token=WEBHOOK_SECRET
+            ).register(app, path=WEBHOOK_PATH)
+        if ingest and (routes or WEBHOOK_URL):
+            web_runner = web.AppRunner(app)
+            await web_runner.setup()
+            await web.TCPSite(web_runner, HTTP_HOST, HTTP_PORT).start()
+            logger.info(f"HTTP-сервер запущен на {HTTP_HOST}:{HTTP_PORT}")
+        
+        # Запускаем фоновые воркеры (и незавершенные задачи прошлого запуска)
+        if process_updates:
+            # Проекты для просмотра портфолио держим в памяти
+            await portfolio.load()
+            await job_queue.start(bot)
+            if UPDATE_WORKERS:
+                await update_queue.start(dp, bot)
+        
+        if heartbeat is not None:
+            health_task = asyncio.create_task(report_health(heartbeat))
+        
+        # SIGTERM (остановка сервиса, перезапуск супервизором) - штатное завершение
+        stop_event = asyncio.Event()
+        try:
+            asyncio.get_running_loop().add_signal_handler(signal.SIGTERM, stop_event.set)
+        except (NotImplementedError, RuntimeError):
+            # Windows: сигналы в цикле событий не поддерживаются
+            pass
+        
+        # Запускаем бота (процесс-обработчик только разбирает очередь)
+        serving = asyncio.create_task(serve(dp, bot) if ingest else asyncio.Event().wait())
+        stopping = asyncio.create_task(stop_event.wait())
+        await asyncio.wait({serving, stopping}, return_when=asyncio.FIRST_COMPLETED)
+        stopping.cancel()
+        if serving.done():
+            serving.result()
+        else:
+            logger.info("Получен сигнал остановки, завершение работы...")
+            serving.cancel()
         
     except Exception as e:
         logger.error(f"Ошибка при запуске бота: {e}")
     finally:
-        # Закрываем соединение с базой данных
+        # Сначала перестаем принимать обновления, затем останавливаем воркеры
+        # и закрываем соединение с базой данных
+        if web_runner:
+            await web_runner.cleanup()
+        if health_task:
+            health_task.cancel()
+        await update_queue.stop()
+        await job_queue.stop()
+        await prefetcher.close()
+        await telegram_scheduler.close()
+        await fsm_storage.close()
         await db.disconnect()
+        if image_storage:
+            await image_storage.close()
         await bot.session.close()
 
 if __name__ == "__main__":
@@ -0,0 +1,181 @@
+"""
+Middleware бота: ограничение частоты запросов и проверка доступа администратора
+"""
+import logging
+import time
+from collections import OrderedDict
+from typing import Any, Awaitable, Callable, Dict, Optional
+
+from aiogram import BaseMiddleware
+from aiogram.types import Message, CallbackQuery, InlineQuery, TelegramObject
+
+from config import (
+    THROTTLE_RATE, THROTTLE_BURST, THROTTLE_GLOBAL_RATE,
+    THROTTLE_GLOBAL_BURST, THROTTLE_MAX_USERS
+)
+from database import db
+from fsm_storage import fsm_storage
+
+logger = logging.getLogger(__name__)
+
+# Команды, доступные без прав администратора (/start отвечает сам, /add_admin - первичная настройка)
+PUBLIC_COMMANDS = frozenset({"start", "add_admin"})
+
+def get_command(message: Message) -> Optional[str]:
+    """Имя команды из текста сообщения (/cmd@bot args -> cmd) или None"""
+    text = message.text or ""
+    if not text.startswith("/"):
+        return None
+    return text.split(maxsplit=1)[0][1:].split("@", 1)[0].lower()
+
+class AdminGateMiddleware(BaseMiddleware):
+    """
+    Outer middleware роутера: один раз на обновление определяет роль пользователя
+    (через кэш админов) и передает ее обработчикам как is_admin.
+    Обновления от не-админов отсекаются до фильтров и обработчиков.
+    """
+
+    def __init__(self, public_commands=PUBLIC_COMMANDS):
+        self.public_commands = frozenset(public_commands)
+
+    async def __call__(
+        self,
+        handler: Callable[[TelegramObject, Dict[str, Any]], Awaitable[Any]],
+        event: TelegramObject,
+        data: Dict[str, Any]
+    ) -> Any:
+        is_admin = data.get("is_admin")
+        if is_admin is None:
+            user = data.get("event_from_user")
+            is_admin = bool(user) and await db.is_admin(user.id)
+            data["is_admin"] = is_admin
+
+        if is_admin:
+            return await handler(event, data)
+
+        if isinstance(event, Message) and get_command(event) in self.public_commands:
+            return await handler(event, data)
+
+        await self._deny(event, data)
+        return None
+
+    async def _deny(self, event: TelegramObject, data: Dict[str, Any]):
+        """Ответить на обновление без доступа"""
+        if isinstance(event, CallbackQuery):
+            await event.answer("❌ Нет доступа!", show_alert=True)
+            return
+
+        if isinstance(event, InlineQuery):
+            # Пустой ответ, чтобы клиент не ждал таймаута
+            await event.answer([], cache_time=60, is_personal=True)
+            return
+
+        # На произвольные сообщения не отвечаем, только если пользователь
+        # был в середине диалога (например, его удалили из админов).
+        # Проверяем только кэш процесса: отказ не должен обращаться к базе
+        state = data.get("state")
+        if isinstance(event, Message) and state and fsm_storage.cached_state(state.key):
+            await state.clear()
+            await event.answer("❌ Нет доступа!")
+
+class TokenBucket:
+    """Token bucket: rate токенов в секунду, не больше burst в запасе"""
+    __slots__ = ("rate", "burst", "tokens", "updated", "warned")
+
+    def __init__(self, rate: float, burst: float, now: float):
+        self.rate = rate
+        self.burst = burst
+        self.tokens = burst
+        self.updated = now
+        self.warned = False
+
+    def consume(self, now: float) -> bool:
+        """Списать один токен, если он есть"""
+        self.tokens = min(self.burst, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+        if self.tokens >= 1:
+            self.tokens -= 1
+            return True
+        return False
+
+class ThrottlingMiddleware(BaseMiddleware):
+    """
+    Outer middleware роутера: ограничивает частоту обновлений от не-админов
+    (token bucket на пользователя и общий на всех). Лишние обновления отбрасываются
+    до проверки доступа, запросов к базе и отправки фото.
+    Админы не ограничиваются. Память ограничена: бездействующие пользователи
+    вытесняются из LRU.
+    """
+
+    def __init__(self, rate: float = 1.0, burst: float = 5.0, global_rate: float = 20.0,
+                 global_burst: float = 50.0, max_users: int = 10000):
+        self.rate = rate
+        self.burst = burst
+        self.max_users = max_users
+        self._buckets: "OrderedDict[int, TokenBucket]" = OrderedDict()
+        self._global = TokenBucket(global_rate, global_burst, time.monotonic())
+        self._counters = {
+            "passed": 0,
+            "admin": 0,
+            "throttled_user": 0,
+            "throttled_global": 0,
+            "evicted": 0
+        }
+
+    def stats(self) -> Dict[str, int]:
+        """Счетчики для мониторинга"""
+        return dict(self._counters, tracked_users=len(self._buckets))
+
+    def _get_bucket(self, user_id: int, now: float) -> TokenBucket:
+        """Bucket пользователя (LRU с ограничением размера)"""
+        bucket = self._buckets.get(user_id)
+        if bucket is None:
+            bucket = self._buckets[user_id] = TokenBucket(self.rate, self.burst, now)
+            while len(self._buckets) > self.max_users:
+                self._buckets.popitem(last=False)
+                self._counters["evicted"] += 1
+        else:
+            self._buckets.move_to_end(user_id)
+        return bucket
+
+    async def __call__(
+        self,
+        handler: Callable[[TelegramObject, Dict[str, Any]], Awaitable[Any]],
+        event: TelegramObject,
+        data: Dict[str, Any]
+    ) -> Any:
+        user = data.get("event_from_user")
+        if user is None:
+            return await handler(event, data)
+
+        # Роль берется из кэша админов (известные не-админы - без запроса к базе)
+        is_admin = await db.is_admin(user.id)
+        data["is_admin"] = is_admin
+        if is_admin:
+            self._counters["admin"] += 1
+            return await handler(event, data)
+
+        now = time.monotonic()
+        bucket = self._get_bucket(user.id, now)
+        if not bucket.consume(now):
+            self._counters["throttled_user"] += 1
+            # Предупреждаем один раз, дальше просто отбрасываем
+            if isinstance(event, CallbackQuery) and not bucket.warned:
+                bucket.warned = True
+                await event.answer("⏳ Слишком много запросов, подождите немного")
+            return None
+        bucket.warned = False
+
+        if not self._global.consume(now):
+            self._counters["throttled_global"] += 1
+            return None
+
+        self._counters["passed"] += 1
+        return await handler(event, data)
+
+# Глобальные экземпляры middleware
+throttling = ThrottlingMiddleware(
+    THROTTLE_RATE, THROTTLE_BURST, THROTTLE_GLOBAL_RATE,
+    THROTTLE_GLOBAL_BURST, THROTTLE_MAX_USERS
+)
+admin_gate = AdminGateMiddleware()
@@ -0,0 +1,40 @@
+-- Миграция: перенос списка администраторов из settings в отдельную таблицу admins
+-- Запустите этот скрипт в вашей базе данных PostgreSQL
+
+-- Таблица администраторов (position сохраняет порядок в меню управления админами)
+CREATE TABLE IF NOT EXISTS admins (
+    telegram_id TEXT PRIMARY KEY,
+    position BIGINT GENERATED BY DEFAULT AS IDENTITY UNIQUE,
+    created_at TIMESTAMP DEFAULT NOW() NOT NULL
+);
+
+-- Импорт существующего JSON-списка admin_telegram_ids с сохранением порядка
+INSERT INTO admins (telegram_id)
+SELECT t.telegram_id
+FROM settings,
+     jsonb_array_elements_text(settings.value::jsonb) WITH ORDINALITY AS t(telegram_id, ord)
+WHERE settings.key = 'admin_telegram_ids'
+  AND jsonb_typeof(settings.value::jsonb) = 'array'
+ORDER BY t.ord
+ON CONFLICT (telegram_id) DO NOTHING;
+
+-- Уведомление всех экземпляров бота об изменении списка админов (сброс кэша прав)
+CREATE OR REPLACE FUNCTION notify_admins_changed()
+RETURNS TRIGGER AS $$
+BEGIN
+    PERFORM pg_notify('admin_ids_changed', '');
+    RETURN NULL;
+END;
+$$ language 'plpgsql';
+
+DROP TRIGGER IF EXISTS notify_admins_changed ON admins;
+CREATE TRIGGER notify_admins_changed AFTER INSERT OR UPDATE OR DELETE OR TRUNCATE ON admins
+    FOR EACH STATEMENT EXECUTE FUNCTION notify_admins_changed();
+
+-- Запись admin_telegram_ids в settings больше не используется ботом и оставлена для отката
+
+-- Сообщение об успешном выполнении
+DO $$ 
+BEGIN 
+    RAISE NOTICE 'Миграция выполнена успешно! Администраторы перенесены в таблицу admins.';
+END $$;
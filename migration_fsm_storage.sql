@@ -0,0 +1,25 @@
+-- Миграция: хранилище состояний диалогов (FSM) в PostgreSQL
+-- Запустите этот скрипт в вашей базе данных PostgreSQL
+
+-- UNLOGGED: состояния диалогов не нужно восстанавливать после сбоя сервера,
+-- зато запись не идет в WAL
+CREATE UNLOGGED TABLE IF NOT EXISTS fsm_storage (
+    bot_id BIGINT NOT NULL,
+    chat_id BIGINT NOT NULL,
+    user_id BIGINT NOT NULL,
+    thread_id BIGINT NOT NULL DEFAULT 0,
+    destiny TEXT NOT NULL DEFAULT 'default',
+    state TEXT,
+    data JSONB NOT NULL DEFAULT '{}',
+    updated_at TIMESTAMP DEFAULT NOW() NOT NULL,
+    PRIMARY KEY (bot_id, chat_id, user_id, thread_id, destiny)
+);
+
+-- Индекс для удаления брошенных сессий
+CREATE INDEX IF NOT EXISTS idx_fsm_storage_updated_at ON fsm_storage (updated_at);
+
+-- Сообщение об успешном выполнении
+DO $$ 
+BEGIN 
+    RAISE NOTICE 'Миграция выполнена успешно! Создана таблица fsm_storage.';
+END $$;
@@ -0,0 +1,17 @@
+-- Миграция: кэш загруженных изображений (повторные фото не загружаются заново)
+-- Запустите этот скрипт в вашей базе данных PostgreSQL
+
+CREATE TABLE IF NOT EXISTS image_cache (
+    file_unique_id TEXT PRIMARY KEY,
+    sha256 TEXT NOT NULL,
+    url TEXT NOT NULL,
+    created_at TIMESTAMP DEFAULT NOW() NOT NULL
+);
+
+CREATE INDEX IF NOT EXISTS idx_image_cache_sha256 ON image_cache (sha256);
+
+-- Сообщение об успешном выполнении
+DO $$ 
+BEGIN 
+    RAISE NOTICE 'Миграция выполнена успешно! Таблица image_cache создана.';
+END $$;
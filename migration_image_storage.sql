@@ -0,0 +1,13 @@
+-- Миграция: удаление неиспользуемых изображений из хранилища
+-- Запустите этот скрипт в вашей базе данных PostgreSQL
+
+-- Индексы для проверки, ссылается ли еще кто-нибудь на изображение
+CREATE INDEX IF NOT EXISTS idx_projects_image_url ON projects (image_url);
+CREATE INDEX IF NOT EXISTS idx_projects_thumbnail_url ON projects (thumbnail_url);
+CREATE INDEX IF NOT EXISTS idx_image_cache_url ON image_cache (url);
+
+-- Сообщение об успешном выполнении
+DO $$ 
+BEGIN 
+    RAISE NOTICE 'Миграция выполнена успешно! Добавлены индексы для очистки изображений.';
+END $$;
@@ -0,0 +1,14 @@
+-- Миграция: миниатюры изображений проектов
+-- Запустите этот скрипт в вашей базе данных PostgreSQL
+
+ALTER TABLE projects
+ADD COLUMN IF NOT EXISTS thumbnail_url TEXT;
+
+ALTER TABLE image_cache
+ADD COLUMN IF NOT EXISTS thumbnail_url TEXT;
+
+-- Сообщение об успешном выполнении
+DO $$ 
+BEGIN 
+    RAISE NOTICE 'Миграция выполнена успешно! Добавлены поля thumbnail_url.';
+END $$;
@@ -0,0 +1,33 @@
+-- Миграция: фоновая очередь задач и отложенная загрузка изображений проектов
+-- Запустите этот скрипт в вашей базе данных PostgreSQL
+
+-- Изображение проекта еще загружается в фоне
+ALTER TABLE projects
+ADD COLUMN IF NOT EXISTS image_pending BOOLEAN NOT NULL DEFAULT FALSE;
+
+-- Очередь задач (pending -> running -> удаляется после выполнения или failed)
+CREATE TABLE IF NOT EXISTS jobs (
+    id BIGSERIAL PRIMARY KEY,
+    kind TEXT NOT NULL,
+    payload JSONB NOT NULL DEFAULT '{}',
+    status TEXT NOT NULL DEFAULT 'pending',
+    attempts INTEGER NOT NULL DEFAULT 0,
+    run_at TIMESTAMP DEFAULT NOW() NOT NULL,
+    locked_until TIMESTAMP,
+    last_error TEXT,
+    created_at TIMESTAMP DEFAULT NOW() NOT NULL,
+    updated_at TIMESTAMP DEFAULT NOW() NOT NULL
+);
+
+CREATE INDEX IF NOT EXISTS idx_jobs_active ON jobs (run_at)
+WHERE status IN ('pending', 'running');
+
+DROP TRIGGER IF EXISTS update_jobs_updated_at ON jobs;
+CREATE TRIGGER update_jobs_updated_at BEFORE UPDATE ON jobs
+    FOR EACH ROW EXECUTE FUNCTION update_updated_at_column();
+
+-- Сообщение об успешном выполнении
+DO $$ 
+BEGIN 
+    RAISE NOTICE 'Миграция выполнена успешно! Создана таблица jobs, добавлено поле projects.image_pending.';
+END $$;
@@ -0,0 +1,54 @@
+-- Миграция: file_id Telegram для изображений (повторная отправка фото без скачивания по URL)
+-- Запустите этот скрипт в вашей базе данных PostgreSQL
+
+CREATE TABLE IF NOT EXISTS photo_file_ids (
+    url TEXT PRIMARY KEY,
+    file_id TEXT NOT NULL,
+    created_at TIMESTAMP DEFAULT NOW() NOT NULL
+);
+
+-- Сброс file_id при смене изображения проекта или фото меню
+CREATE OR REPLACE FUNCTION invalidate_photo_file_id(old_url TEXT)
+RETURNS VOID AS $$
+BEGIN
+    IF old_url IS NOT NULL THEN
+        DELETE FROM photo_file_ids WHERE url = old_url;
+        PERFORM pg_notify('photo_file_ids_changed', old_url);
+    END IF;
+END;
+$$ language 'plpgsql';
+
+CREATE OR REPLACE FUNCTION invalidate_project_photo_file_id()
+RETURNS TRIGGER AS $$
+BEGIN
+    IF TG_OP = 'DELETE' OR OLD.image_url IS DISTINCT FROM NEW.image_url THEN
+        PERFORM invalidate_photo_file_id(OLD.image_url);
+    END IF;
+    RETURN NULL;
+END;
+$$ language 'plpgsql';
+
+DROP TRIGGER IF EXISTS invalidate_project_photo_file_id ON projects;
+CREATE TRIGGER invalidate_project_photo_file_id AFTER UPDATE OF image_url OR DELETE ON projects
+    FOR EACH ROW EXECUTE FUNCTION invalidate_project_photo_file_id();
+
+CREATE OR REPLACE FUNCTION invalidate_menu_photo_file_id()
+RETURNS TRIGGER AS $$
+BEGIN
+    -- Фото меню сбрасывается при любой записи, даже если URL тот же (изображение могли заменить)
+    IF OLD.key = 'menu_photo' THEN
+        PERFORM invalidate_photo_file_id(OLD.value);
+    END IF;
+    RETURN NULL;
+END;
+$$ language 'plpgsql';
+
+DROP TRIGGER IF EXISTS invalidate_menu_photo_file_id ON settings;
+CREATE TRIGGER invalidate_menu_photo_file_id AFTER UPDATE OR DELETE ON settings
+    FOR EACH ROW EXECUTE FUNCTION invalidate_menu_photo_file_id();
+
+-- Сообщение об успешном выполнении
+DO $$ 
+BEGIN 
+    RAISE NOTICE 'Миграция выполнена успешно! Таблица photo_file_ids создана.';
+END $$;
@@ -0,0 +1,37 @@
+-- Миграция: уведомления об изменении проектов
+-- Бот держит проекты в памяти и перечитывает измененный проект по этому уведомлению
+-- Запустите этот скрипт в вашей базе данных PostgreSQL
+
+CREATE OR REPLACE FUNCTION notify_projects_changed()
+RETURNS TRIGGER AS $$
+BEGIN
+    IF TG_OP = 'TRUNCATE' THEN
+        -- Пустое уведомление - перечитать все проекты
+        PERFORM pg_notify('projects_changed', '');
+    ELSIF TG_OP = 'DELETE' THEN
+        PERFORM pg_notify('projects_changed', OLD.id::text);
+    ELSE
+        PERFORM pg_notify('projects_changed', NEW.id::text);
+    END IF;
+    RETURN NULL;
+END;
+$$ language 'plpgsql';
+
+DROP TRIGGER IF EXISTS notify_projects_changed ON projects;
+CREATE TRIGGER notify_projects_changed AFTER INSERT OR UPDATE OR DELETE ON projects
+    FOR EACH ROW EXECUTE FUNCTION notify_projects_changed();
+
+DROP TRIGGER IF EXISTS notify_projects_truncated ON projects;
+CREATE TRIGGER notify_projects_truncated AFTER TRUNCATE ON projects
+    FOR EACH STATEMENT EXECUTE FUNCTION notify_projects_changed();
+
+-- Страницы списка и число проектов считаются в памяти бота - счетчик projects_count не нужен
+DROP TRIGGER IF EXISTS update_projects_count ON projects;
+DROP FUNCTION IF EXISTS update_projects_count();
+DROP TABLE IF EXISTS projects_count;
+
+-- Сообщение об успешном выполнении
+DO $$ 
+BEGIN 
+    RAISE NOTICE 'Миграция выполнена успешно! Изменения проектов рассылаются через NOTIFY.';
+END $$;
@@ -0,0 +1,38 @@
+-- Миграция для keyset-пагинации списка проектов
+-- Запустите этот скрипт в вашей базе данных PostgreSQL
+
+-- Индекс для постраничной выборки по (created_at, id)
+CREATE INDEX IF NOT EXISTS idx_projects_created_at_id
+ON projects (created_at DESC, id DESC);
+
+-- Счетчик проектов, поддерживаемый триггером (вместо COUNT(*) на каждую страницу)
+CREATE TABLE IF NOT EXISTS projects_count (
+    id BOOLEAN PRIMARY KEY DEFAULT TRUE CHECK (id),
+    total BIGINT NOT NULL
+);
+
+INSERT INTO projects_count (id, total)
+SELECT TRUE, COUNT(*) FROM projects
+ON CONFLICT (id) DO UPDATE SET total = EXCLUDED.total;
+
+CREATE OR REPLACE FUNCTION update_projects_count()
+RETURNS TRIGGER AS $$
+BEGIN
+    IF TG_OP = 'INSERT' THEN
+        UPDATE projects_count SET total = total + 1;
+    ELSIF TG_OP = 'DELETE' THEN
+        UPDATE projects_count SET total = total - 1;
+    END IF;
+    RETURN NULL;
+END;
+$$ language 'plpgsql';
+
+DROP TRIGGER IF EXISTS update_projects_count ON projects;
+CREATE TRIGGER update_projects_count AFTER INSERT OR DELETE ON projects
+    FOR EACH ROW EXECUTE FUNCTION update_projects_count();
+
+-- Сообщение об успешном выполнении
+DO $$ 
+BEGIN 
+    RAISE NOTICE 'Миграция выполнена успешно! Добавлены индекс пагинации и счетчик проектов.';
+END $$;
@@ -0,0 +1,22 @@
+-- Миграция: полнотекстовый поиск проектов по названию и описанию
+-- Требуется PostgreSQL 12+ (генерируемые колонки)
+-- Запустите этот скрипт в вашей базе данных PostgreSQL
+
+-- Поисковый вектор (русская и английская морфология), название весомее описания
+ALTER TABLE projects ADD COLUMN IF NOT EXISTS search_vector tsvector
+    GENERATED ALWAYS AS (
+        setweight(to_tsvector('russian', coalesce(title, '')), 'A') ||
+        setweight(to_tsvector('english', coalesce(title, '')), 'A') ||
+        setweight(to_tsvector('russian', coalesce(description, '')), 'B') ||
+        setweight(to_tsvector('english', coalesce(description, '')), 'B')
+    ) STORED;
+
+-- Индекс для поиска (@@)
+CREATE INDEX IF NOT EXISTS idx_projects_search_vector
+ON projects USING GIN (search_vector);
+
+-- Сообщение об успешном выполнении
+DO $$ 
+BEGIN 
+    RAISE NOTICE 'Миграция выполнена успешно! Добавлен полнотекстовый поиск проектов.';
+END $$;
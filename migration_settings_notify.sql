@@ -0,0 +1,21 @@
+-- Миграция: уведомления об изменении таблицы settings
+-- Бот держит снимок настроек в памяти и перечитывает его по этому уведомлению
+-- Запустите этот скрипт в вашей базе данных PostgreSQL
+
+CREATE OR REPLACE FUNCTION notify_settings_changed()
+RETURNS TRIGGER AS $$
+BEGIN
+    PERFORM pg_notify('settings_changed', '');
+    RETURN NULL;
+END;
+$$ language 'plpgsql';
+
+DROP TRIGGER IF EXISTS notify_settings_changed ON settings;
+CREATE TRIGGER notify_settings_changed AFTER INSERT OR UPDATE OR DELETE OR TRUNCATE ON settings
+    FOR EACH STATEMENT EXECUTE FUNCTION notify_settings_changed();
+
+-- Сообщение об успешном выполнении
+DO $$ 
+BEGIN 
+    RAISE NOTICE 'Миграция выполнена успешно! Изменения настроек рассылаются через NOTIFY.';
+END $$;
@@ -0,0 +1,28 @@
+-- Миграция: очередь входящих обновлений Telegram
+-- Запустите этот скрипт в вашей базе данных PostgreSQL
+
+-- Обновления (pending -> running -> удаляется после обработки или failed)
+CREATE TABLE IF NOT EXISTS updates (
+    update_id BIGINT PRIMARY KEY,
+    chat_id BIGINT,
+    payload JSONB NOT NULL,
+    status TEXT NOT NULL DEFAULT 'pending',
+    attempts INTEGER NOT NULL DEFAULT 0,
+    run_at TIMESTAMP DEFAULT NOW() NOT NULL,
+    locked_until TIMESTAMP,
+    last_error TEXT,
+    created_at TIMESTAMP DEFAULT NOW() NOT NULL
+);
+
+-- Выбор следующего обновления и проверка более ранних обновлений того же чата
+CREATE INDEX IF NOT EXISTS idx_updates_active ON updates (update_id)
+WHERE status IN ('pending', 'running');
+
+CREATE INDEX IF NOT EXISTS idx_updates_chat_active ON updates (chat_id, update_id)
+WHERE status IN ('pending', 'running');
+
+-- Сообщение об успешном выполнении
+DO $$ 
+BEGIN 
+    RAISE NOTICE 'Миграция выполнена успешно! Создана таблица updates.';
+END $$;
@@ -0,0 +1,232 @@
+"""
+Панель бота: одно "живое" сообщение в чате, которое обновляется на месте минимальным запросом
+"""
+import logging
+import uuid
+from collections import OrderedDict
+from typing import Optional
+
+from aiogram.exceptions import TelegramBadRequest
+from aiogram.types import InputMediaPhoto, Message
+
+from database import db, PANELS_CHANNEL
+from image_cache import photo_file_ids
+
+logger = logging.getLogger(__name__)
+
+# Содержимое панели неизвестно (сообщение изменили в обход менеджера)
+UNKNOWN = object()
+
+class Panel:
+    """Состояние сообщения-панели: фото, текст и клавиатура.
+    owned - панель последним менял этот экземпляр бота"""
+    __slots__ = ("message_id", "has_photo", "photo_url", "content", "markup", "owned")
+
+    def __init__(self, message_id: int, has_photo: bool, photo_url: Optional[str] = None,
+                 content=UNKNOWN, markup=UNKNOWN):
+        self.message_id = message_id
+        self.has_photo = has_photo
+        self.photo_url = photo_url
+        self.content = content
+        self.markup = markup
+        self.owned = False
+
+def markup_key(reply_markup) -> Optional[str]:
+    """Ключ для сравнения клавиатур"""
+    return reply_markup.model_dump_json(exclude_none=True) if reply_markup else None
+
+def is_not_modified(error: Exception) -> bool:
+    return "message is not modified" in str(error)
+
+class PanelManager:
+    """
+    Хранит панель каждого чата и выбирает минимальную операцию:
+    edit_reply_markup - изменилась только клавиатура, edit_caption/edit_text - текст,
+    edit_media - фото. Без изменений запрос не отправляется.
+    Пропускать запросы можно, только если панель последним менял этот экземпляр бота.
+    В чатах админов экземпляр, отправивший новую панель или взявшийся за чужую,
+    сообщает об этом через NOTIFY, и остальные перестают доверять своему кэшу:
+    такая панель обновляется целиком, а "message is not modified" считается успехом.
+    Для публичных чатов уведомления не отправляются.
+    """
+
+    def __init__(self, max_chats: int = 1000):
+        self.max_chats = max_chats
+        self._panels: "OrderedDict[int, Panel]" = OrderedDict()
+        # Свои уведомления не сбрасывают кэш
+        self._instance = uuid.uuid4().hex[:12]
+        db.add_notify_handler(PANELS_CHANNEL, self._on_changed)
+
+    def message_id(self, chat_id: int) -> Optional[int]:
+        """ID текущей панели чата"""
+        panel = self._panels.get(chat_id)
+        return panel.message_id if panel else None
+
+    def _forget_content(self, chat_id: int, message_id: int) -> bool:
+        """Текст и клавиатура панели неизвестны; False - панель чата другая или не отслеживается"""
+        panel = self._panels.get(chat_id)
+        if not panel or panel.message_id != message_id:
+            return False
+        panel.content = panel.markup = UNKNOWN
+        panel.owned = False
+        return True
+
+    def _on_changed(self, conn, pid, channel, payload):
+        """Обработчик NOTIFY: панель чата изменена другим экземпляром бота"""
+        if payload is None:
+            for panel in self._panels.values():
+                panel.content = panel.markup = UNKNOWN
+                panel.owned = False
+            return
+        instance, chat_id, message_id, has_photo, photo_url = payload.split("|", 4)
+        if instance == self._instance:
+            return
+        chat_id, message_id = int(chat_id), int(message_id)
+        if not self._forget_content(chat_id, message_id) and has_photo and chat_id in self._panels:
+            # Другой экземпляр отправил новую панель - известны только ее ID и фото
+            self._panels[chat_id] = Panel(message_id, has_photo == "1", photo_url or None)
+
+    async def _notify(self, chat_id: int, message_id: int, has_photo: Optional[bool] = None,
+                      photo_url: Optional[str] = None):
+        flag = "" if has_photo is None else str(int(has_photo))
+        payload = "|".join((self._instance, str(chat_id), str(message_id), flag, photo_url or ""))
+        try:
+            await db.notify_panel_changed(payload)
+        except Exception as e:
+            logger.warning(f"Не удалось разослать изменение панели: {e}")
+
+    async def invalidate(self, chat_id: int, message_id: int):
+        """Сообщение изменено в обход менеджера: текст и клавиатура панели неизвестны
+        (во всех экземплярах бота - сообщение могли изменить в фоновой задаче)"""
+        self._forget_content(chat_id, message_id)
+        await self._notify(chat_id, message_id)
+
+    async def _commit(self, chat_id: int, panel: Panel):
+        """Запоминает панель. Если панель новая или до этого ее менял другой экземпляр,
+        в чате админа сообщает остальным, что теперь ее меняет этот экземпляр"""
+        previous = self._panels.get(chat_id)
+        panel.owned = previous is not None and previous.owned and previous.message_id == panel.message_id
+        self._remember(chat_id, panel)
+        if not panel.owned and await db.is_admin(chat_id):
+            panel.owned = True
+            await self._notify(chat_id, panel.message_id, panel.has_photo, panel.photo_url)
+
+    def _remember(self, chat_id: int, panel: Panel):
+        self._panels[chat_id] = panel
+        self._panels.move_to_end(chat_id)
+        while len(self._panels) > self.max_chats:
+            self._panels.popitem(last=False)
+
+    async def send_photo(self, bot, chat_id: int, photo_url: str, caption: str,
+                         reply_markup=None, parse_mode=None) -> Message:
+        """Отправляет фото по сохраненному file_id (по URL - только при первой отправке)"""
+        photo = photo_file_ids.resolve(photo_url)
+        try:
+            sent = await bot.send_photo(chat_id, photo=photo, caption=caption,
+                                        reply_markup=reply_markup, parse_mode=parse_mode)
+        except TelegramBadRequest as e:
+            if photo == photo_url:
+                raise
+            # file_id больше не действителен - отправляем по URL и запоминаем новый
+            logger.warning(f"Не удалось отправить фото по file_id: {e}")
+            await photo_file_ids.forget(photo_url)
+            sent = await bot.send_photo(chat_id, photo=photo_url, caption=caption,
+                                        reply_markup=reply_markup, parse_mode=parse_mode)
+        await photo_file_ids.remember(photo_url, sent)
+        return sent
+
+    async def edit_media(self, bot, chat_id: int, message_id: int, photo_url: str, caption: str,
+                         reply_markup=None, parse_mode=None):
+        """Заменяет фото в сообщении, используя сохраненный file_id"""
+        photo = photo_file_ids.resolve(photo_url)
+        try:
+            edited = await bot.edit_message_media(
+                media=InputMediaPhoto(media=photo, caption=caption, parse_mode=parse_mode),
+                chat_id=chat_id, message_id=message_id, reply_markup=reply_markup
+            )
+        except TelegramBadRequest as e:
+            if photo == photo_url or is_not_modified(e):
+                raise
+            logger.warning(f"Не удалось отправить фото по file_id: {e}")
+            await photo_file_ids.forget(photo_url)
+            edited = await bot.edit_message_media(
+                media=InputMediaPhoto(media=photo_url, caption=caption, parse_mode=parse_mode),
+                chat_id=chat_id, message_id=message_id, reply_markup=reply_markup
+            )
+        if isinstance(edited, Message):
+            await photo_file_ids.remember(photo_url, edited)
+
+    async def _send(self, bot, chat_id: int, text: str, photo_url: Optional[str],
+                    reply_markup, parse_mode) -> int:
+        """Отправляет новую панель"""
+        if photo_url:
+            try:
+                sent = await self.send_photo(bot, chat_id, photo_url, text, reply_markup, parse_mode)
+            except Exception as e:
+                logger.error(f"Ошибка отправки фото: {e}")
+                # Если не удалось отправить с фото, отправляем обычное сообщение
+                photo_url = None
+        if not photo_url:
+            sent = await bot.send_message(chat_id, text, reply_markup=reply_markup, parse_mode=parse_mode)
+
+        await self._commit(chat_id, Panel(sent.message_id, bool(photo_url), photo_url,
+                                          (text, parse_mode), markup_key(reply_markup)))
+        return sent.message_id
+
+    async def render(self, bot, chat_id: int, text: str, photo_url: Optional[str] = None,
+                     reply_markup=None, parse_mode=None, message: Optional[Message] = None,
+                     new: bool = False) -> int:
+        """
+        Показывает text (с фото photo_url, если есть) в панели чата и возвращает ID сообщения.
+        message - сообщение, которое нужно обновить (например, из callback), new - отправить новую панель.
+        """
+        content = (text, parse_mode)
+        markup = markup_key(reply_markup)
+
+        panel = None if new else self._panels.get(chat_id)
+        if message is not None and (panel is None or panel.message_id != message.message_id):
+            # Сообщение не отслеживается (например, после перезапуска) - известно только, есть ли фото
+            panel = Panel(message.message_id, bool(message.photo))
+        if panel is None:
+            return await self._send(bot, chat_id, text, photo_url, reply_markup, parse_mode)
+
+        try:
+            if panel.has_photo and photo_url:
+                if panel.photo_url != photo_url:
+                    await self.edit_media(bot, chat_id, panel.message_id, photo_url, text,
+                                          reply_markup, parse_mode)
+                elif panel.content != content:
+                    await bot.edit_message_caption(chat_id=chat_id, message_id=panel.message_id, caption=text,
+                                                   reply_markup=reply_markup, parse_mode=parse_mode)
+                elif panel.markup != markup:
+                    await bot.edit_message_reply_markup(chat_id=chat_id, message_id=panel.message_id,
+                                                        reply_markup=reply_markup)
+            elif not panel.has_photo and not photo_url:
+                if panel.content != content:
+                    await bot.edit_message_text(text, chat_id=chat_id, message_id=panel.message_id,
+                                                reply_markup=reply_markup, parse_mode=parse_mode)
+                elif panel.markup != markup:
+                    await bot.edit_message_reply_markup(chat_id=chat_id, message_id=panel.message_id,
+                                                        reply_markup=reply_markup)
+            else:
+                # Фото нельзя добавить к текстовому сообщению или убрать - отправляем панель заново
+                await self._replace(bot, chat_id, panel.message_id)
+                return await self._send(bot, chat_id, text, photo_url, reply_markup, parse_mode)
+        except Exception as e:
+            if not is_not_modified(e):
+                logger.warning(f"Не удалось обновить панель, отправляем заново: {e}")
+                await self._replace(bot, chat_id, panel.message_id)
+                return await self._send(bot, chat_id, text, photo_url, reply_markup, parse_mode)
+
+        await self._commit(chat_id, Panel(panel.message_id, bool(photo_url), photo_url, content, markup))
+        return panel.message_id
+
+    async def _replace(self, bot, chat_id: int, message_id: int):
+        """Удаляет старую панель перед отправкой новой"""
+        try:
+            await bot.delete_message(chat_id, message_id)
+        except Exception as e:
+            logger.debug(f"Не удалось удалить старую панель {message_id}: {e}")
+
+# Глобальный менеджер панелей
+panels = PanelManager()
@@ -0,0 +1,384 @@
+"""
+Модель чтения портфолио: все проекты в памяти, готовые страницы списка и карточки проектов
+"""
+import asyncio
+import bisect
+import heapq
+import logging
+import re
+from datetime import datetime, timedelta
+from typing import Any, Dict, Iterable, List, Optional, Set, Tuple
+
+from aiogram.types import InlineKeyboardMarkup
+
+from database import db, PROJECT_COLUMNS, PROJECTS_CHANNEL
+from keyboards import get_projects_menu, get_project_menu
+
+logger = logging.getLogger(__name__)
+
+# Проектов на странице списка
+PROJECTS_PER_PAGE = 10
+
+_EPOCH = datetime(1970, 1, 1)
+_FIELDS = tuple(column.strip() for column in PROJECT_COLUMNS.split(","))
+
+def escape_markdown(text: str) -> str:
+    """Экранирует специальные символы Markdown"""
+    if not text:
+        return text
+
+    # Символы, которые нужно экранировать в MarkdownV2 (убрали точку)
+    escape_chars = ['_', '*', '[', ']', '(', ')', '~', '`', '>', '#', '+', '-', '=', '|', '{', '}', '!']
+
+    for char in escape_chars:
+        text = text.replace(char, f'\\{char}')
+
+    return text
+
+def sort_key(created_at: datetime, project_id: int) -> Tuple[int, int]:
+    """Ключ порядка списка (от новых к старым) - по возрастанию ключа"""
+    micros = (created_at.replace(tzinfo=None) - _EPOCH) // timedelta(microseconds=1)
+    return -micros, -project_id
+
+def render_share_caption(project, max_length: int = 1024) -> str:
+    """Подпись проекта для отправки в другие чаты (inline-режим, Markdown)"""
+    title = f"📄 **{escape_markdown(project['title'])}**"
+    link = f"🔗 {escape_markdown(project['project_url'])}" if project['project_url'] else ""
+    parts = [title]
+    if project['description']:
+        # Описание сокращается, чтобы подпись уместилась в лимит Telegram на подпись к фото
+        room = max_length - len(title) - len(link) - 4
+        description = escape_markdown(project['description'])
+        if len(description) > room:
+            description = description[:max(room - 3, 0)].rstrip("\\") + "..."
+        parts.append(description)
+    if link:
+        parts.append(link)
+    return "\n\n".join(parts)
+
+def render_project_card(project) -> str:
+    """Текст карточки проекта (Markdown)"""
+    title_escaped = escape_markdown(project['title'])
+    text = f"📄 **{title_escaped}**\n\n"
+
+    if project['description']:
+        desc_escaped = escape_markdown(project['description'])
+        text += f"📝 Описание:\n{desc_escaped}\n\n"
+
+    if project['project_url']:
+        url_escaped = escape_markdown(project['project_url'])
+        text += f"🔗 Ссылка на проект: {url_escaped}\n\n"
+
+    if project['image_pending']:
+        text += "⏳ Изображение загружается...\n\n"
+
+    text += f"📅 Создан: {project['created_at'].strftime('%d.%m.%Y %H:%M')}"
+    return text
+
+def normalize(text: str) -> str:
+    """Текст для поиска: нижний регистр, ё -> е, слова через один пробел"""
+    return " ".join(re.findall(r"\w+", text.casefold().replace("ё", "е")))
+
+def trigrams(text: str) -> Set[str]:
+    return {text[i:i + 3] for i in range(len(text) - 2)}
+
+class TitleIndex:
+    """
+    Индекс названий проектов для поиска по мере ввода (inline-режим).
+    Слова запроса от трех символов ищутся как подстроки названия (триграммы),
+    короткие - как начало слова (отсортированный список слов).
+    """
+
+    def __init__(self):
+        self._titles: Dict[int, str] = {}
+        self._grams: Dict[str, Set[int]] = {}
+        self._words: List[Tuple[str, int]] = []
+
+    def title(self, project_id: int) -> str:
+        """Нормализованное название проекта"""
+        return self._titles.get(project_id, "")
+
+    def rebuild(self, items: Iterable[Tuple[int, str]]):
+        """Построить индекс заново по парам (ID, название)"""
+        self._titles = {project_id: normalize(title) for project_id, title in items}
+        self._grams = {}
+        words = []
+        for project_id, title in self._titles.items():
+            for gram in trigrams(title):
+                self._grams.setdefault(gram, set()).add(project_id)
+            words.extend((word, project_id) for word in set(title.split()))
+        words.sort()
+        self._words = words
+
+    def add(self, project_id: int, title: str):
+        self.remove(project_id)
+        title = self._titles[project_id] = normalize(title)
+        for gram in trigrams(title):
+            self._grams.setdefault(gram, set()).add(project_id)
+        for word in set(title.split()):
+            bisect.insort(self._words, (word, project_id))
+
+    def remove(self, project_id: int):
+        title = self._titles.pop(project_id, None)
+        if title is None:
+            return
+        for gram in trigrams(title):
+            ids = self._grams[gram]
+            ids.discard(project_id)
+            if not ids:
+                del self._grams[gram]
+        for word in set(title.split()):
+            index = bisect.bisect_left(self._words, (word, project_id))
+            if index < len(self._words) and self._words[index] == (word, project_id):
+                del self._words[index]
+
+    def _match(self, token: str) -> Set[int]:
+        """Проекты, в названии которых есть слово запроса"""
+        if len(token) < 3:
+            ids = set()
+            index = bisect.bisect_left(self._words, (token,))
+            while index < len(self._words) and self._words[index][0].startswith(token):
+                ids.add(self._words[index][1])
+                index += 1
+            return ids
+
+        postings = sorted((self._grams.get(gram, ()) for gram in trigrams(token)), key=len)
+        if not postings[0]:
+            return set()
+        candidates = set(postings[0]).intersection(*postings[1:])
+        # Триграммы могут совпасть и без подстроки целиком - проверяем
+        return {project_id for project_id in candidates if token in self._titles[project_id]}
+
+    def search(self, query: str) -> Set[int]:
+        """Проекты, в названии которых есть все слова запроса (запрос уже нормализован)"""
+        found: Optional[Set[int]] = None
+        for token in query.split():
+            ids = self._match(token)
+            found = ids if found is None else found & ids
+            if not found:
+                return set()
+        return found or set()
+
+class ProjectRecord:
+    """Проект в памяти. Поддерживает project['title'], как строки из БД"""
+    __slots__ = _FIELDS + ("sort_key", "_card", "_share_caption")
+
+    def __init__(self, row: Dict[str, Any]):
+        for field in _FIELDS:
+            setattr(self, field, row[field])
+        self.sort_key = sort_key(self.created_at, self.id)
+        self._card: Optional[Tuple[str, InlineKeyboardMarkup]] = None
+        self._share_caption: Optional[str] = None
+
+    def __getitem__(self, key: str):
+        return getattr(self, key)
+
+    def get(self, key: str, default=None):
+        return getattr(self, key, default)
+
+    @property
+    def card(self) -> Tuple[str, InlineKeyboardMarkup]:
+        """Текст и клавиатура карточки (строятся один раз, при изменении проект заменяется)"""
+        if self._card is None:
+            self._card = (render_project_card(self), get_project_menu(self.id))
+        return self._card
+
+    @property
+    def share_caption(self) -> str:
+        """Подпись для отправки проекта в другие чаты"""
+        if self._share_caption is None:
+            self._share_caption = render_share_caption(self)
+        return self._share_caption
+
+class Portfolio:
+    """
+    Все проекты в памяти процесса, упорядоченные как список в боте.
+    Клавиатуры страниц строятся при первом показе и сбрасываются, когда страница меняется.
+    Изменения приходят по NOTIFY от триггера на projects (ID проекта) - проект
+    перечитывается из БД; после своих изменений обработчики вызывают refresh сами,
+    чтобы сразу видеть результат.
+    """
+
+    def __init__(self, per_page: int = PROJECTS_PER_PAGE):
+        self.per_page = per_page
+        self._projects: Dict[int, ProjectRecord] = {}
+        self._order: List[ProjectRecord] = []
+        self._keys: List[Tuple[int, int]] = []
+        self._pages: Dict[int, InlineKeyboardMarkup] = {}
+        self._index = TitleIndex()
+        self._loaded = False
+        # Растет при потере уведомлений: начатая до этого загрузка считается устаревшей
+        self._generation = 0
+        self._lock = asyncio.Lock()
+        self._pending: Set[int] = set()
+        self._refresh_task: Optional[asyncio.Task] = None
+        db.add_notify_handler(PROJECTS_CHANNEL, self._on_changed)
+
+    def _on_changed(self, conn, pid, channel, payload):
+        """Обработчик NOTIFY: проект изменен ('' - таблица очищена, None - переподключение)"""
+        if not payload:
+            self._generation += 1
+            self._loaded = False
+            return
+        # Пачку изменений перечитываем одним запросом
+        self._pending.add(int(payload))
+        if self._refresh_task is None or self._refresh_task.done():
+            self._refresh_task = asyncio.get_running_loop().create_task(self._refresh_pending())
+
+    async def _refresh_pending(self):
+        while self._pending:
+            project_ids = list(self._pending)
+            self._pending.clear()
+            await self.refresh(*project_ids)
+
+    def _total_pages(self) -> int:
+        return max(1, (len(self._order) + self.per_page - 1) // self.per_page)
+
+    def _pages_changed(self, index: int, total_pages: int):
+        """Сбросить клавиатуры страниц, начиная со страницы позиции index"""
+        if self._total_pages() != total_pages:
+            # Изменилось число страниц - индикатор "N/M" устарел везде
+            self._pages.clear()
+            return
+        first = index // self.per_page
+        for page in [page for page in self._pages if page >= first]:
+            del self._pages[page]
+
+    def _put(self, record: ProjectRecord):
+        old = self._projects.get(record.id)
+        if old is not None and old.sort_key == record.sort_key:
+            # Позиция в списке не изменилась - меняется только страница проекта
+            index = bisect.bisect_left(self._keys, record.sort_key)
+            self._order[index] = record
+            self._projects[record.id] = record
+            self._pages.pop(index // self.per_page, None)
+            if old.title != record.title:
+                self._index.add(record.id, record.title)
+            return
+
+        if old is not None:
+            self._discard(record.id)
+        total_pages = self._total_pages()
+        index = bisect.bisect_left(self._keys, record.sort_key)
+        self._keys.insert(index, record.sort_key)
+        self._order.insert(index, record)
+        self._projects[record.id] = record
+        self._index.add(record.id, record.title)
+        self._pages_changed(index, total_pages)
+
+    def _discard(self, project_id: int):
+        old = self._projects.pop(project_id, None)
+        if old is None:
+            return
+        total_pages = self._total_pages()
+        index = bisect.bisect_left(self._keys, old.sort_key)
+        del self._keys[index]
+        del self._order[index]
+        self._index.remove(project_id)
+        self._pages_changed(index, total_pages)
+
+    async def _load(self):
+        generation = self._generation
+        rows = await db.get_projects()
+        records = sorted((ProjectRecord(row) for row in rows), key=lambda record: record.sort_key)
+        self._order = records
+        self._keys = [record.sort_key for record in records]
+        self._projects = {record.id: record for record in records}
+        self._index.rebuild((record.id, record.title) for record in records)
+        self._pages.clear()
+        self._loaded = generation == self._generation
+        logger.info(f"Загружено проектов в память: {len(records)}")
+
+    async def load(self):
+        """Загрузить все проекты из БД (при запуске бота)"""
+        async with self._lock:
+            await self._load()
+
+    async def _ensure_loaded(self):
+        if self._loaded:
+            return
+        async with self._lock:
+            if not self._loaded:
+                await self._load()
+
+    async def refresh(self, *project_ids: int):
+        """Перечитать проекты из БД после изменения (удаленные убираются из памяти)"""
+        async with self._lock:
+            if not self._loaded:
+                # Проекты будут загружены целиком при следующем чтении
+                return
+            try:
+                rows = await db.get_projects_by_ids(list(project_ids))
+            except Exception as e:
+                logger.error(f"Ошибка обновления проектов в памяти: {e}")
+                self._loaded = False
+                return
+            found = {row['id']: row for row in rows}
+            for project_id in project_ids:
+                row = found.get(project_id)
+                if row:
+                    self._put(ProjectRecord(row))
+                else:
+                    self._discard(project_id)
+
+    async def get(self, project_id: int) -> Optional[ProjectRecord]:
+        """Проект по ID"""
+        await self._ensure_loaded()
+        return self._projects.get(project_id)
+
+    async def get_page(self, page: int, cursor: Optional[Tuple[datetime, int]] = None,
+                       backward: bool = False) -> Tuple[int, int, int, Optional[InlineKeyboardMarkup]]:
+        """Страница списка: (номер страницы, всего проектов, всего страниц, клавиатура).
+
+        cursor - (created_at, id) граничного проекта из кнопки навигации: показывается
+        страница с проектом после него (backward=True - перед ним). Если список пуст,
+        клавиатура None.
+        """
+        await self._ensure_loaded()
+        if not self._order:
+            return 0, 0, 0, None
+
+        if cursor is not None:
+            key = sort_key(*cursor)
+            if backward:
+                index = bisect.bisect_left(self._keys, key) - 1
+            else:
+                index = bisect.bisect_right(self._keys, key)
+            page = max(index, 0) // self.per_page
+        total_pages = self._total_pages()
+        page = max(0, min(page, total_pages - 1))
+
+        markup = self._pages.get(page)
+        if markup is None:
+            start = page * self.per_page
+            markup = self._pages[page] = get_projects_menu(
+                self._order[start:start + self.per_page], page, total_pages
+            )
+        return page, len(self._order), total_pages, markup
+
+    async def search(self, query: str, offset: int = 0, limit: int = 20) -> Tuple[List[ProjectRecord], bool]:
+        """Поиск по названиям (из памяти): (проекты, есть ли еще результаты).
+        Сначала проекты, название которых начинается с запроса, затем остальные, от новых к старым.
+        Пустой запрос - последние проекты.
+        """
+        await self._ensure_loaded()
+        offset = max(offset, 0)
+        query = normalize(query)
+        if not query:
+            found = self._order[offset:offset + limit + 1]
+        else:
+            title = self._index.title
+            records = (self._projects[project_id] for project_id in self._index.search(query))
+            found = heapq.nsmallest(
+                offset + limit + 1, records,
+                key=lambda record: (not title(record.id).startswith(query), record.sort_key)
+            )[offset:]
+        return found[:limit], len(found) > limit
+
+    def page_projects(self, page: int) -> List[ProjectRecord]:
+        """Проекты страницы (без загрузки из БД; страница за концом списка - пустая)"""
+        start = page * self.per_page
+        return self._order[start:start + self.per_page] if page >= 0 else []
+
+# Глобальная модель чтения портфолио
+portfolio = Portfolio()
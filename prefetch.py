@@ -0,0 +1,94 @@
+"""
+Предзагрузка фото проектов: пока админ смотрит страницу списка, фото ее проектов
+заранее отправляются в Telegram, чтобы карточка проекта открывалась по file_id
+"""
+import asyncio
+import logging
+import time
+from collections import OrderedDict
+from typing import Dict, Iterable, Optional, Set
+
+from config import PREFETCH_CHAT_ID, PREFETCH_TTL
+from image_cache import photo_file_ids
+from telegram_scheduler import request_priority, PRIORITY_BACKGROUND
+
+logger = logging.getLogger(__name__)
+
+class PhotoPrefetcher:
+    """
+    Получает file_id для фото, которых Telegram еще не видел: фото отправляется
+    в служебный чат и сразу удаляется, file_id сохраняется в photo_file_ids.
+    Запросы идут с фоновым приоритетом и не задерживают ответы пользователям.
+    Недавние попытки хранятся в небольшом TTL-кэше, чтобы листание списка
+    не отправляло одно и то же фото повторно.
+    """
+
+    def __init__(self, chat_id: Optional[int], ttl: float = 600, max_concurrent: int = 2,
+                 max_urls: int = 1000):
+        self.chat_id = chat_id
+        self.ttl = ttl
+        self.max_urls = max_urls
+        self._semaphore = asyncio.Semaphore(max_concurrent)
+        self._attempted: "OrderedDict[str, float]" = OrderedDict()
+        self._tasks: Set[asyncio.Task] = set()
+        self._counters = {"prefetched": 0, "failed": 0}
+
+    def stats(self) -> Dict[str, int]:
+        """Счетчики для мониторинга"""
+        return dict(self._counters, in_progress=len(self._tasks))
+
+    def _should_prefetch(self, url: Optional[str], now: float) -> bool:
+        if not url or photo_file_ids.resolve(url) != url:
+            return False
+        attempted_at = self._attempted.get(url)
+        if attempted_at is not None and now - attempted_at < self.ttl:
+            return False
+        self._attempted[url] = now
+        self._attempted.move_to_end(url)
+        while len(self._attempted) > self.max_urls:
+            self._attempted.popitem(last=False)
+        return True
+
+    def schedule(self, bot, projects: Iterable):
+        """Запустить в фоне предзагрузку фото проектов (без служебного чата - ничего не делает)"""
+        if not self.chat_id:
+            return
+        now = time.monotonic()
+        urls = [project.image_url for project in projects if self._should_prefetch(project.image_url, now)]
+        if not urls:
+            return
+        task = asyncio.create_task(self._prefetch(bot, urls))
+        self._tasks.add(task)
+        task.add_done_callback(self._tasks.discard)
+
+    async def _prefetch(self, bot, urls):
+        with request_priority(PRIORITY_BACKGROUND):
+            await asyncio.gather(*(self._prefetch_one(bot, url) for url in urls))
+
+    async def _prefetch_one(self, bot, url: str):
+        async with self._semaphore:
+            # Фото могли отправить, пока задача ждала очереди
+            if photo_file_ids.resolve(url) != url:
+                return
+            try:
+                sent = await bot.send_photo(self.chat_id, photo=url, disable_notification=True)
+                await photo_file_ids.remember(url, sent)
+                self._counters["prefetched"] += 1
+            except Exception as e:
+                self._counters["failed"] += 1
+                logger.debug(f"Не удалось предзагрузить фото {url}: {e}")
+                return
+            try:
+                await bot.delete_message(self.chat_id, sent.message_id)
+            except Exception as e:
+                logger.debug(f"Не удалось удалить сообщение предзагрузки: {e}")
+
+    async def close(self):
+        """Отменить незавершенную предзагрузку"""
+        for task in list(self._tasks):
+            task.cancel()
+        await asyncio.gather(*self._tasks, return_exceptions=True)
+        self._tasks.clear()
+
+# Глобальный экземпляр предзагрузки фото
+prefetcher = PhotoPrefetcher(PREFETCH_CHAT_ID, PREFETCH_TTL)
@@ -0,0 +1,461 @@
+"""
+Хранилища изображений: общий интерфейс и конвейер Telegram -> обработка -> хранилище.
+
+Реализации: imgbb (imgbb_uploader.py), локальная папка, отдаваемая HTTP-сервером бота,
+и S3-совместимое объектное хранилище (AWS S3, MinIO и т.п.).
+"""
+import asyncio
+import hashlib
+import hmac
+import io
+import os
+import uuid
+import aiohttp
+import aiofiles
+import aiofiles.os
+import logging
+from abc import ABC, abstractmethod
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timezone
+from typing import Optional, Union, AsyncIterable, Awaitable, Callable, Sequence, Tuple, Dict
+from urllib.parse import quote, urlparse
+
+try:
+    from PIL import Image, ImageOps
+except ImportError:  # Pillow не установлен - изображения загружаются без обработки
+    Image = None
+
+logger = logging.getLogger(__name__)
+
+ImageData = Union[bytes, AsyncIterable[bytes]]
+
+# URL-префикс, по которому HTTP-сервер бота отдает файлы локального хранилища
+LOCAL_STORAGE_ROUTE = "/images"
+
+def select_photo_size(photo_sizes: Sequence, target_side: int):
+    """Выбрать наименьший PhotoSize, у которого большая сторона не меньше target_side.
+    
+    Если таких нет, возвращается самый большой. target_side <= 0 - всегда самый большой.
+    """
+    if target_side > 0:
+        for photo in sorted(photo_sizes, key=lambda p: max(p.width, p.height)):
+            if max(photo.width, photo.height) >= target_side:
+                return photo
+    return max(photo_sizes, key=lambda p: p.width * p.height)
+
+def preprocess_image(image_bytes: bytes, max_side: int, quality: int = 82,
+                     image_format: str = "JPEG", thumbnail_side: int = 320) -> Tuple[bytes, Optional[bytes]]:
+    """Уменьшить и пережать изображение без метаданных, сделать миниатюру.
+    
+    Выполняется синхронно - вызывайте в пуле потоков, а не в event loop.
+    """
+    with Image.open(io.BytesIO(image_bytes)) as source:
+        # Учитываем поворот из EXIF до того, как метаданные будут отброшены
+        image = ImageOps.exif_transpose(source)
+        if image.has_transparency_data:
+            # Прозрачность в JPEG не сохраняется: кладем изображение на белый фон по альфа-каналу,
+            # иначе прозрачные области станут черными
+            rgba = image.convert("RGBA")
+            image = Image.new("RGB", rgba.size, (255, 255, 255))
+            image.paste(rgba, mask=rgba.getchannel("A"))
+        elif image.mode not in ("RGB", "L"):
+            image = image.convert("RGB")
+        
+        image.thumbnail((max_side, max_side), Image.LANCZOS)
+        # Новый буфер без exif/icc: метаданные в результат не попадают
+        output = io.BytesIO()
+        image.save(output, format=image_format, quality=quality, optimize=True)
+        
+        thumbnail = None
+        if thumbnail_side > 0:
+            thumb_image = image.copy()
+            thumb_image.thumbnail((thumbnail_side, thumbnail_side), Image.LANCZOS)
+            thumb_output = io.BytesIO()
+            thumb_image.save(thumb_output, format=image_format, quality=quality, optimize=True)
+            thumbnail = thumb_output.getvalue()
+        
+        return output.getvalue(), thumbnail
+
+async def _hashing_iter(chunks: AsyncIterable[bytes], hasher) -> AsyncIterable[bytes]:
+    """Пропускает блоки дальше, попутно обновляя хэш"""
+    async for chunk in chunks:
+        hasher.update(chunk)
+        yield chunk
+
+async def _iter_data(data: ImageData) -> AsyncIterable[bytes]:
+    """Единый асинхронный поток блоков для байтов и потоков"""
+    if isinstance(data, (bytes, bytearray)):
+        yield bytes(data)
+    else:
+        async for chunk in data:
+            yield chunk
+
+class ImageStorage(ABC):
+    """Базовое хранилище изображений.
+    
+    Держит общую HTTP-сессию (скачивание из Telegram и запросы к хранилищу), ограничивает
+    число одновременных загрузок и выполняет обработку изображений в пуле потоков.
+    Реализации определяют put, delete и exists_many.
+    """
+    
+    def __init__(self, max_concurrent_uploads: int = 4,
+                 connect_timeout: float = 10, total_timeout: float = 60,
+                 connections_per_host: int = 8, chunk_size: int = 64 * 1024,
+                 max_side: int = 1280, quality: int = 82, image_format: str = "JPEG",
+                 thumbnail_side: int = 320, preprocess_workers: int = 2):
+        self.connections_per_host = connections_per_host
+        # Размер блока при потоковой пересылке файла из Telegram в хранилище
+        self.chunk_size = chunk_size
+        self.timeout = aiohttp.ClientTimeout(total=total_timeout, sock_connect=connect_timeout)
+        # Ограничиваем число одновременных загрузок (скачивание + отправка в хранилище)
+        self._upload_semaphore = asyncio.Semaphore(max_concurrent_uploads)
+        self._session: Optional[aiohttp.ClientSession] = None
+        # Параметры обработки изображений перед загрузкой
+        self.max_side = max_side
+        self.quality = quality
+        self.image_format = image_format
+        self.content_type = f"image/{image_format.lower()}"
+        self.thumbnail_side = thumbnail_side
+        self.preprocess_workers = preprocess_workers
+        self._executor: Optional[ThreadPoolExecutor] = None
+        if max_side > 0 and Image is None:
+            logger.warning("Pillow не установлен. Изображения будут загружаться без обработки.")
+    
+    @property
+    def preprocess_enabled(self) -> bool:
+        """Включена ли обработка изображений перед загрузкой"""
+        return Image is not None and self.max_side > 0
+    
+    async def start(self):
+        """Создать общую HTTP-сессию с пулом keep-alive соединений"""
+        if self._session and not self._session.closed:
+            return
+        connector = aiohttp.TCPConnector(
+            limit_per_host=self.connections_per_host,
+            ttl_dns_cache=300,
+            keepalive_timeout=60,
+        )
+        self._session = aiohttp.ClientSession(connector=connector, timeout=self.timeout)
+    
+    async def close(self):
+        """Закрыть общую HTTP-сессию и пул обработки изображений"""
+        if self._session and not self._session.closed:
+            await self._session.close()
+        self._session = None
+        if self._executor:
+            self._executor.shutdown(wait=False)
+            self._executor = None
+    
+    async def _get_session(self) -> aiohttp.ClientSession:
+        """Получить общую сессию (создается при первом обращении, если start() не вызывался)"""
+        if self._session is None or self._session.closed:
+            await self.start()
+        return self._session
+    
+    def web_routes(self) -> list:
+        """Маршруты aiohttp, которые должен обслуживать HTTP-сервер бота"""
+        return []
+    
+    @abstractmethod
+    async def put(self, data: ImageData, name: str, content_type: str) -> Optional[str]:
+        """Сохранить изображение (байты или поток блоков), вернуть публичный URL"""
+    
+    @abstractmethod
+    async def delete(self, url: str) -> bool:
+        """Удалить изображение по URL (True - удалено или уже отсутствует)"""
+    
+    @abstractmethod
+    async def exists_many(self, urls: Sequence[str]) -> Dict[str, bool]:
+        """Проверить наличие нескольких изображений за один вызов"""
+    
+    async def _head_many(self, urls: Sequence[str], headers_for=None) -> Dict[str, bool]:
+        """Проверка наличия по HTTP HEAD, запросы выполняются параллельно"""
+        session = await self._get_session()
+        
+        async def check(url: str) -> bool:
+            try:
+                headers = headers_for(url) if headers_for else None
+                async with session.head(url, headers=headers, allow_redirects=True) as response:
+                    return response.status == 200
+            except Exception as e:
+                logger.warning(f"Не удалось проверить изображение {url}: {e}")
+                return False
+        
+        results = await asyncio.gather(*(check(url) for url in urls))
+        return dict(zip(urls, results))
+    
+    async def upload_from_bytes(self, image_bytes: bytes, name: str = "image") -> Optional[str]:
+        """Загрузить изображение из байтов"""
+        async with self._upload_semaphore:
+            return await self.put(image_bytes, name, self.content_type)
+    
+    async def upload_from_telegram_photo(self, bot, file_id: str, name: str = "telegram_photo",
+                                         hasher=None) -> Optional[str]:
+        """Загрузить фото из Telegram потоком: блоки скачивания сразу уходят в хранилище.
+        
+        hasher (например, hashlib.sha256()) обновляется каждым блоком по ходу пересылки.
+        """
+        async with self._upload_semaphore:
+            try:
+                # Получаем файл из Telegram
+                file = await bot.get_file(file_id)
+                
+                session = await self._get_session()
+                file_url = f"https://api.telegram.org/file/bot{bot.token}/{file.file_path}"
+                async with session.get(file_url) as response:
+                    if response.status != 200:
+                        logger.error(f"Не удалось скачать файл из Telegram: {response.status}")
+                        return None
+                    
+                    chunks = response.content.iter_chunked(self.chunk_size)
+                    if hasher is not None:
+                        chunks = _hashing_iter(chunks, hasher)
+                    return await self.put(chunks, name, "image/jpeg")
+            
+            except Exception as e:
+                logger.error(f"Ошибка при загрузке фото из Telegram: {e}")
+            
+            return None
+
+    async def upload_processed_from_telegram_photo(
+        self, bot, file_id: str, name: str = "telegram_photo", hasher=None,
+        find_existing: Optional[Callable[[str], Awaitable[Optional[Tuple[str, Optional[str]]]]]] = None
+    ) -> Optional[Tuple[str, Optional[str]]]:
+        """Скачать фото из Telegram, обработать в пуле потоков и загрузить вместе с миниатюрой.
+        
+        Возвращает (URL изображения, URL миниатюры). hasher обновляется исходными байтами.
+        find_existing(хэш) - поиск уже загруженного изображения с таким содержимым:
+        если оно найдено, возвращаются его URL и ничего не загружается.
+        """
+        async with self._upload_semaphore:
+            try:
+                file = await bot.get_file(file_id)
+                
+                session = await self._get_session()
+                file_url = f"https://api.telegram.org/file/bot{bot.token}/{file.file_path}"
+                async with session.get(file_url) as response:
+                    if response.status != 200:
+                        logger.error(f"Не удалось скачать файл из Telegram: {response.status}")
+                        return None
+                    # Размер ограничен выбором PhotoSize (см. select_photo_size)
+                    original = await response.read()
+                
+                if hasher is not None:
+                    hasher.update(original)
+                    if find_existing is not None:
+                        existing = await find_existing(hasher.hexdigest())
+                        if existing:
+                            return existing
+                
+                if self._executor is None:
+                    self._executor = ThreadPoolExecutor(
+                        max_workers=self.preprocess_workers, thread_name_prefix="image-preprocess"
+                    )
+                image_bytes, thumbnail_bytes = await asyncio.get_running_loop().run_in_executor(
+                    self._executor, preprocess_image, original,
+                    self.max_side, self.quality, self.image_format, self.thumbnail_side
+                )
+                
+                url = await self.put(image_bytes, name, self.content_type)
+                if not url:
+                    return None
+                
+                thumbnail_url = None
+                if thumbnail_bytes:
+                    thumbnail_url = await self.put(thumbnail_bytes, f"{name}_thumb", self.content_type)
+                return url, thumbnail_url
+            
+            except Exception as e:
+                logger.error(f"Ошибка при обработке и загрузке фото из Telegram: {e}")
+            
+            return None
+
+def _object_key(name: str, content_type: str) -> str:
+    """Уникальное имя файла в хранилище"""
+    extension = content_type.split("/")[-1].replace("jpeg", "jpg")
+    safe_name = "".join(c if c.isalnum() or c in "-_" else "_" for c in name)[:40]
+    return f"{uuid.uuid4().hex}_{safe_name}.{extension}"
+
+class LocalStorage(ImageStorage):
+    """Файлы в локальной папке, отдаются HTTP-сервером бота по адресу {base_url}/<имя файла>"""
+    
+    def __init__(self, root: str, base_url: str, **options):
+        super().__init__(**options)
+        self.root = os.path.abspath(root)
+        self.base_url = base_url.rstrip("/")
+        os.makedirs(self.root, exist_ok=True)
+    
+    def web_routes(self) -> list:
+        from aiohttp import web
+        return [web.static(LOCAL_STORAGE_ROUTE, self.root)]
+    
+    def _path_for(self, url: str) -> Optional[str]:
+        """Путь к файлу по его URL (None - URL не из этого хранилища)"""
+        prefix = self.base_url + "/"
+        if not url.startswith(prefix):
+            return None
+        key = url[len(prefix):]
+        if "/" in key or key in ("", ".", ".."):
+            return None
+        return os.path.join(self.root, key)
+    
+    async def put(self, data: ImageData, name: str, content_type: str) -> Optional[str]:
+        """Записать изображение в папку потоком"""
+        key = _object_key(name, content_type)
+        path = os.path.join(self.root, key)
+        try:
+            async with aiofiles.open(path, "wb") as file:
+                async for chunk in _iter_data(data):
+                    await file.write(chunk)
+            return f"{self.base_url}/{key}"
+        except Exception as e:
+            logger.error(f"Ошибка записи изображения в {path}: {e}")
+            try:
+                await aiofiles.os.remove(path)
+            except OSError:
+                pass
+            return None
+    
+    async def delete(self, url: str) -> bool:
+        """Удалить файл изображения"""
+        path = self._path_for(url)
+        if not path:
+            return False
+        try:
+            await aiofiles.os.remove(path)
+        except FileNotFoundError:
+            pass
+        except OSError as e:
+            logger.error(f"Ошибка удаления изображения {path}: {e}")
+            return False
+        return True
+    
+    async def exists_many(self, urls: Sequence[str]) -> Dict[str, bool]:
+        """Проверить наличие файлов"""
+        result = {}
+        for url in urls:
+            path = self._path_for(url)
+            result[url] = bool(path) and await aiofiles.os.path.exists(path)
+        return result
+
+class S3Storage(ImageStorage):
+    """S3-совместимое хранилище (AWS S3, MinIO и т.п.), запросы подписываются AWS Signature V4.
+    
+    Используется адресация path-style ({endpoint}/{bucket}/{key}), которую поддерживает и MinIO.
+    """
+    
+    def __init__(self, endpoint: str, bucket: str, access_key: str, secret_key: str,
+                 region: str = "us-east-1", public_base_url: str = None, **options):
+        super().__init__(**options)
+        self.endpoint = endpoint.rstrip("/")
+        self.bucket = bucket
+        self.access_key = access_key
+        self.secret_key = secret_key
+        self.region = region
+        self.public_base_url = (public_base_url or f"{self.endpoint}/{bucket}").rstrip("/")
+    
+    def _object_url(self, key: str) -> str:
+        return f"{self.endpoint}/{self.bucket}/{quote(key)}"
+    
+    def _key_for(self, url: str) -> Optional[str]:
+        """Ключ объекта по публичному URL (None - URL не из этого хранилища)"""
+        prefix = self.public_base_url + "/"
+        return url[len(prefix):] if url.startswith(prefix) else None
+    
+    def _signed_headers(self, method: str, key: str, payload_hash: str,
+                        extra_headers: Dict[str, str] = None) -> Dict[str, str]:
+        """Заголовки запроса с подписью AWS Signature V4"""
+        now = datetime.now(timezone.utc)
+        amz_date = now.strftime("%Y%m%dT%H%M%SZ")
+        date_stamp = now.strftime("%Y%m%d")
+        
+        headers = {
+            "host": urlparse(self.endpoint).netloc,
+            "x-amz-content-sha256": payload_hash,
+            "x-amz-date": amz_date,
+        }
+        for name, value in (extra_headers or {}).items():
+            headers[name.lower()] = value
+        
+        signed_header_names = ";".join(sorted(headers))
+        canonical_headers = "".join(f"{name}:{headers[name].strip()}\n" for name in sorted(headers))
+        canonical_request = "\n".join([
+            method,
+            f"/{self.bucket}/{quote(key)}",
+            "",
+            canonical_headers,
+            signed_header_names,
+            payload_hash,
+        ])
+        
+        scope = f"{date_stamp}/{self.region}/s3/aws4_request"
+        string_to_sign = "\n".join([
+            "AWS4-HMAC-SHA256",
+            amz_date,
+            scope,
+            hashlib.sha256(canonical_request.encode()).hexdigest(),
+        ])
+        
+        signing_key = ("AWS4" + self.secret_key).encode()
+        for part in (date_stamp, self.region, "s3", "aws4_request"):
+            signing_key = hmac.new(signing_key, part.encode(), hashlib.sha256).digest()
+        signature = hmac.new(signing_key, string_to_sign.encode(), hashlib.sha256).hexdigest()
+        
+        headers["authorization"] = (
+            f"AWS4-HMAC-SHA256 Credential={self.access_key}/{scope}, "
+            f"SignedHeaders={signed_header_names}, Signature={signature}"
+        )
+        # host aiohttp выставит сам
+        del headers["host"]
+        return headers
+    
+    async def put(self, data: ImageData, name: str, content_type: str) -> Optional[str]:
+        """Загрузить объект (PUT Object).
+        
+        PUT Object требует Content-Length, поэтому поток собирается в один буфер;
+        его размер ограничен выбором PhotoSize и обработкой изображения.
+        """
+        key = _object_key(name, content_type)
+        try:
+            body = b"".join([chunk async for chunk in _iter_data(data)])
+            headers = self._signed_headers(
+                "PUT", key, hashlib.sha256(body).hexdigest(), {"content-type": content_type}
+            )
+            session = await self._get_session()
+            async with session.put(self._object_url(key), data=body, headers=headers) as response:
+                if response.status == 200:
+                    return f"{self.public_base_url}/{key}"
+                logger.error(f"HTTP ошибка при загрузке в S3: {response.status} {await response.text()}")
+        except Exception as e:
+            logger.error(f"Исключение при загрузке в S3: {e}")
+        return None
+    
+    async def delete(self, url: str) -> bool:
+        """Удалить объект (DELETE Object)"""
+        key = self._key_for(url)
+        if key is None:
+            return False
+        try:
+            headers = self._signed_headers("DELETE", key, hashlib.sha256(b"").hexdigest())
+            session = await self._get_session()
+            async with session.delete(self._object_url(key), headers=headers) as response:
+                if response.status in (200, 204, 404):
+                    return True
+                logger.error(f"HTTP ошибка при удалении из S3: {response.status}")
+        except Exception as e:
+            logger.error(f"Исключение при удалении из S3: {e}")
+        return False
+    
+    async def exists_many(self, urls: Sequence[str]) -> Dict[str, bool]:
+        """Проверить наличие объектов (HEAD Object, параллельно)"""
+        keys = {url: self._key_for(url) for url in urls}
+        object_urls = {self._object_url(key): key for key in keys.values() if key is not None}
+        
+        def headers_for(object_url: str) -> Dict[str, str]:
+            return self._signed_headers("HEAD", object_urls[object_url], hashlib.sha256(b"").hexdigest())
+        
+        checked = await self._head_many(list(object_urls), headers_for=headers_for)
+        return {
+            url: key is not None and checked.get(self._object_url(key), False)
+            for url, key in keys.items()
+        }
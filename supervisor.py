@@ -0,0 +1,193 @@
+"""
+Супервизор: запуск бота в нескольких процессах.
+
+Один процесс принимает обновления (HTTP-сервер / long polling) и пишет их в очередь,
+SUPERVISOR_WORKERS процессов их обрабатывают - каждый свою часть чатов (по chat_id),
+поэтому обновления одного чата всегда идут в один процесс и по порядку.
+У каждого процесса свой пул соединений с базой и свой диспетчер aiogram.
+
+SIGTERM/SIGINT - остановить все процессы, SIGHUP - поочередный перезапуск.
+"""
+import logging
+import multiprocessing
+import os
+import queue
+import signal
+import time
+
+# Сколько ждать штатного завершения процесса перед принудительной остановкой (сек)
+STOP_TIMEOUT = 45
+# Задержка перезапуска упавшего процесса (сек)
+RESTART_DELAY = 5
+
+logging.basicConfig(
+    level=logging.INFO,
+    format='%(asctime)s - %(name)s - %(levelname)s - %(message)s'
+)
+logger = logging.getLogger("supervisor")
+
+def run_child(role: str, index: int, count: int, heartbeat):
+    """Точка входа дочернего процесса: роль задается до импорта конфигурации бота"""
+    os.environ["BOT_ROLE"] = role
+    os.environ["WORKER_INDEX"] = str(index)
+    os.environ["WORKER_COUNT"] = str(count)
+    # Ctrl+C в терминале получает вся группа процессов - останавливает супервизор
+    signal.signal(signal.SIGINT, signal.SIG_IGN)
+
+    import asyncio
+    import main
+    asyncio.run(main.main(heartbeat))
+
+class Supervisor:
+    """Запускает, перезапускает и контролирует процессы бота"""
+
+    def __init__(self, workers: int, health_interval: float = 10.0, health_timeout: float = 60.0):
+        self.workers = workers
+        self.health_interval = health_interval
+        self.health_timeout = health_timeout
+        self._ctx = multiprocessing.get_context("spawn")
+        self._heartbeat = self._ctx.Queue()
+        self._children = {}
+        self._health = {}
+        self._restart_at = {}
+        self._stopping = False
+        self._rolling_restart = False
+
+    @staticmethod
+    def _name(role: str, index: int) -> str:
+        return role if role == "ingest" else f"{role}-{index}"
+
+    def _spawn(self, role: str, index: int):
+        """Запустить дочерний процесс"""
+        name = self._name(role, index)
+        process = self._ctx.Process(
+            target=run_child,
+            args=(role, index, self.workers, self._heartbeat),
+            name=name
+        )
+        process.start()
+        self._children[name] = (process, role, index)
+        # Отсчет таймаута зависания - с момента запуска
+        self._health[name] = {"time": time.time(), "pid": process.pid}
+        logger.info(f"Запущен процесс {name} (pid {process.pid})")
+        return process
+
+    def _terminate(self, process, timeout: float = STOP_TIMEOUT):
+        """Штатно остановить процесс (SIGTERM), по таймауту - принудительно"""
+        if process.is_alive():
+            process.terminate()
+            process.join(timeout)
+        if process.is_alive():
+            logger.warning(f"Процесс {process.name} не завершился за {timeout} с, принудительная остановка")
+            process.kill()
+            process.join()
+
+    def _restart(self, name: str):
+        """Перезапустить процесс. Старый процесс останавливается до запуска нового:
+        порт и getUpdates может держать только один процесс приема, а чаты обработчика -
+        только один процесс (обновления копятся в очереди и будут обработаны после запуска)"""
+        process, role, index = self._children[name]
+        self._terminate(process)
+        self._spawn(role, index)
+        # Пока ждали остановки, отчеты не читались - отсчет зависания начинаем заново
+        self._collect_heartbeats()
+        now = time.time()
+        for report in self._health.values():
+            report["time"] = max(report["time"], now)
+
+    def _collect_heartbeats(self):
+        """Забрать отчеты дочерних процессов"""
+        while True:
+            try:
+                report = self._heartbeat.get_nowait()
+            except queue.Empty:
+                return
+            name = self._name(report["role"], report["index"])
+            process = self._children.get(name, (None,))[0]
+            # Отчеты от уже замененного процесса пропускаем
+            if process and process.pid == report["pid"]:
+                self._health[name] = report
+
+    def _check_children(self):
+        """Перезапустить упавшие и зависшие процессы"""
+        now = time.time()
+        for name, (process, role, index) in list(self._children.items()):
+            if not process.is_alive():
+                if name not in self._restart_at:
+                    logger.error(f"Процесс {name} завершился с кодом {process.exitcode}, "
+                                 f"перезапуск через {RESTART_DELAY} с")
+                    self._restart_at[name] = now + RESTART_DELAY
+                elif now >= self._restart_at[name]:
+                    del self._restart_at[name]
+                    self._spawn(role, index)
+            elif now - self._health[name]["time"] > self.health_timeout:
+                logger.error(f"Процесс {name} не отвечает {self.health_timeout:.0f} с, перезапуск")
+                self._restart(name)
+
+    def _log_health(self):
+        """Сводка по процессам в лог"""
+        now = time.time()
+        parts = []
+        for name, report in sorted(self._health.items()):
+            parts.append(
+                f"{name}: pid {report.get('pid')}, {now - report['time']:.0f} с назад, "
+                f"принято {report.get('ingested', 0)}, обработано {report.get('processed', 0)}, "
+                f"ошибок {report.get('failed', 0)}"
+            )
+        logger.info("Состояние процессов: " + "; ".join(parts))
+
+    def _on_stop(self, signum, frame):
+        self._stopping = True
+
+    def _on_rolling_restart(self, signum, frame):
+        self._rolling_restart = True
+
+    def run(self):
+        """Запустить процессы и следить за ними до сигнала остановки"""
+        signal.signal(signal.SIGTERM, self._on_stop)
+        signal.signal(signal.SIGINT, self._on_stop)
+        if hasattr(signal, "SIGHUP"):
+            signal.signal(signal.SIGHUP, self._on_rolling_restart)
+
+        self._spawn("ingest", 0)
+        for index in range(self.workers):
+            self._spawn("worker", index)
+
+        last_report = time.time()
+        while not self._stopping:
+            time.sleep(1)
+            self._collect_heartbeats()
+
+            if self._rolling_restart:
+                self._rolling_restart = False
+                logger.info("Поочередный перезапуск процессов...")
+                for name in list(self._children):
+                    if self._stopping:
+                        break
+                    self._restart(name)
+
+            self._check_children()
+
+            if time.time() - last_report >= self.health_interval:
+                last_report = time.time()
+                self._log_health()
+
+        logger.info("Остановка процессов...")
+        # Сначала прием обновлений, затем обработчики дорабатывают очередь
+        processes = [process for process, role, index in self._children.values()]
+        processes.sort(key=lambda process: process.name != "ingest")
+        for process in processes:
+            if process.is_alive():
+                process.terminate()
+        for process in processes:
+            self._terminate(process)
+
+if __name__ == "__main__":
+    # Конфигурация импортируется только здесь: дочерние процессы (spawn) заново импортируют
+    # этот модуль, и роль процесса должна быть задана до чтения конфигурации
+    from config import SUPERVISOR_WORKERS, HEALTH_INTERVAL, HEALTH_TIMEOUT, UPDATE_WORKERS
+    # Процессы обмениваются обновлениями через очередь в БД - без нее роли не работают
+    if not UPDATE_WORKERS:
+        raise SystemExit("Супервизор работает только с очередью обновлений: задайте UPDATE_WORKERS > 0 "
+                         "и выполните migration_updates_queue.sql")
+    Supervisor(SUPERVISOR_WORKERS, HEALTH_INTERVAL, HEALTH_TIMEOUT).run()
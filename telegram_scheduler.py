@@ -0,0 +1,219 @@
+"""
+Планировщик исходящих запросов к Telegram Bot API: ограничение частоты и повтор после RetryAfter
+"""
+import asyncio
+import logging
+import time
+from collections import OrderedDict
+from contextlib import contextmanager
+from contextvars import ContextVar
+from typing import Dict, List, Optional
+
+from aiogram.client.session.middlewares.base import BaseRequestMiddleware
+from aiogram.exceptions import TelegramRetryAfter
+
+from config import (
+    TELEGRAM_GLOBAL_RATE, TELEGRAM_GLOBAL_BURST, TELEGRAM_CHAT_RATE,
+    TELEGRAM_CHAT_BURST, TELEGRAM_MAX_RETRIES, TELEGRAM_MAX_CHATS
+)
+
+logger = logging.getLogger(__name__)
+
+# Приоритеты: ответы пользователю раньше служебных удалений сообщений, фоновые запросы - последними
+PRIORITY_INTERACTIVE = 0
+PRIORITY_HOUSEKEEPING = 1
+PRIORITY_BACKGROUND = 2
+
+HOUSEKEEPING_METHODS = frozenset({"deleteMessage", "deleteMessages"})
+
+# Методы, которые не отправляют сообщений в чат и не ограничиваются (long polling и т.п.)
+UNTHROTTLED_METHODS = frozenset({"getUpdates", "getFile", "getMe", "answerCallbackQuery",
+                                 "answerInlineQuery", "setWebhook", "deleteWebhook"})
+
+# Приоритет, заданный вызывающим кодом (вместо определяемого по методу)
+_priority: ContextVar[Optional[int]] = ContextVar("telegram_request_priority", default=None)
+
+@contextmanager
+def request_priority(priority: int):
+    """Запросы внутри блока (и запущенных из него задач) выдаются с приоритетом priority"""
+    token = _priority.set(priority)
+    try:
+        yield
+    finally:
+        _priority.reset(token)
+
+class RateBucket:
+    """Token bucket с паузой (после RetryAfter)"""
+    __slots__ = ("rate", "burst", "tokens", "updated", "paused_until")
+
+    def __init__(self, rate: float, burst: float, now: float):
+        self.rate = rate
+        self.burst = burst
+        self.tokens = burst
+        self.updated = now
+        self.paused_until = 0.0
+
+    def delay(self, now: float) -> float:
+        """Через сколько секунд будет доступен токен"""
+        self.tokens = min(self.burst, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+        wait = 0.0 if self.tokens >= 1 else (1 - self.tokens) / self.rate
+        return max(wait, self.paused_until - now)
+
+    def take(self):
+        self.tokens -= 1
+
+class _Waiter:
+    __slots__ = ("priority", "seq", "chat_id", "future", "enqueued_at")
+
+    def __init__(self, priority: int, seq: int, chat_id, future: asyncio.Future, now: float):
+        self.priority = priority
+        self.seq = seq
+        self.chat_id = chat_id
+        self.future = future
+        self.enqueued_at = now
+
+class TelegramRequestScheduler(BaseRequestMiddleware):
+    """
+    Middleware сессии бота: каждый запрос, отправляющий что-то в чат, ждет токен
+    общего bucket'а и bucket'а своего чата. Ожидающие запросы выдаются по приоритету,
+    запрос, упершийся в лимит своего чата, не задерживает другие чаты.
+    TelegramRetryAfter приостанавливает чат на retry_after и запрос повторяется.
+    """
+
+    def __init__(self, global_rate: float = 25.0, global_burst: float = 30.0,
+                 chat_rate: float = 1.0, chat_burst: float = 3.0,
+                 max_retries: int = 3, max_chats: int = 10000):
+        self.chat_rate = chat_rate
+        self.chat_burst = chat_burst
+        self.max_retries = max_retries
+        self.max_chats = max_chats
+        self._global = RateBucket(global_rate, global_burst, time.monotonic())
+        self._chats: "OrderedDict[object, RateBucket]" = OrderedDict()
+        self._waiters: List[_Waiter] = []
+        self._seq = 0
+        self._wakeup: Optional[asyncio.Event] = None
+        self._task: Optional[asyncio.Task] = None
+        self._counters = {
+            "requests": 0,
+            "retry_after": 0,
+            "waited": 0,
+            "wait_seconds_total": 0.0,
+            "wait_seconds_max": 0.0
+        }
+
+    def stats(self) -> Dict[str, float]:
+        """Счетчики для мониторинга: длина очереди по приоритетам и время ожидания"""
+        interactive = sum(1 for w in self._waiters if w.priority == PRIORITY_INTERACTIVE)
+        return dict(
+            self._counters,
+            queue_depth=len(self._waiters),
+            queue_depth_interactive=interactive,
+            queue_depth_housekeeping=len(self._waiters) - interactive
+        )
+
+    async def close(self):
+        """Остановить выдачу разрешений"""
+        if self._task:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+
+    def _chat(self, chat_id, now: float) -> RateBucket:
+        """Bucket чата (LRU с ограничением размера)"""
+        bucket = self._chats.get(chat_id)
+        if bucket is None:
+            bucket = self._chats[chat_id] = RateBucket(self.chat_rate, self.chat_burst, now)
+            while len(self._chats) > self.max_chats:
+                self._chats.popitem(last=False)
+        else:
+            self._chats.move_to_end(chat_id)
+        return bucket
+
+    async def _acquire(self, chat_id, priority: int):
+        """Дождаться своей очереди на отправку в чат"""
+        if self._task is None or self._task.done():
+            self._wakeup = asyncio.Event()
+            self._task = asyncio.create_task(self._dispatch())
+
+        now = time.monotonic()
+        self._seq += 1
+        waiter = _Waiter(priority, self._seq, chat_id, asyncio.get_running_loop().create_future(), now)
+        self._waiters.append(waiter)
+        self._waiters.sort(key=lambda w: (w.priority, w.seq))
+        self._wakeup.set()
+
+        await waiter.future
+
+        waited = time.monotonic() - now
+        if waited > 0.01:
+            self._counters["waited"] += 1
+            self._counters["wait_seconds_total"] += waited
+            self._counters["wait_seconds_max"] = max(self._counters["wait_seconds_max"], waited)
+
+    async def _dispatch(self):
+        """Выдача разрешений ожидающим запросам в порядке приоритета"""
+        while True:
+            # Сбрасываем до просмотра очереди: новый запрос во время ожидания разбудит цикл
+            self._wakeup.clear()
+            if not self._waiters:
+                await self._wakeup.wait()
+                continue
+
+            now = time.monotonic()
+            earliest = None
+            global_delay = self._global.delay(now)
+            for waiter in list(self._waiters):
+                if waiter.future.done():
+                    # Запрос отменен, пока ждал
+                    self._waiters.remove(waiter)
+                    continue
+                chat = self._chat(waiter.chat_id, now)
+                delay = max(global_delay, chat.delay(now))
+                if delay <= 0:
+                    self._global.take()
+                    chat.take()
+                    self._waiters.remove(waiter)
+                    waiter.future.set_result(None)
+                    earliest = 0
+                    break
+                earliest = delay if earliest is None else min(earliest, delay)
+
+            if earliest:
+                try:
+                    await asyncio.wait_for(self._wakeup.wait(), timeout=earliest)
+                except asyncio.TimeoutError:
+                    pass
+
+    async def __call__(self, make_request, bot, method):
+        api_method = getattr(method, "__api_method__", "")
+        chat_id = getattr(method, "chat_id", None)
+        if api_method in UNTHROTTLED_METHODS or chat_id is None:
+            return await make_request(bot, method)
+
+        priority = _priority.get()
+        if priority is None:
+            priority = PRIORITY_HOUSEKEEPING if api_method in HOUSEKEEPING_METHODS else PRIORITY_INTERACTIVE
+        self._counters["requests"] += 1
+        attempt = 0
+        while True:
+            await self._acquire(chat_id, priority)
+            try:
+                return await make_request(bot, method)
+            except TelegramRetryAfter as e:
+                attempt += 1
+                self._counters["retry_after"] += 1
+                if attempt > self.max_retries:
+                    raise
+                logger.warning(f"Telegram просит подождать {e.retry_after} с ({api_method}, чат {chat_id})")
+                chat = self._chat(chat_id, time.monotonic())
+                chat.paused_until = max(chat.paused_until, time.monotonic() + e.retry_after)
+
+# Глобальный экземпляр планировщика
+telegram_scheduler = TelegramRequestScheduler(
+    TELEGRAM_GLOBAL_RATE, TELEGRAM_GLOBAL_BURST, TELEGRAM_CHAT_RATE,
+    TELEGRAM_CHAT_BURST, TELEGRAM_MAX_RETRIES, TELEGRAM_MAX_CHATS
+)
@@ -0,0 +1,257 @@
+"""
+Очередь входящих обновлений Telegram: прием (polling/webhook) отделен от обработки.
+Обновления сначала записываются в таблицу updates, затем их разбирают воркеры
+"""
+import asyncio
+import hmac
+import logging
+from typing import Any, Dict, List, Optional
+
+from aiogram.types import Update
+from aiohttp import web
+
+from config import (
+    UPDATE_WORKERS, UPDATE_MAX_ATTEMPTS, UPDATE_RETRY_DELAY, UPDATE_LEASE_SECONDS,
+    UPDATE_POLL_INTERVAL, UPDATE_FAILED_RETENTION, UPDATE_CLEANUP_INTERVAL,
+    WORKER_INDEX, WORKER_COUNT
+)
+from database import db, UPDATES_CHANNEL
+
+logger = logging.getLogger(__name__)
+
+# Таймаут long polling getUpdates (сек)
+POLLING_TIMEOUT = 30
+
+def update_chat_id(update: Dict[str, Any]) -> Optional[int]:
+    """Чат обновления (или пользователь, если чата нет) - ключ порядка обработки"""
+    for key, event in update.items():
+        if key == "update_id" or not isinstance(event, dict):
+            continue
+        chat = event.get("chat") or (event.get("message") or {}).get("chat")
+        if chat:
+            return chat["id"]
+        user = event.get("from")
+        if user:
+            return user["id"]
+    return None
+
+class UpdateQueue:
+    """Пул воркеров, разбирающих таблицу updates через FOR UPDATE SKIP LOCKED.
+
+    Обновления одного чата обрабатываются строго по порядку: следующее ждет,
+    пока предыдущее не будет обработано или окончательно не завершится ошибкой.
+    Повторяются только ошибки до запуска обработчиков: обработчик мог успеть
+    что-то сделать (добавить проект, отправить сообщение), поэтому его ошибка
+    записывается, и обновление больше не обрабатывается, как в aiogram.
+    Такие обновления удаляются из таблицы через failed_retention секунд.
+    Воркеры могут работать в нескольких процессах (о новых обновлениях они
+    узнают по NOTIFY); процесс shard_index из shard_count берет только свои чаты.
+    """
+
+    def __init__(self, workers: int = 4, max_attempts: int = 3, retry_delay: float = 2.0,
+                 lease_seconds: float = 120.0, poll_interval: float = 1.0,
+                 failed_retention: float = 604800.0, cleanup_interval: float = 3600.0,
+                 shard_index: int = 0, shard_count: int = 1):
+        self.workers = workers
+        self.shard_index = shard_index
+        self.shard_count = shard_count
+        self.max_attempts = max_attempts
+        self.retry_delay = retry_delay
+        self.lease_seconds = lease_seconds
+        self.poll_interval = poll_interval
+        self.failed_retention = failed_retention
+        self.cleanup_interval = cleanup_interval
+        self._dp = None
+        self._bot = None
+        self._tasks = []
+        self._cleanup_task: Optional[asyncio.Task] = None
+        self._stopping = False
+        self._wakeup: Optional[asyncio.Event] = None
+        self._counters = {
+            "ingested": 0,
+            "duplicates": 0,
+            "processed": 0,
+            "retried": 0,
+            "failed": 0
+        }
+        db.add_notify_handler(UPDATES_CHANNEL, self._on_queued)
+
+    def _on_queued(self, conn, pid, channel, payload):
+        """Обработчик NOTIFY: в очереди появились обновления (payload=None - переподключение)"""
+        if self._wakeup:
+            self._wakeup.set()
+
+    async def start(self, dp, bot):
+        """Запустить воркеры (обновления, оставшиеся с прошлого запуска, тоже будут обработаны)"""
+        self._dp = dp
+        self._bot = bot
+        self._stopping = False
+        self._wakeup = asyncio.Event()
+        self._tasks = [asyncio.create_task(self._worker()) for _ in range(self.workers)]
+        self._cleanup_task = asyncio.create_task(self._cleanup_loop())
+        shard = f", чаты {self.shard_index + 1}/{self.shard_count}" if self.shard_count > 1 else ""
+        logger.info(f"Очередь обновлений запущена: {self.workers} воркеров{shard}")
+
+    async def stop(self, timeout: float = 30.0):
+        """Остановить воркеры: текущие обновления дообрабатываются (не дольше timeout),
+        необработанные остаются в БД"""
+        self._stopping = True
+        if self._wakeup:
+            self._wakeup.set()
+        if self._cleanup_task:
+            self._cleanup_task.cancel()
+            try:
+                await self._cleanup_task
+            except asyncio.CancelledError:
+                pass
+            self._cleanup_task = None
+        if self._tasks:
+            _, pending = await asyncio.wait(self._tasks, timeout=timeout)
+            for task in pending:
+                task.cancel()
+            await asyncio.gather(*self._tasks, return_exceptions=True)
+        self._tasks = []
+
+    def counters(self) -> Dict[str, int]:
+        """Счетчики процесса (без запроса к БД)"""
+        return dict(self._counters)
+
+    async def stats(self) -> Dict[str, Any]:
+        """Счетчики процесса и состояние очереди в БД (длина, задержка обработки)"""
+        stats = self.counters()
+        try:
+            queue = await db.get_update_queue_stats()
+            stats.update(depth=queue['depth'], failed_total=queue['failed'], lag_seconds=queue['lag_seconds'])
+        except Exception as e:
+            logger.error(f"Ошибка получения состояния очереди обновлений: {e}")
+        return stats
+
+    async def ingest(self, updates: List[Dict[str, Any]]) -> int:
+        """Записать обновления в очередь (повторно присланные пропускаются)"""
+        if not updates:
+            return 0
+        inserted = await db.enqueue_updates([
+            {'update_id': update['update_id'], 'chat_id': update_chat_id(update), 'payload': update}
+            for update in updates
+        ])
+        self._counters["ingested"] += inserted
+        self._counters["duplicates"] += len(updates) - inserted
+        if inserted and self._wakeup:
+            self._wakeup.set()
+        return inserted
+
+    async def poll(self, bot, allowed_updates: Optional[List[str]] = None):
+        """Long polling: обновления подтверждаются Telegram только после записи в очередь"""
+        offset = None
+        backoff = 1.0
+        logger.info("Прием обновлений через long polling в очередь")
+        while True:
+            try:
+                updates = await bot.get_updates(
+                    offset=offset,
+                    timeout=POLLING_TIMEOUT,
+                    allowed_updates=allowed_updates,
+                    request_timeout=POLLING_TIMEOUT + 10
+                )
+                if updates:
+                    await self.ingest([
+                        update.model_dump(mode="json", exclude_none=True, by_alias=True)
+                        for update in updates
+                    ])
+                    offset = updates[-1].update_id + 1
+                backoff = 1.0
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                logger.error(f"Ошибка получения обновлений: {e}, повтор через {backoff:.0f} с")
+                await asyncio.sleep(backoff)
+                backoff = min(backoff * 2, 30.0)
+
+    def webhook_handler(self, secret_token: Optional[str] = None):
+        """aiohttp-обработчик webhook: проверяет секрет, записывает обновление и сразу отвечает 200.
+        Если записать не удалось, Telegram получит ошибку и пришлет обновление повторно"""
+        async def handle(request: web.Request) -> web.Response:
+            if secret_token and not hmac.compare_digest(
+                request.headers.get("X-Telegram-Bot-Api-Secret-Token", ""), secret_token
+            ):
+                return web.Response(status=401)
+            await self.ingest([await request.json()])
+            return web.Response()
+        return handle
+
+    async def _worker(self):
+        """Воркер: захватывает и обрабатывает обновления, пока они есть"""
+        while not self._stopping:
+            # Сбрасываем до захвата: NOTIFY во время запроса разбудит воркер
+            self._wakeup.clear()
+            try:
+                update = await db.claim_update(self.lease_seconds, self.shard_count, self.shard_index)
+            except Exception as e:
+                logger.error(f"Ошибка захвата обновления: {e}")
+                await asyncio.sleep(self.poll_interval)
+                continue
+
+            if not update:
+                try:
+                    await asyncio.wait_for(self._wakeup.wait(), timeout=self.poll_interval)
+                except asyncio.TimeoutError:
+                    pass
+                continue
+
+            try:
+                await self._process(update)
+            except Exception as e:
+                logger.error(f"Ошибка обработки обновления {update['update_id']}: {e}")
+
+    async def _cleanup_loop(self):
+        """Периодически удалять окончательно не обработанные обновления старше failed_retention"""
+        while True:
+            try:
+                deleted = await db.delete_failed_updates(self.failed_retention)
+                if deleted:
+                    logger.info(f"Удалено необработанных обновлений: {deleted}")
+            except Exception as e:
+                logger.error(f"Ошибка очистки очереди обновлений: {e}")
+            await asyncio.sleep(self.cleanup_interval)
+
+    async def _process(self, update: Dict[str, Any]):
+        """Обработать обновление диспетчером. Повторяется только ошибка до запуска
+        обработчиков; ошибка обработчика записывается без повтора"""
+        update_id = update['update_id']
+        try:
+            parsed = Update.model_validate(update['payload'], context={"bot": self._bot})
+        except Exception as e:
+            if update['attempts'] >= self.max_attempts:
+                logger.error(f"Обновление {update_id} не обработано: {e}")
+                self._counters["failed"] += 1
+                await db.fail_update(update_id, str(e))
+            else:
+                delay = self.retry_delay * 2 ** (update['attempts'] - 1)
+                logger.warning(f"Обновление {update_id}: ошибка {e}, повтор через {delay:.0f} с")
+                self._counters["retried"] += 1
+                await db.retry_update(update_id, delay, str(e))
+            return
+
+        try:
+            await self._dp.feed_update(self._bot, parsed)
+        except Exception as e:
+            logger.exception(f"Ошибка обработчика обновления {update_id}: {e}")
+            self._counters["failed"] += 1
+            await db.fail_update(update_id, str(e))
+            return
+
+        self._counters["processed"] += 1
+        await db.complete_update(update_id)
+
+# Глобальная очередь обновлений
+update_queue = UpdateQueue(
+    workers=UPDATE_WORKERS,
+    max_attempts=UPDATE_MAX_ATTEMPTS,
+    retry_delay=UPDATE_RETRY_DELAY,
+    lease_seconds=UPDATE_LEASE_SECONDS,
+    poll_interval=UPDATE_POLL_INTERVAL,
+    failed_retention=UPDATE_FAILED_RETENTION,
+    cleanup_interval=UPDATE_CLEANUP_INTERVAL,
+    shard_index=WORKER_INDEX,
+    shard_count=WORKER_COUNT
+)